@@ -1,57 +1,51 @@
 import sys
 from flask import Flask, jsonify, render_template, send_from_directory
 import os
-import importlib.util
+
+# Make the shared helpers in backend/common importable from the tool modules
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from common.capabilities import get_capabilities
+from common.config import env_bool, env_int
+from common.image_cache import image_result_cache
+from common.jobs import register_job_routes
+from common.tool_registry import ToolRegistry
 
 # Configure Flask to serve static files and templates from the frontend directory
 app = Flask(__name__, static_folder='../frontend', template_folder='../templates')
+# Let a fronting web server (nginx/Apache) deliver downloaded files with X-Sendfile
+app.config['USE_X_SENDFILE'] = env_bool('USE_X_SENDFILE', False)
+# Reject oversized request bodies up front; accepted uploads are spooled to disk past 500 KB by Werkzeug
+app.config['MAX_CONTENT_LENGTH'] = env_int('MAX_UPLOAD_BYTES', 256 * 1024 * 1024)
+
+
+def request_too_large(error):
+    # JSON like the tools' other errors, so the frontends can show the message
+    limit_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    return jsonify({"error": f"Upload too large (limit {limit_mb} MB)."}), 413
+
+app.register_error_handler(413, request_too_large)
+
 
-# Dictionary to store registered tool instances
-registered_tools = {}
-
-def register_tool(tool_instance):
-    """Registers a tool instance with the Flask application."""
-    tool_info = tool_instance.get_info()
-    tool_id = tool_info['id']
-    if tool_id in registered_tools:
-        print(f"Warning: Tool with ID '{tool_id}' already registered. Skipping.")
-        return
-
-    registered_tools[tool_id] = tool_instance
-    tool_instance.register_routes(app)
-    print(f"Registered tool: {tool_info['name']} ({tool_id})")
-
-def load_tools_from_directory(tool_dir="backend/tools"):
-    """Loads tool modules from the specified directory and registers them."""
-    abs_tool_dir = os.path.join(os.path.dirname(__file__), tool_dir)
-    print(f"Loading tools from: {abs_tool_dir}")
-    for filename in os.listdir(abs_tool_dir):
-        if filename.endswith("_tool.py"):
-            module_name = filename[:-3] # Remove .py
-            file_path = os.path.join(abs_tool_dir, filename)
-
-            try:
-                spec = importlib.util.spec_from_file_location(module_name, file_path)
-                module = importlib.util.module_from_spec(spec)
-                sys.modules[module_name] = module
-                spec.loader.exec_module(module)
-
-                # Assuming each tool module has a class named like ToolNameTool
-                # Find the tool class (convention: ends with 'Tool')
-                for name, obj in module.__dict__.items():
-                    if isinstance(obj, type) and name.endswith('Tool'):
-                        tool_instance = obj()
-                        register_tool(tool_instance)
-                        break # Assume only one tool class per file
-                else:
-                    print(f"Warning: No tool class found in {filename}")
-
-            except Exception as e:
-                print(f"Error loading tool from {filename}: {e}")
-
-# Load tools when the application starts
+def create_tool_app(tool_id):
+    """Builds the Flask app a lazily loaded tool registers its routes on (same settings as the main app)."""
+    tool_app = Flask(__name__, static_folder=None)
+    tool_app.config.from_mapping(app.config)
+    tool_app.register_error_handler(413, request_too_large)
+    return tool_app
+
+
+# Tools are described by tools/manifest.json and imported on their first request,
+# so startup doesn't pay for yt-dlp, Pillow or pdf2image until a tool needs them
+tool_registry = ToolRegistry(os.path.join(BACKEND_DIR, 'tools'), create_tool_app)
 with app.app_context():
-    load_tools_from_directory(tool_dir="tools")
+    tool_registry.discover(app)
+app.wsgi_app = tool_registry.wsgi_middleware(app.wsgi_app)
+
+# Probe external binaries (ffmpeg, ffprobe, poppler) once at startup; tools read the cached result
+get_capabilities(force=True)
 
 
 @app.route('/')
@@ -101,12 +95,29 @@ def serve_tool_static(tool_id, filename):
 
 @app.route('/api/tools')
 def list_tools():
-    # Return the list of registered tools' info
-    return jsonify([tool.get_info() for tool in registered_tools.values()])
+    # Return the list of registered tools' info (from the manifest, without importing the tools)
+    return jsonify(tool_registry.infos())
+
+@app.route('/api/tools/status')
+def tools_status():
+    # Which lazily loaded tools have been imported in this process, and how long each took
+    return jsonify(tool_registry.status())
+
+@app.route('/api/capabilities')
+def list_capabilities():
+    # Return detected external binaries, their versions and ffmpeg codecs/encoders
+    return jsonify(get_capabilities())
+
+@app.route('/api/image-cache')
+def image_cache_stats():
+    # Result cache shared by the image tools: hits per tier, misses, hit rate and size
+    return jsonify(image_result_cache.stats())
 
-# TODO: Add a generic endpoint for tool execution, e.g., /api/tool/<tool_id>/execute
+# Every tool answers POST /api/tool/<tool_id>/execute; with async=true (or for long operations such
+# as downloads) it returns a job, which these endpoints report on, deliver and cancel
+register_job_routes(app)
 
 if __name__ == '__main__':
-    # Run the Flask development server
-    # In production, use a production-ready WSGI server like Gunicorn or uWSGI
-    app.run(debug=True)
\ No newline at end of file
+    # Run the Flask development server (FLASK_DEBUG=1 for the debugger and reloader)
+    # In production, use gunicorn with the repository's gunicorn.conf.py
+    app.run(debug=env_bool('FLASK_DEBUG', False), threaded=True)
\ No newline at end of file
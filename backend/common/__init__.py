@@ -0,0 +1 @@
+"""Shared helpers used by the backend tools (queues, caches, stores)."""
@@ -0,0 +1,242 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Iterable, List, Optional
+
+from common.child_processes import owner_alive, process_token
+
+# Job lifecycle: expanding -> running -> completed | cancelled (or error if nothing could be expanded)
+UNFINISHED_JOB_STATES = ('expanding', 'running')
+# Item lifecycle: pending -> running -> success | error
+FINISHED_ITEM_STATES = ('success', 'error')
+# Options only needed while a job runs (e.g. session cookies); removed once it is finished
+SECRET_OPTION_KEYS = ('cookies',)
+
+
+class BulkJobStore:
+    """
+    Bulk jobs (many URLs -> one result each) persisted in SQLite. Items finish in any
+    order; each finished item gets the next sequence number of its job, so a client can
+    read results as they arrive and resume after a disconnect from the last number it saw.
+    Jobs record the PID and process_token() of the process running them, so another
+    process (or the next start) can take over jobs whose owner died.
+    """
+
+    def __init__(self, db_path, ttl: float):
+        self.db_path = str(db_path)
+        self.ttl = ttl # Finished jobs and their results are deleted this long after their last update
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                options TEXT NOT NULL,
+                owner_pid INTEGER,
+                owner_token TEXT,
+                errors TEXT NOT NULL DEFAULT '[]',
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                job_id TEXT NOT NULL,
+                item_id INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                video_id TEXT NOT NULL,
+                title TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                result BLOB,
+                seq INTEGER,
+                PRIMARY KEY (job_id, item_id),
+                UNIQUE (job_id, video_id)
+            )
+        """)
+        # Databases created before owner_token existed
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(jobs)')]
+        if 'owner_token' not in columns:
+            conn.execute('ALTER TABLE jobs ADD COLUMN owner_token TEXT')
+        conn.execute('CREATE INDEX IF NOT EXISTS items_by_seq ON items (job_id, seq)')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    # --- Jobs --------------------------------------------------------------
+
+    def create(self, job_id: str, options: dict):
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO jobs (job_id, status, options, owner_pid, owner_token, created_at, updated_at) "
+            "VALUES (?, 'expanding', ?, ?, ?, ?, ?)",
+            (job_id, json.dumps(options), os.getpid(), process_token(), now, now)
+        )
+        self.prune()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """The job with its options, expansion errors and item counts per state."""
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['options'] = json.loads(job['options'])
+        job['errors'] = json.loads(job['errors'])
+        counts = dict(conn.execute(
+            "SELECT status, COUNT(*) FROM items WHERE job_id = ? GROUP BY status", (job_id,)
+        ).fetchall())
+        job['counts'] = counts
+        job['total'] = sum(counts.values())
+        job['finished'] = sum(counts.get(state, 0) for state in FINISHED_ITEM_STATES)
+        return job
+
+    def update(self, job_id: str, status: Optional[str] = None, errors: Optional[list] = None):
+        fields, values = ['updated_at = ?'], [time.time()]
+        if status is not None:
+            fields.append('status = ?')
+            values.append(status)
+        if errors is not None:
+            fields.append('errors = ?')
+            values.append(json.dumps(errors))
+        self._connect().execute(f"UPDATE jobs SET {', '.join(fields)} WHERE job_id = ?", (*values, job_id))
+        if status is not None and status not in UNFINISHED_JOB_STATES:
+            self._scrub_options(job_id)
+
+    def _scrub_options(self, job_id: str):
+        """Removes SECRET_OPTION_KEYS from a finished job's stored options."""
+        conn = self._connect()
+        row = conn.execute("SELECT options FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return
+        options = json.loads(row['options'])
+        if any(key in options for key in SECRET_OPTION_KEYS):
+            for key in SECRET_OPTION_KEYS:
+                options.pop(key, None)
+            conn.execute("UPDATE jobs SET options = ? WHERE job_id = ?", (json.dumps(options), job_id))
+
+    def claim_orphans(self, running_here: Iterable[str]) -> List[str]:
+        """
+        Takes over unfinished jobs whose owner process is gone, including owners whose PID
+        a live process has since been given, or that is this process but the job isn't
+        running here. Items that were
+        running are pending again. Returns the claimed job IDs.
+        """
+        conn = self._connect()
+        running_here = set(running_here)
+        claimed = []
+        rows = conn.execute(
+            f"SELECT job_id, owner_pid, owner_token FROM jobs WHERE status IN {UNFINISHED_JOB_STATES}"
+        ).fetchall()
+        for job_id, owner_pid, owner_token in rows:
+            if job_id in running_here:
+                continue
+            if owner_pid != os.getpid() and owner_alive(owner_pid, owner_token):
+                continue
+            # Compare-and-set, so only one of several processes takes the job
+            cursor = conn.execute(
+                "UPDATE jobs SET owner_pid = ?, owner_token = ?, updated_at = ? "
+                "WHERE job_id = ? AND owner_pid IS ? AND owner_token IS ?",
+                (os.getpid(), process_token(), time.time(), job_id, owner_pid, owner_token)
+            )
+            if cursor.rowcount == 1:
+                conn.execute("UPDATE items SET status = 'pending' WHERE job_id = ? AND status = 'running'", (job_id,))
+                claimed.append(job_id)
+        return claimed
+
+    def prune(self):
+        """Deletes finished jobs (and their results) older than the TTL and scrubs secrets left in finished ones."""
+        conn = self._connect()
+        cutoff = time.time() - self.ttl
+        old = [row[0] for row in conn.execute(
+            f"SELECT job_id FROM jobs WHERE status NOT IN {UNFINISHED_JOB_STATES} AND updated_at < ?", (cutoff,)
+        ).fetchall()]
+        for job_id in old:
+            conn.execute("DELETE FROM items WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+        # Jobs finished before options were scrubbed
+        for (job_id,) in conn.execute(
+            f"SELECT job_id FROM jobs WHERE status NOT IN {UNFINISHED_JOB_STATES} AND options LIKE '%\"cookies\"%'"
+        ).fetchall():
+            self._scrub_options(job_id)
+
+    # --- Items -------------------------------------------------------------
+
+    def add_item(self, job_id: str, url: str, video_id: str, title: Optional[str] = None) -> Optional[dict]:
+        """Adds a pending item; returns None if the job already has this video."""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            item_id = conn.execute(
+                "SELECT COALESCE(MAX(item_id), 0) + 1 FROM items WHERE job_id = ?", (job_id,)
+            ).fetchone()[0]
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO items (job_id, item_id, url, video_id, title, status) "
+                "VALUES (?, ?, ?, ?, ?, 'pending')",
+                (job_id, item_id, url, video_id, title)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if cursor.rowcount != 1:
+            return None
+        return {'job_id': job_id, 'item_id': item_id, 'url': url, 'video_id': video_id, 'title': title}
+
+    def pending_items(self, job_id: str) -> List[dict]:
+        rows = self._connect().execute(
+            "SELECT job_id, item_id, url, video_id, title FROM items "
+            "WHERE job_id = ? AND status = 'pending' ORDER BY item_id", (job_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def start_item(self, job_id: str, item_id: int):
+        self._connect().execute(
+            "UPDATE items SET status = 'running', attempts = attempts + 1 WHERE job_id = ? AND item_id = ?",
+            (job_id, item_id)
+        )
+
+    def finish_item(self, job_id: str, item_id: int, status: str, result: Optional[dict] = None,
+                    error: Optional[str] = None, attempts: Optional[int] = None):
+        """Stores an item's result (zlib-compressed JSON) and gives it the job's next sequence number."""
+        data = zlib.compress(json.dumps(result, ensure_ascii=False).encode('utf-8')) if result is not None else None
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                "UPDATE items SET status = ?, result = ?, error = ?, attempts = COALESCE(?, attempts), "
+                "seq = (SELECT COALESCE(MAX(seq), 0) + 1 FROM items WHERE job_id = ?) "
+                "WHERE job_id = ? AND item_id = ?",
+                (status, data, error, attempts, job_id, job_id, item_id)
+            )
+            conn.execute("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (time.time(), job_id))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def results_after(self, job_id: str, after: int, limit: int = 100) -> List[dict]:
+        """Finished items with a sequence number above `after`, in the order they finished."""
+        rows = self._connect().execute(
+            "SELECT * FROM items WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?", (job_id, after, limit)
+        ).fetchall()
+        results = []
+        for row in rows:
+            item = {k: row[k] for k in ('seq', 'item_id', 'url', 'video_id', 'title', 'status', 'attempts')}
+            if row['result'] is not None:
+                item.update(json.loads(zlib.decompress(row['result'])))
+            if row['error']:
+                item['error'] = row['error']
+            results.append(item)
+        return results
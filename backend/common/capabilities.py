@@ -0,0 +1,132 @@
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from typing import Optional
+
+from common.config import env_float
+
+# External binaries the tools rely on, with the arguments that print their version
+PROBED_BINARIES = {
+    'ffmpeg': ['-version'],
+    'ffprobe': ['-version'],
+    'pdftoppm': ['-v'], # Poppler, used by pdf2image
+    'pdfinfo': ['-v'], # Poppler, page counts for multi-page PDF rendering
+}
+# How often (seconds) to check whether PATH or the binaries changed
+RECHECK_INTERVAL = env_float('CAPABILITY_RECHECK_INTERVAL', 10)
+PROBE_TIMEOUT = 10
+
+_VERSION_RE = re.compile(r'version\s+(\S+)', re.IGNORECASE)
+
+_lock = threading.Lock() # Guards the cached result below; never held while probing
+_probe_lock = threading.Lock() # One probe at a time
+_capabilities = None # Last probe result
+_fingerprint = None # (PATH, ((name, path, mtime), ...)) the result was probed for
+_last_check = 0.0
+
+
+def _run(args) -> Optional[str]:
+    """Runs a probe command and returns its combined output, or None on failure."""
+    try:
+        result = subprocess.run(args, capture_output=True, text=True, timeout=PROBE_TIMEOUT)
+    except (subprocess.SubprocessError, OSError):
+        return None
+    return (result.stdout or '') + (result.stderr or '')
+
+
+def _parse_ffmpeg_list(output: str):
+    """Yields (flags, name) from ffmpeg -codecs/-encoders output (rows after the '---' line)."""
+    in_table = False
+    for line in output.splitlines():
+        if not in_table:
+            in_table = line.strip().startswith('---')
+            continue
+        parts = line.split(None, 2)
+        if len(parts) >= 2:
+            yield parts[0], parts[1]
+
+
+def _probe_ffmpeg_features(path: str) -> dict:
+    """Lists ffmpeg's encoders and codecs (with decode/encode support)."""
+    codec_types = {'V': 'video', 'A': 'audio', 'S': 'subtitle', 'D': 'data', 'T': 'attachment'}
+    encoders = [name for flags, name in _parse_ffmpeg_list(_run([path, '-hide_banner', '-encoders']) or '')
+                if flags[:1] in codec_types and name != '=']
+    codecs = {}
+    for flags, name in _parse_ffmpeg_list(_run([path, '-hide_banner', '-codecs']) or ''):
+        # Flags look like 'DEV.LS': decode, encode, type, ...
+        if len(flags) >= 3 and flags[2] in codec_types and name != '=':
+            codecs[name] = {
+                'type': codec_types[flags[2]],
+                'decode': flags[0] == 'D',
+                'encode': flags[1] == 'E',
+            }
+    return {'encoders': encoders, 'codecs': codecs}
+
+
+def _compute_fingerprint():
+    entries = []
+    for name in PROBED_BINARIES:
+        path = shutil.which(name)
+        try:
+            mtime = os.stat(path).st_mtime if path else None
+        except OSError:
+            mtime = None
+        entries.append((name, path, mtime))
+    return os.environ.get('PATH', ''), tuple(entries)
+
+
+def _probe(fingerprint) -> dict:
+    """Runs the (slow) subprocess probes for every binary in the fingerprint."""
+    result = {'probed_at': time.time(), 'binaries': {}}
+    for name, path, _mtime in fingerprint[1]:
+        info = {'installed': False, 'path': path, 'version': None}
+        if path:
+            output = _run([path] + PROBED_BINARIES[name])
+            if output is not None:
+                info['installed'] = True
+                match = _VERSION_RE.search(output)
+                info['version'] = match.group(1) if match else None
+                if name == 'ffmpeg':
+                    info.update(_probe_ffmpeg_features(path))
+        result['binaries'][name] = info
+    return result
+
+
+def get_capabilities(force: bool = False) -> dict:
+    """
+    Returns the cached capability probe result. The probe is re-run only when
+    forced or when PATH or a binary's location/mtime changed since the last probe.
+    The probe runs outside _lock: meanwhile other callers get the previous result
+    (or, before the first probe finishes, wait for it).
+    """
+    global _capabilities, _fingerprint, _last_check
+    with _lock:
+        now = time.monotonic()
+        if not force and _capabilities is not None and now - _last_check < RECHECK_INTERVAL:
+            return _capabilities
+        _last_check = now
+        current, current_fingerprint = _capabilities, _fingerprint
+    fingerprint = _compute_fingerprint()
+    if not force and current is not None and fingerprint == current_fingerprint:
+        return current
+
+    with _probe_lock:
+        if not force:
+            with _lock:
+                if _capabilities is not None and _fingerprint == fingerprint:
+                    return _capabilities # Probed by another caller while we waited
+        result = _probe(fingerprint)
+        with _lock:
+            _capabilities, _fingerprint = result, fingerprint
+    installed = [name for name, info in result['binaries'].items() if info['installed']]
+    print(f"Capability probe: installed binaries = {installed}")
+    return result
+
+
+def has_binary(name: str) -> bool:
+    """True if the named external binary (e.g. 'ffmpeg') was found by the last probe."""
+    info = get_capabilities()['binaries'].get(name)
+    return bool(info and info['installed'])
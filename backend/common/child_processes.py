@@ -0,0 +1,121 @@
+import os
+import signal
+import time
+from typing import Optional
+
+PROC_DIR = '/proc'
+
+
+def pid_alive(pid: Optional[int]) -> bool:
+    """Returns True if a process with the given PID is still running."""
+    if not pid:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        # Process exists but belongs to someone else (or we can't tell)
+        return True
+    return True
+
+
+def process_token(pid: Optional[int] = None) -> Optional[str]:
+    """
+    '<boot id>:<start time>' of a process (default: this one). Unlike the PID it isn't
+    reused, e.g. by a container restart. None where /proc isn't available.
+    """
+    pid = pid or os.getpid()
+    try:
+        with open(os.path.join(PROC_DIR, 'sys', 'kernel', 'random', 'boot_id'), encoding='utf-8') as f:
+            boot_id = f.read().strip()
+        with open(os.path.join(PROC_DIR, str(pid), 'stat'), encoding='utf-8', errors='replace') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # starttime is field 22; fields after the command name start at field 3
+    return f"{boot_id}:{stat[stat.rfind(')') + 2:].split()[19]}"
+
+
+def owner_alive(pid: Optional[int], token: Optional[str]) -> bool:
+    """
+    pid_alive() for a recorded owner, which must also still have the process_token()
+    stored with it; otherwise the PID now belongs to a different process. Owners
+    recorded without a token (or unreadable ones) are checked by PID only.
+    """
+    if not pid_alive(pid):
+        return False
+    if token is None:
+        return True
+    current = process_token(pid)
+    return current is None or current == token
+
+
+def _read_stat(pid: int):
+    """Returns (state, ppid) from /proc/<pid>/stat, or None if the process is gone."""
+    try:
+        with open(os.path.join(PROC_DIR, str(pid), 'stat'), encoding='utf-8', errors='replace') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name is in parentheses and may itself contain spaces or ')'
+    fields = stat[stat.rfind(')') + 2:].split()
+    return fields[0], int(fields[1])
+
+
+def _read_cmdline(pid: int) -> str:
+    try:
+        with open(os.path.join(PROC_DIR, str(pid), 'cmdline'), 'rb') as f:
+            return f.read().replace(b'\0', b' ').decode('utf-8', errors='replace')
+    except OSError:
+        return ''
+
+
+def find_child_processes(marker: str) -> list:
+    """
+    PIDs of running descendants of this process whose command line contains marker
+    (e.g. a download's temp directory). Needs /proc; returns [] where it doesn't exist.
+    """
+    if not os.path.isdir(PROC_DIR):
+        return []
+    parents = {}
+    for name in os.listdir(PROC_DIR):
+        if name.isdigit():
+            stat = _read_stat(int(name))
+            if stat is not None and stat[0] != 'Z':
+                parents[int(name)] = stat[1]
+
+    descendants = set()
+    frontier = {os.getpid()}
+    while frontier:
+        frontier = {pid for pid, ppid in parents.items() if ppid in frontier and pid not in descendants}
+        descendants |= frontier
+    return sorted(pid for pid in descendants if marker in _read_cmdline(pid))
+
+
+def _is_running(pid: int) -> bool:
+    stat = _read_stat(pid)
+    return stat is not None and stat[0] != 'Z' # Zombies are already dead, just not reaped yet
+
+
+def terminate_children(marker: str, grace: float = 2.0) -> int:
+    """Sends SIGTERM to matching child processes, then SIGKILL to those still running after grace seconds."""
+    pids = find_child_processes(marker)
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+    deadline = time.monotonic() + grace
+    remaining = list(pids)
+    while remaining and time.monotonic() < deadline:
+        time.sleep(0.1)
+        remaining = [pid for pid in remaining if _is_running(pid)]
+    for pid in remaining:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+    return len(pids)
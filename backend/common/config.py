@@ -0,0 +1,36 @@
+import os
+from pathlib import Path
+
+# Directory for persistent local state (job queues, caches, indexes).
+# Defaults to <repo>/state so it does not depend on the working directory.
+STATE_DIR = Path(os.environ.get(
+    'LOCAL_TOOLS_STATE_DIR',
+    Path(__file__).resolve().parent.parent.parent / 'state'
+))
+STATE_DIR.mkdir(parents=True, exist_ok=True)
+
+
+def env_int(name: str, default: int) -> int:
+    """Reads an integer setting from the environment, falling back to default."""
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        print(f"Warning: Invalid integer for {name}, using default {default}")
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    """Reads a float setting from the environment, falling back to default."""
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        print(f"Warning: Invalid number for {name}, using default {default}")
+        return default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    """Reads a boolean setting ('1', 'true', 'yes', 'on') from the environment."""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
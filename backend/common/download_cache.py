@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+
+def make_cache_key(video_id: str, format_selector: str, postprocessor_settings) -> str:
+    """Content key for a download: the same video, format and postprocessing give the same file."""
+    material = json.dumps([video_id, format_selector, postprocessor_settings], sort_keys=True)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class DownloadCache:
+    """
+    Finished downloads stored by content key in one directory, indexed in SQLite.
+    The directory is kept under max_bytes by evicting the least recently used files.
+    Hit/miss/coalesced counters live in the database so every worker process sees them.
+    """
+
+    def __init__(self, cache_dir, db_path, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = str(db_path)
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                video_id TEXT,
+                title TEXT,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str):
+        self._connect().execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,)
+        )
+
+    def record_coalesced(self):
+        """Counts a request that joined a download already in flight."""
+        self._count('coalesced')
+
+    def lookup(self, key: str) -> Optional[dict]:
+        """Returns the cached entry (path, title, size, ...) and marks it used, or None on a miss."""
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is not None and not os.path.exists(row['path']):
+            # File removed behind our back, forget it
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            row = None
+        if row is None:
+            self._count('misses')
+            return None
+        conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._count('hits')
+        return dict(row)
+
+    def store(self, key: str, source_path, video_id: str, title: str) -> Path:
+        """Moves a finished file into the cache under its key and enforces the quota."""
+        source_path = Path(source_path)
+        target = self.cache_dir / f"{key}{source_path.suffix}"
+        shutil.move(str(source_path), str(target)) # Works across filesystems (temp dir -> cache)
+        now = time.time()
+        self._connect().execute(
+            "INSERT OR REPLACE INTO entries (key, path, video_id, title, size, created_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, str(target), video_id, title, target.stat().st_size, now, now)
+        )
+        self.evict(keep=key)
+        return target
+
+    def evict(self, keep: Optional[str] = None):
+        """Deletes least recently used files until the cache fits in max_bytes."""
+        conn = self._connect()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute("SELECT key, path, size FROM entries ORDER BY last_access ASC").fetchall()
+        for row in rows:
+            if total <= self.max_bytes:
+                break
+            if row['key'] == keep:
+                continue
+            try:
+                os.remove(row['path']) # Open handles (files being served) stay readable on POSIX
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Download cache: could not evict {row['path']}: {e}")
+                continue
+            conn.execute("DELETE FROM entries WHERE key = ?", (row['key'],))
+            total -= row['size']
+            print(f"Download cache: evicted {row['path']} ({row['size']} bytes)")
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        hits = counters.get('hits', 0)
+        misses = counters.get('misses', 0)
+        return {
+            'entries': entries,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'hits': hits,
+            'misses': misses,
+            'coalesced': counters.get('coalesced', 0),
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+        }
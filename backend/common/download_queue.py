@@ -0,0 +1,300 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Optional, Tuple
+
+from common.child_processes import owner_alive, process_token
+
+# Job lifecycle: queued -> running -> completed | error | cancelled
+ACTIVE_STATES = ('queued', 'running')
+FINISHED_STATES = ('completed', 'error', 'cancelled')
+# Payload fields only a running job needs (e.g. session cookies); removed once the job is finished
+SECRET_PAYLOAD_KEYS = ('cookies',)
+PRUNE_INTERVAL = 600 # Seconds between deletions of finished jobs past finished_ttl
+
+
+class DownloadQueue:
+    """Priority/FIFO job queue persisted in SQLite and drained by a fixed worker pool.
+
+    Jobs are claimed from the database, so queued or interrupted jobs survive a
+    restart and several processes can share one queue without running a job twice.
+    worker_count caps running jobs across all those processes, not per process.
+    Higher priority runs first; equal priorities run in submission order.
+    """
+
+    def __init__(self, db_path, runner: Callable[[dict], Tuple[str, Optional[str]]],
+                 worker_count: int = 2, poll_interval: float = 1.0,
+                 finished_ttl: float = 24 * 3600):
+        self.db_path = str(db_path)
+        self.runner = runner # Called with the job dict, returns (final_state, error)
+        self.worker_count = max(1, int(worker_count))
+        self.poll_interval = poll_interval
+        self.finished_ttl = finished_ttl
+        self._wakeup = threading.Condition()
+        self._start_lock = threading.Lock()
+        self._local = threading.local()
+        self._workers = []
+        self._last_prune = 0.0
+        self._prune_lock = threading.Lock()
+        self._init_db()
+
+    # --- Storage -----------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        """Returns this thread's SQLite connection (autocommit, WAL mode)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT UNIQUE NOT NULL,
+                video_id TEXT NOT NULL,
+                dedupe_key TEXT,
+                payload TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                state TEXT NOT NULL,
+                owner_pid INTEGER,
+                owner_token TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+        """)
+        # Databases created before dedupe_key/owner_token existed
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(jobs)')]
+        if 'dedupe_key' not in columns:
+            conn.execute('ALTER TABLE jobs ADD COLUMN dedupe_key TEXT')
+        if 'owner_token' not in columns:
+            conn.execute('ALTER TABLE jobs ADD COLUMN owner_token TEXT')
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (state, priority DESC, seq)')
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_by_video ON jobs (video_id, state)')
+
+    @staticmethod
+    def _row_to_job(row) -> Optional[dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        return job
+
+    # --- Public API --------------------------------------------------------
+
+    def start(self):
+        """Recovers interrupted jobs and starts the worker threads (idempotent)."""
+        with self._start_lock:
+            if self._workers:
+                return
+            self._recover()
+            for i in range(self.worker_count):
+                worker = threading.Thread(target=self._worker_loop, name=f"download-worker-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+            print(f"Download queue started with {self.worker_count} worker(s): {self.db_path}")
+
+    def submit(self, video_id: str, payload: dict, priority: int = 0,
+               dedupe_key: Optional[str] = None) -> Tuple[dict, bool]:
+        """
+        Queues a job. Returns (job, created); an active job for the same video is
+        reused instead (check its dedupe_key to see whether it produces the same output).
+        """
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            existing = conn.execute(
+                f"SELECT * FROM jobs WHERE video_id = ? AND state IN {ACTIVE_STATES} ORDER BY seq LIMIT 1",
+                (video_id,)
+            ).fetchone()
+            if existing is not None:
+                conn.execute('COMMIT')
+                return self._row_to_job(existing), False
+
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (job_id, video_id, dedupe_key, payload, priority, state, created_at) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+                (job_id, video_id, dedupe_key, json.dumps(payload), int(priority), time.time())
+            )
+            job = self._row_to_job(conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone())
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        with self._wakeup:
+            self._wakeup.notify()
+        return job, True
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        row = self._connect().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row)
+
+    def get_active_job(self, video_id: str) -> Optional[dict]:
+        """Returns the queued or running job for a video, if any."""
+        row = self._connect().execute(
+            f"SELECT * FROM jobs WHERE video_id = ? AND state IN {ACTIVE_STATES} ORDER BY seq LIMIT 1",
+            (video_id,)
+        ).fetchone()
+        return self._row_to_job(row)
+
+    def cancel_queued(self, job_id: str, reason: Optional[str] = None) -> bool:
+        """Cancels a job that no worker has claimed yet. Returns False if it is already running or finished."""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET state = 'cancelled', error = ?, finished_at = ? WHERE job_id = ? AND state = 'queued'",
+            (reason, time.time(), job_id)
+        )
+        if cursor.rowcount != 1:
+            return False
+        self._scrub_payload(job_id)
+        return True
+
+    def position(self, video_id: str) -> Optional[int]:
+        """Queue position of a video's job: 0 while running, 1..n while queued, None otherwise."""
+        job = self.get_active_job(video_id)
+        if job is None:
+            return None
+        if job['state'] == 'running':
+            return 0
+        ahead = self._connect().execute(
+            "SELECT COUNT(*) FROM jobs WHERE state = 'queued' AND (priority > ? OR (priority = ? AND seq < ?))",
+            (job['priority'], job['priority'], job['seq'])
+        ).fetchone()[0]
+        return ahead + 1
+
+    def stats(self) -> dict:
+        """Returns job counts per state plus the configured worker count."""
+        rows = self._connect().execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        counts = {state: count for state, count in rows}
+        counts['workers'] = self.worker_count
+        return counts
+
+    # --- Workers -----------------------------------------------------------
+
+    def _scrub_payload(self, job_id: str):
+        """Removes SECRET_PAYLOAD_KEYS from a finished job's stored payload."""
+        conn = self._connect()
+        row = conn.execute("SELECT payload FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return
+        payload = json.loads(row['payload'])
+        if any(key in payload for key in SECRET_PAYLOAD_KEYS):
+            for key in SECRET_PAYLOAD_KEYS:
+                payload.pop(key, None)
+            conn.execute("UPDATE jobs SET payload = ? WHERE job_id = ?", (json.dumps(payload), job_id))
+
+    def prune(self):
+        """Deletes finished jobs older than finished_ttl and scrubs secrets left in finished ones."""
+        conn = self._connect()
+        conn.execute(
+            f"DELETE FROM jobs WHERE state IN {FINISHED_STATES} AND finished_at < ?",
+            (time.time() - self.finished_ttl,)
+        )
+        # Jobs finished before payloads were scrubbed
+        rows = conn.execute(
+            f"SELECT job_id FROM jobs WHERE state IN {FINISHED_STATES} AND payload LIKE '%\"cookies\"%'"
+        ).fetchall()
+        for (job_id,) in rows:
+            self._scrub_payload(job_id)
+
+    def _maybe_prune(self):
+        """Runs prune() at most every PRUNE_INTERVAL seconds, from whichever worker gets here first."""
+        if time.monotonic() - self._last_prune < PRUNE_INTERVAL or not self._prune_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_prune = time.monotonic()
+            self.prune()
+        except sqlite3.Error as e:
+            print(f"Download queue error while pruning finished jobs: {e}")
+        finally:
+            self._prune_lock.release()
+
+    def _recover(self):
+        """Requeues jobs left 'running' by a dead process and prunes old finished jobs."""
+        conn = self._connect()
+        rows = conn.execute("SELECT job_id, owner_pid, owner_token FROM jobs WHERE state = 'running'").fetchall()
+        for job_id, owner_pid, owner_token in rows:
+            # The token catches a dead owner whose PID a live process (e.g. a sibling worker) now has
+            if owner_pid == os.getpid() or not owner_alive(owner_pid, owner_token):
+                conn.execute(
+                    "UPDATE jobs SET state = 'queued', owner_pid = NULL, owner_token = NULL, started_at = NULL "
+                    "WHERE job_id = ?",
+                    (job_id,)
+                )
+                print(f"Requeued interrupted download job {job_id}")
+        self.prune()
+        self._last_prune = time.monotonic()
+
+    def _claim_next(self) -> Optional[dict]:
+        """Atomically moves the next queued job to 'running' and returns it."""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Every server process runs worker_count threads; keep the total at worker_count.
+            # Jobs of a dead process don't hold a slot, they are requeued by the next start().
+            owners = conn.execute("SELECT owner_pid, owner_token FROM jobs WHERE state = 'running'").fetchall()
+            if sum(1 for owner in owners if owner_alive(*owner)) >= self.worker_count:
+                conn.execute('COMMIT')
+                return None
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE state = 'queued' ORDER BY priority DESC, seq LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            conn.execute(
+                "UPDATE jobs SET state = 'running', owner_pid = ?, owner_token = ?, started_at = ? WHERE job_id = ?",
+                (os.getpid(), process_token(), time.time(), row['job_id'])
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        job = self._row_to_job(row)
+        job['state'] = 'running'
+        return job
+
+    def _finish(self, job_id: str, state: str, error: Optional[str]):
+        self._connect().execute(
+            "UPDATE jobs SET state = ?, error = ?, finished_at = ? WHERE job_id = ?",
+            (state, error, time.time(), job_id)
+        )
+        self._scrub_payload(job_id)
+
+    def _worker_loop(self):
+        while True:
+            self._maybe_prune()
+            try:
+                job = self._claim_next()
+            except sqlite3.Error as e:
+                print(f"Download queue error while claiming a job: {e}")
+                job = None
+
+            if job is None:
+                # Sleep until a local submit wakes us, or poll for jobs queued by other processes
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+
+            state, error = 'error', None
+            try:
+                state, error = self.runner(job)
+            except Exception as e:
+                error = str(e)
+                print(f"Download job {job['job_id']} crashed: {error}")
+            if state not in FINISHED_STATES:
+                state = 'error'
+            try:
+                self._finish(job['job_id'], state, error)
+            except sqlite3.Error as e:
+                print(f"Download queue error while finishing job {job['job_id']}: {e}")
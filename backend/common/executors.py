@@ -0,0 +1,127 @@
+import functools
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from common.config import env_int
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOOLS_DIR = os.path.join(BACKEND_DIR, 'tools')
+
+# Web server processes sharing this machine (gunicorn.conf.py exports its worker count); CPU defaults are split between them
+WEB_WORKERS = max(1, env_int('WEB_CONCURRENCY', 1))
+_CPU_SHARE = max(1, (os.cpu_count() or 1) // WEB_WORKERS)
+
+# Worker processes for CPU-bound work (Pillow encoding); defaults to this process's share of the cores
+CPU_WORKERS = env_int('CPU_WORKERS', _CPU_SHARE)
+
+# Image requests encoding at once in this process; the server's other threads stay free for I/O-bound routes
+CPU_REQUEST_SLOTS = env_int('CPU_REQUEST_SLOTS', _CPU_SHARE)
+
+# Threads for I/O-bound background work started by requests (e.g. playlist expansion)
+IO_THREADS = env_int('IO_THREADS', 16)
+
+# Threads fetching remote resources for bulk requests (e.g. transcripts), shared by all such jobs
+FETCH_THREADS = env_int('FETCH_THREADS', 8)
+
+# Threads for encoder trials; Pillow's encoders release the GIL, so these run in parallel
+ENCODER_THREADS = env_int('ENCODER_THREADS', min(4, os.cpu_count() or 1))
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+_encoder_pool = None
+_encoder_pool_lock = threading.Lock()
+_io_pool = None
+_io_pool_lock = threading.Lock()
+_fetch_pool = None
+_fetch_pool_lock = threading.Lock()
+_cpu_request_slots = threading.BoundedSemaphore(max(1, CPU_REQUEST_SLOTS))
+
+
+def _init_worker(*paths: str):
+    """
+    Runs in each worker process. Tool modules are loaded by file path under their
+    bare module name (e.g. 'image_resizer_tool') and import 'common.*', so make both
+    importable for start methods that don't fork the parent's modules (spawn/forkserver).
+    """
+    for path in paths:
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Returns the shared process pool, creating it on first use."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=max(1, CPU_WORKERS),
+                initializer=_init_worker,
+                initargs=(BACKEND_DIR, TOOLS_DIR)
+            )
+            print(f"Started CPU process pool with {max(1, CPU_WORKERS)} worker(s)")
+        return _process_pool
+
+
+def get_encoder_pool() -> ThreadPoolExecutor:
+    """Returns this process's encoder thread pool, creating it on first use."""
+    global _encoder_pool
+    with _encoder_pool_lock:
+        if _encoder_pool is None:
+            _encoder_pool = ThreadPoolExecutor(max_workers=max(1, ENCODER_THREADS), thread_name_prefix='encoder')
+        return _encoder_pool
+
+
+def get_io_pool() -> ThreadPoolExecutor:
+    """Returns this process's I/O thread pool, creating it on first use."""
+    global _io_pool
+    with _io_pool_lock:
+        if _io_pool is None:
+            _io_pool = ThreadPoolExecutor(max_workers=max(1, IO_THREADS), thread_name_prefix='io')
+        return _io_pool
+
+
+def get_fetch_pool() -> ThreadPoolExecutor:
+    """Returns this process's fetch thread pool, creating it on first use."""
+    global _fetch_pool
+    with _fetch_pool_lock:
+        if _fetch_pool is None:
+            _fetch_pool = ThreadPoolExecutor(max_workers=max(1, FETCH_THREADS), thread_name_prefix='fetch')
+        return _fetch_pool
+
+
+def cpu_bound(view):
+    """
+    Decorator for views that decode/encode inline: at most CPU_REQUEST_SLOTS of them run at once,
+    further ones wait, so image uploads can't occupy every server thread.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with _cpu_request_slots:
+            return view(*args, **kwargs)
+    return wrapper
+
+
+def cpu_slot():
+    """
+    One of the CPU_REQUEST_SLOTS, as a context manager, for CPU work a streamed response
+    does after its @cpu_bound view has returned. Never take it inside a @cpu_bound view.
+    """
+    return _cpu_request_slots
+
+
+def shutdown_pools():
+    """Stops the pools without waiting for queued work (worker shutdown)."""
+    global _process_pool, _encoder_pool, _io_pool, _fetch_pool
+    with _process_pool_lock:
+        pools, _process_pool = [_process_pool], None
+    with _encoder_pool_lock:
+        pools, _encoder_pool = pools + [_encoder_pool], None
+    with _io_pool_lock:
+        pools, _io_pool = pools + [_io_pool], None
+    with _fetch_pool_lock:
+        pools, _fetch_pool = pools + [_fetch_pool], None
+    for pool in pools:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,153 @@
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from common.config import env_float, env_int
+
+# Seconds to wait for a connection, and between bytes of a response; a stalled server fails instead of hanging a thread
+HTTP_CONNECT_TIMEOUT = env_float('HTTP_CONNECT_TIMEOUT', 5)
+HTTP_READ_TIMEOUT = env_float('HTTP_READ_TIMEOUT', 30)
+# Retries for connection errors and 429/5xx responses (Retry-After is honoured), with jittered exponential backoff
+HTTP_RETRIES = env_int('HTTP_RETRIES', 3)
+HTTP_BACKOFF = env_float('HTTP_BACKOFF', 0.5)
+# Requests in flight to one host at once, and idle keep-alive connections kept per host
+HTTP_MAX_PER_HOST = env_int('HTTP_MAX_PER_HOST', 8)
+HTTP_POOL_SIZE = env_int('HTTP_POOL_SIZE', 16)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+LATENCY_SAMPLES = 500 # Recent requests per host the latency percentiles are computed from
+
+
+class JitteredRetry(Retry):
+    """Retry whose exponential backoff is randomised (50-100% of the delay), so clients don't retry in lockstep."""
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        return backoff * random.uniform(0.5, 1.0)
+
+
+class HttpClient:
+    """
+    Outbound HTTP for server-side fetches (subtitles, thumbnails, ...). One requests.Session
+    with a keep-alive connection pool per host, default connect/read timeouts, retries on
+    connection errors and 429/5xx, and at most max_per_host requests to a host at once.
+    A host's slot is held until the response body has been read (unless stream=True).
+    """
+
+    def __init__(self, connect_timeout: float, read_timeout: float, retries: int, backoff: float,
+                 max_per_host: int, pool_size: int):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_per_host = max(1, max_per_host)
+        retry = JitteredRetry(
+            total=retries, connect=retries, read=retries, status=retries,
+            backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+            allowed_methods=('GET', 'HEAD', 'OPTIONS'),
+            respect_retry_after_header=True,
+            raise_on_status=False, # The last response is returned; callers check its status as usual
+        )
+        self._adapter = HTTPAdapter(pool_connections=32, pool_maxsize=max(1, pool_size), max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', self._adapter)
+        self.session.mount('http://', self._adapter)
+        self._lock = threading.Lock()
+        self._slots = {} # host -> BoundedSemaphore
+        self._hosts = {} # host -> counters and recent latencies
+
+    def _host_slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            slot = self._slots.get(host)
+            if slot is None:
+                slot = self._slots[host] = threading.BoundedSemaphore(self.max_per_host)
+                self._hosts[host] = {'requests': 0, 'errors': 0, 'retries': 0, 'waits': 0,
+                                     'latencies': deque(maxlen=LATENCY_SAMPLES)}
+            return slot
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Like requests.request, through the shared session; raises requests.RequestException on failure."""
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlsplit(url).hostname or url
+        slot = self._host_slot(host)
+        waited = not slot.acquire(blocking=False)
+        if waited:
+            slot.acquire()
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self._record(host, waited, time.perf_counter() - started, error=True)
+            raise
+        finally:
+            slot.release()
+        retries = getattr(response.raw, 'retries', None)
+        self._record(host, waited, time.perf_counter() - started,
+                     retries=len(retries.history) if retries is not None else 0)
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def _record(self, host: str, waited: bool, seconds: float, error: bool = False, retries: int = 0):
+        with self._lock:
+            entry = self._hosts[host]
+            entry['requests'] += 1
+            entry['errors'] += error
+            entry['retries'] += retries
+            entry['waits'] += waited
+            entry['latencies'].append(seconds)
+
+    def _pool_counts(self) -> dict:
+        """host -> (connections opened, requests sent) from urllib3's connection pools that are still open."""
+        counts = {}
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                opened, sent = counts.get(key.key_host, (0, 0))
+                counts[key.key_host] = (opened + pool.num_connections, sent + pool.num_requests)
+        return counts
+
+    def stats(self) -> dict:
+        hosts = {}
+        pool_counts = self._pool_counts()
+        with self._lock:
+            for host, entry in self._hosts.items():
+                latencies = sorted(entry['latencies'])
+                opened, sent = pool_counts.get(host, (0, 0))
+                hosts[host] = {
+                    'requests': entry['requests'],
+                    'errors': entry['errors'],
+                    'retries': entry['retries'],
+                    'waited_for_slot': entry['waits'],
+                    'connections_opened': opened,
+                    'connection_reuse': round(1 - opened / sent, 3) if sent else None,
+                    'latency_p50_ms': round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+                    'latency_p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else None,
+                    'latency_max_ms': round(latencies[-1] * 1000, 1) if latencies else None,
+                }
+        return {
+            'connect_timeout': self.timeout[0],
+            'read_timeout': self.timeout[1],
+            'max_per_host': self.max_per_host,
+            'requests': sum(h['requests'] for h in hosts.values()),
+            'hosts': hosts,
+        }
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """Returns this process's shared HTTP client, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_RETRIES, HTTP_BACKOFF,
+                                 HTTP_MAX_PER_HOST, HTTP_POOL_SIZE)
+        return _client
@@ -0,0 +1,293 @@
+import json
+import mimetypes
+import os
+import shutil
+import time
+import uuid
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+from io import BytesIO
+
+from flask import Response, jsonify, request, stream_with_context
+
+from common.config import env_int
+from common.executors import CPU_WORKERS, get_process_pool
+from common.image_cache import lookup_result, result_key, store_result
+from common.jobs import JOB_RESULT_DIR, completed_job, submit_job
+from common.zip_stream import stream_zip
+
+# Files submitted to the pool ahead of the ones being encoded; bounds memory for big batches
+BATCH_WINDOW = max(2, CPU_WORKERS * 2)
+# Uploaded ZIPs are only capped compressed (MAX_UPLOAD_BYTES); limit what they may expand to
+ZIP_MEMBER_MAX_BYTES = env_int('ZIP_MEMBER_MAX_BYTES', 64 * 1024 * 1024)
+ZIP_TOTAL_MAX_BYTES = env_int('ZIP_TOTAL_MAX_BYTES', 1024 * 1024 * 1024)
+
+
+def _run_batch_item(logic_fn, filename, file_content, params):
+    """
+    Runs in a worker process: applies one tool's bytes-based logic function and
+    returns a picklable result with sizes and timing.
+    """
+    started = time.perf_counter()
+    result = logic_fn(filename, file_content, **params)
+    output_buffer, output_filename, original_size, processed_size, error = result[:5]
+    item = {
+        'name': filename,
+        'output_name': output_filename,
+        'original_size': original_size,
+        'processed_size': processed_size,
+        'seconds': round(time.perf_counter() - started, 4),
+        'error': error,
+        'data': _drain(output_buffer),
+    }
+    if len(result) > 5 and result[5]:
+        item['details'] = result[5] # Optional sixth value: tool-specific parameters chosen for this file
+    return item
+
+
+def run_image_job(logic_fn, filename, input_path, params):
+    """
+    Runs in a worker process for an async /execute request: one image, read from the
+    spooled upload at input_path. The result is written next to it and returned by path.
+    """
+    try:
+        with open(input_path, 'rb') as source:
+            item = _run_batch_item(logic_fn, filename, source, params)
+    finally:
+        os.remove(input_path)
+    if item['error']:
+        shutil.rmtree(os.path.dirname(input_path), ignore_errors=True)
+        return {'error': item['error']}
+    output_path = os.path.join(os.path.dirname(input_path), os.path.basename(item['output_name']))
+    with open(output_path, 'wb') as f:
+        f.write(item['data'])
+    return {
+        'path': output_path,
+        'filename': item['output_name'],
+        'mimetype': mimetypes.guess_type(item['output_name'])[0],
+        'original_size': item['original_size'],
+        'processed_size': item['processed_size'],
+        'details': item.get('details'),
+        'has_details': 'details' in item,
+    }
+
+
+def submit_image_job(tool_id, logic_fn, file_storage, params, headers_fn=None):
+    """
+    Queues one uploaded image for logic_fn on the process pool and returns the job entry.
+    Goes through the result cache like the synchronous path: a hit is returned as an already
+    completed job, a miss is spooled to disk for the worker and its result is cached.
+    headers_fn(details) may add tool-specific response headers (as the synchronous path does).
+    """
+    filename = file_storage.filename
+    key = result_key(logic_fn, filename, file_storage.stream, params)
+
+    def job_headers(original_size, processed_size, details, hit):
+        headers = {'X-Original-Size': str(original_size), 'X-Processed-Size': str(processed_size),
+                   'X-Cache': 'HIT' if hit else 'MISS', 'ETag': f'"{key}"'}
+        if headers_fn is not None and details is not None:
+            headers.update(headers_fn(details))
+        return headers
+
+    cached = lookup_result(key, filename)
+    if cached is not None:
+        output_buffer, output_filename, original_size, processed_size = cached[:4]
+        details = cached[5] if len(cached) > 5 else None
+        return completed_job(tool_id, 'cpu', {
+            'buffer': output_buffer,
+            'filename': output_filename,
+            'mimetype': mimetypes.guess_type(output_filename)[0],
+            'headers': job_headers(original_size, processed_size, details, hit=True),
+            'details': details,
+        })
+
+    def on_output(output):
+        if output.get('error'):
+            return output
+        result = (open(output['path'], 'rb'), output['filename'], output['original_size'], output['processed_size'], None)
+        if output['has_details']:
+            result += (output['details'],)
+        with result[0]:
+            store_result(key, filename, result)
+        output['headers'] = job_headers(output['original_size'], output['processed_size'], output['details'], hit=False)
+        return output
+
+    # Spool the upload to disk instead of pickling it to the worker
+    spool_dir = JOB_RESULT_DIR / uuid.uuid4().hex
+    spool_dir.mkdir(parents=True, exist_ok=True)
+    input_path = spool_dir / f"upload{os.path.splitext(filename)[1]}"
+    file_storage.stream.seek(0)
+    with open(input_path, 'wb') as f:
+        shutil.copyfileobj(file_storage.stream, f)
+    return submit_job(tool_id, 'cpu', run_image_job, logic_fn, filename, str(input_path), params, on_output=on_output)
+
+
+def _cached_item(key, filename):
+    """Builds a batch item from the result cache, or returns None on a miss."""
+    result = lookup_result(key, filename)
+    if result is None:
+        return None
+    output_buffer, output_filename, original_size, processed_size = result[:4]
+    item = {
+        'name': filename,
+        'output_name': output_filename,
+        'original_size': original_size,
+        'processed_size': processed_size,
+        'seconds': 0,
+        'error': None,
+        'cached': True,
+        'data': _drain(output_buffer),
+    }
+    if len(result) > 5 and result[5]:
+        item['details'] = result[5]
+    return item
+
+
+def _store_item(key, item):
+    """Caches a successful batch item (before its output name is made unique)."""
+    result = (BytesIO(item['data']), item['output_name'], item['original_size'], item['processed_size'], None)
+    if 'details' in item:
+        result += (item['details'],)
+    store_result(key, item['name'], result)
+
+
+def _drain(output_buffer):
+    """Reads and closes a result buffer (BytesIO or spooled temp file)."""
+    if output_buffer is None:
+        return None
+    with output_buffer:
+        return output_buffer.read()
+
+
+def _iter_uploads():
+    """
+    Yields (filename, bytes, error) for every uploaded file; uploaded ZIPs are expanded
+    member by member. Members past ZIP_MEMBER_MAX_BYTES are skipped with an error, and
+    expansion stops once ZIP_TOTAL_MAX_BYTES have been extracted. Sizes are checked from
+    the archive's directory before anything is decompressed.
+    """
+    extracted = 0
+    for file_storage in request.files.getlist('files') + request.files.getlist('file'):
+        if not file_storage or not file_storage.filename:
+            continue
+        if file_storage.filename.lower().endswith('.zip'):
+            with zipfile.ZipFile(file_storage.stream) as archive:
+                for member in archive.infolist():
+                    name = os.path.basename(member.filename)
+                    if member.is_dir() or name.startswith('.'):
+                        continue
+                    if member.file_size > ZIP_MEMBER_MAX_BYTES:
+                        yield name, None, (f"File too large when extracted: {member.file_size} bytes "
+                                           f"(limit {ZIP_MEMBER_MAX_BYTES}).")
+                        continue
+                    if extracted + member.file_size > ZIP_TOTAL_MAX_BYTES:
+                        yield name, None, (f"ZIP expands past {ZIP_TOTAL_MAX_BYTES} bytes; "
+                                           f"this and the remaining files were skipped.")
+                        return
+                    # zipfile stops at the declared size, and the bounded read guards that too
+                    with archive.open(member) as member_file:
+                        content = member_file.read(ZIP_MEMBER_MAX_BYTES + 1)
+                    extracted += len(content)
+                    yield name, content, None
+        else:
+            yield file_storage.filename, file_storage.read(), None
+
+
+def _unique_name(name, used):
+    stem, ext = os.path.splitext(name)
+    candidate, counter = name, 1
+    while candidate in used:
+        candidate = f"{stem}_{counter}{ext}"
+        counter += 1
+    used.add(candidate)
+    return candidate
+
+
+def register_batch_route(app, rule, endpoint, logic_fn, parse_params):
+    """
+    Registers POST <rule>: many files ('files') or one ZIP in, a streamed ZIP out.
+    logic_fn(filename, file_content, **params) must be a module-level function
+    returning the usual (buffer, output_filename, original_size, processed_size, error),
+    optionally followed by a details dict that is copied into the manifest;
+    it runs in the shared process pool. parse_params(form) returns the keyword
+    arguments for logic_fn or raises ValueError with a message for the client.
+    Results are added to the ZIP as each image finishes, followed by manifest.json.
+    Files already in the image result cache are added without going through the pool.
+    """
+    def execute_batch():
+        if not request.files:
+            return jsonify({"error": "No files uploaded (use 'files' or a ZIP)"}), 400
+        try:
+            params = parse_params(request.form)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        uploads = _iter_uploads()
+        pool = get_process_pool()
+
+        def results():
+            manifest = []
+            used_names = set()
+            pending = {} # future -> (input filename, cache key)
+            started = time.perf_counter()
+            exhausted = False
+            while True:
+                # Keep a bounded number of files in flight
+                while not exhausted and len(pending) < BATCH_WINDOW:
+                    try:
+                        filename, content, error = next(uploads)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    except zipfile.BadZipFile as e:
+                        manifest.append({'name': 'upload.zip', 'error': f"Invalid ZIP file: {e}"})
+                        exhausted = True
+                        break
+                    if error:
+                        manifest.append({'name': filename, 'error': error})
+                        continue
+                    key = result_key(logic_fn, filename, content, params)
+                    result = _cached_item(key, filename)
+                    if result is not None:
+                        result['output_name'] = _unique_name(result['output_name'], used_names)
+                        yield result['output_name'], result.pop('data')
+                        manifest.append(result)
+                        continue
+                    future = pool.submit(_run_batch_item, logic_fn, filename, content, params)
+                    pending[future] = (filename, key)
+                if not pending:
+                    if exhausted:
+                        break
+                    continue
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    filename, key = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {'name': filename, 'error': f"Worker failed: {e}", 'data': None}
+                    if result.get('data') is not None and not result.get('error'):
+                        _store_item(key, result)
+                    data = result.pop('data', None)
+                    if data is not None and not result.get('error'):
+                        result['output_name'] = _unique_name(result['output_name'], used_names)
+                        yield result['output_name'], data
+                    manifest.append(result)
+
+            summary = {
+                'files': manifest,
+                'succeeded': sum(1 for r in manifest if not r.get('error')),
+                'failed': sum(1 for r in manifest if r.get('error')),
+                'total_seconds': round(time.perf_counter() - started, 4),
+                'workers': CPU_WORKERS,
+            }
+            yield 'manifest.json', json.dumps(summary, indent=2).encode('utf-8')
+
+        # Images are already compressed, store them as-is
+        return Response(stream_with_context(stream_zip(results())), mimetype='application/zip', headers={
+            'Content-Disposition': f'attachment; filename="{endpoint}_results.zip"',
+            'X-Accel-Buffering': 'no',
+        })
+
+    app.add_url_rule(rule, endpoint, execute_batch, methods=['POST'])
@@ -0,0 +1,290 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+from pathlib import Path
+from typing import Optional
+
+from flask import Response, request
+
+from common.config import STATE_DIR, env_int
+
+# In-process tier (per worker) and shared on-disk tier; 0 disables a tier
+IMAGE_CACHE_MEMORY_BYTES = env_int('IMAGE_CACHE_MEMORY_BYTES', 64 * 1024 * 1024)
+IMAGE_CACHE_DISK_BYTES = env_int('IMAGE_CACHE_DISK_BYTES', 1024 * 1024 * 1024)
+IMAGE_CACHE_DIR = STATE_DIR / 'image_cache'
+IMAGE_CACHE_DB_PATH = STATE_DIR / 'image_cache.sqlite3'
+
+# Bump when an operation's output changes for the same input and parameters, so old disk entries stop matching
+_KEY_VERSION = 1
+_HASH_CHUNK = 1024 * 1024
+
+
+def hash_source(source) -> str:
+    """BLAKE2b digest of an upload given as bytes or a seekable binary file (read in chunks, then rewound)."""
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(source, (bytes, bytearray)):
+        digest.update(source)
+    else:
+        source.seek(0)
+        for chunk in iter(lambda: source.read(_HASH_CHUNK), b''):
+            digest.update(chunk)
+        source.seek(0)
+    return digest.hexdigest()
+
+
+def result_key(logic_fn, input_filename: str, source, params: dict) -> str:
+    """
+    Cache key for applying logic_fn with params to an upload. The input extension is part of
+    the key because the tools pick the input (and default output) format from it.
+    """
+    operation = f"{logic_fn.__module__}.{logic_fn.__qualname__}"
+    extension = input_filename.rsplit('.', 1)[-1].lower()
+    material = json.dumps([_KEY_VERSION, operation, extension, params], sort_keys=True, default=str)
+    return hashlib.blake2b(f"{hash_source(source)}:{material}".encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _output_suffix(input_filename: str, output_filename: str) -> str:
+    # Output names are '<input stem>_<tool suffix>'; keep only the suffix so a hit can be renamed
+    stem = os.path.splitext(input_filename)[0]
+    return output_filename[len(stem):] if output_filename.startswith(stem) else output_filename
+
+
+class ImageResultCache:
+    """
+    Encoded image results stored by result_key. Small results are kept in a per-process LRU
+    bounded by memory_bytes; every result is also written to cache_dir, indexed in SQLite and
+    kept under disk_bytes by evicting the least recently used files. Hit/miss counters live
+    in the database so every worker process sees them.
+    """
+
+    def __init__(self, cache_dir, db_path, memory_bytes: int, disk_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = str(db_path)
+        self.memory_bytes = max(0, memory_bytes)
+        self.disk_bytes = max(0, disk_bytes)
+        # One entry may take at most a quarter of the memory tier, so a big result can't flush it
+        self.max_memory_entry = self.memory_bytes // 4
+        self._memory = OrderedDict() # key -> (data, meta)
+        self._memory_used = 0
+        self._memory_lock = threading.Lock()
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                meta TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str):
+        self._connect().execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,)
+        )
+
+    def _remember(self, key: str, data: bytes, meta: dict):
+        if len(data) > self.max_memory_entry:
+            return
+        with self._memory_lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_used -= len(previous[0])
+            self._memory[key] = (data, meta)
+            self._memory_used += len(data)
+            while self._memory_used > self.memory_bytes:
+                _, (evicted, _) = self._memory.popitem(last=False) # Evict least recently used
+                self._memory_used -= len(evicted)
+
+    def lookup(self, key: str):
+        """Returns (buffer, meta) for a cached result and marks it used, or None on a miss."""
+        with self._memory_lock:
+            item = self._memory.get(key)
+            if item is not None:
+                self._memory.move_to_end(key)
+        if item is not None:
+            self._count('memory_hits')
+            return BytesIO(item[0]), item[1]
+
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM entries WHERE key = ?", (key,)).fetchone()
+        buffer = None
+        if row is not None:
+            try:
+                buffer = open(row['path'], 'rb')
+            except FileNotFoundError:
+                # File removed behind our back, forget it
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        if buffer is None:
+            self._count('misses')
+            return None
+
+        conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._count('disk_hits')
+        meta = json.loads(row['meta'])
+        if row['size'] <= self.max_memory_entry:
+            # Promote small results so the next hit is served from memory
+            with buffer:
+                data = buffer.read()
+            self._remember(key, data, meta)
+            return BytesIO(data), meta
+        return buffer, meta
+
+    def store(self, key: str, output_buffer, meta: dict):
+        """Copies a result buffer into the cache and rewinds it so it can still be sent."""
+        size = output_buffer.seek(0, os.SEEK_END)
+        output_buffer.seek(0)
+        if size <= self.max_memory_entry:
+            self._remember(key, output_buffer.read(), meta)
+            output_buffer.seek(0)
+        if not size or size > self.disk_bytes:
+            return
+
+        target = self.cache_dir / f"{key}.bin"
+        partial = self.cache_dir / f"{key}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            with open(partial, 'wb') as f:
+                shutil.copyfileobj(output_buffer, f)
+            os.replace(partial, target) # Atomic, readers in other processes never see half a file
+        except OSError as e:
+            print(f"Image cache: could not write {target}: {e}")
+            partial.unlink(missing_ok=True)
+            return
+        finally:
+            output_buffer.seek(0)
+        now = time.time()
+        self._connect().execute(
+            "INSERT OR REPLACE INTO entries (key, path, meta, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, str(target), json.dumps(meta), size, now, now)
+        )
+        self.evict(keep=key)
+
+    def evict(self, keep: Optional[str] = None):
+        """Deletes least recently used files until the disk tier fits in disk_bytes."""
+        conn = self._connect()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.disk_bytes:
+            return
+        rows = conn.execute("SELECT key, path, size FROM entries ORDER BY last_access ASC").fetchall()
+        for row in rows:
+            if total <= self.disk_bytes:
+                break
+            if row['key'] == keep:
+                continue
+            try:
+                os.remove(row['path']) # Open handles (results being served) stay readable on POSIX
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Image cache: could not evict {row['path']}: {e}")
+                continue
+            conn.execute("DELETE FROM entries WHERE key = ?", (row['key'],))
+            total -= row['size']
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        memory_hits = counters.get('memory_hits', 0)
+        disk_hits = counters.get('disk_hits', 0)
+        misses = counters.get('misses', 0)
+        lookups = memory_hits + disk_hits + misses
+        with self._memory_lock:
+            memory_entries, memory_used = len(self._memory), self._memory_used
+        return {
+            'memory_entries': memory_entries, # This process only
+            'memory_bytes': memory_used,
+            'max_memory_bytes': self.memory_bytes,
+            'disk_entries': entries,
+            'disk_bytes': total,
+            'max_disk_bytes': self.disk_bytes,
+            'memory_hits': memory_hits,
+            'disk_hits': disk_hits,
+            'misses': misses,
+            'hit_rate': round((memory_hits + disk_hits) / lookups, 3) if lookups else None,
+        }
+
+
+image_result_cache = ImageResultCache(IMAGE_CACHE_DIR, IMAGE_CACHE_DB_PATH,
+                                      IMAGE_CACHE_MEMORY_BYTES, IMAGE_CACHE_DISK_BYTES)
+
+
+def lookup_result(key: str, input_filename: str):
+    """
+    Returns a cached result in the logic functions' shape
+    ((buffer, output_filename, original_size, processed_size, error[, details])), or None.
+    """
+    cached = image_result_cache.lookup(key)
+    if cached is None:
+        return None
+    buffer, meta = cached
+    output_filename = os.path.splitext(input_filename)[0] + meta['suffix'] if meta['renamed'] else meta['suffix']
+    result = (buffer, output_filename, meta['original_size'], meta['processed_size'], None)
+    return result + (meta['details'],) if meta['has_details'] else result
+
+
+def cached_result(key: str, input_filename: str, compute):
+    """Returns (result, hit): the cached result, or compute()'s result, which is stored if it succeeded."""
+    result = lookup_result(key, input_filename)
+    if result is not None:
+        return result, True
+    result = compute()
+    if result[0] is not None and not result[4]:
+        store_result(key, input_filename, result)
+    return result, False
+
+
+def store_result(key: str, input_filename: str, result):
+    """Caches a successful logic-function result tuple; the buffer is left rewound."""
+    output_buffer, output_filename, original_size, processed_size = result[:4]
+    suffix = _output_suffix(input_filename, output_filename)
+    try:
+        image_result_cache.store(key, output_buffer, {
+            'suffix': suffix,
+            'renamed': suffix != output_filename,
+            'original_size': original_size,
+            'processed_size': processed_size,
+            'has_details': len(result) > 5,
+            'details': result[5] if len(result) > 5 else None,
+        })
+    except (OSError, sqlite3.Error) as e:
+        # The cache is an optimisation, never fail the request because of it
+        print(f"Image cache: could not store result: {e}")
+
+
+def not_modified(key: str) -> Optional[Response]:
+    """A 304 response when the client's If-None-Match already names this result, else None."""
+    if key in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(key)
+        return response
+    return None
+
+
+def add_cache_headers(response, key: str, hit: bool):
+    """Sets ETag and X-Cache (HIT/MISS) and exposes them to the frontends."""
+    response.set_etag(key)
+    response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+    exposed = response.headers.get('Access-Control-Expose-Headers')
+    response.headers['Access-Control-Expose-Headers'] = ', '.join(filter(None, [exposed, 'ETag', 'X-Cache']))
+    return response
@@ -0,0 +1,452 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import warnings
+from concurrent.futures import as_completed
+from contextlib import contextmanager
+from io import BytesIO
+
+from PIL import Image
+from flask import jsonify, make_response, request, send_file
+
+from common.config import env_float, env_int
+from common.executors import cpu_bound, get_encoder_pool
+from common.image_batch import register_batch_route, submit_image_job
+from common.image_cache import add_cache_headers, cached_result, not_modified, result_key
+from common.jobs import accepted_response, wants_async
+
+# Largest image (width x height) we agree to decode; also Pillow's own decompression-bomb threshold
+IMAGE_MAX_PIXELS = env_int('IMAGE_MAX_PIXELS', 100_000_000)
+Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+warnings.simplefilter('ignore', Image.DecompressionBombWarning) # decode_image raises its own error instead
+# Decoded pixel memory allowed in flight per process, and how long a request waits for room
+IMAGE_MEMORY_BUDGET = env_int('IMAGE_MEMORY_BUDGET', 1024 * 1024 * 1024)
+IMAGE_MEMORY_WAIT = env_float('IMAGE_MEMORY_WAIT', 60)
+# Encoded outputs stay in memory up to this size, then spill to a temp file
+OUTPUT_SPOOL_SIZE = env_int('IMAGE_OUTPUT_SPOOL_BYTES', 8 * 1024 * 1024)
+
+
+def _writable_formats():
+    """Output extension -> Pillow format name, limited to encoders this Pillow build has."""
+    Image.init()
+    formats = {'png': 'PNG', 'jpg': 'JPEG', 'jpeg': 'JPEG'}
+    for extension, pillow_format in (('webp', 'WEBP'), ('avif', 'AVIF')):
+        if pillow_format in Image.SAVE:
+            formats[extension] = pillow_format
+    return formats
+
+
+SAVE_FORMATS = _writable_formats()
+# Formats whose size is controlled by a quality setting (WebP also has a lossless mode)
+LOSSY_FORMATS = ('JPEG', 'WEBP', 'AVIF')
+PIPELINE_OPS = ('resize', 'mode', 'format', 'quality')
+
+# resample_quality -> (JPEG draft decode, draft oversampling factor, reducing_gap).
+# Draft lets libjpeg scale by 1/2, 1/4 or 1/8 in the DCT domain while decoding, so a
+# 24 MP photo shrunk to 800 px never materialises at full size; reducing_gap does a
+# cheap box reduce() first and leaves only the last ~gap x scaling to the real filter.
+RESIZE_PROFILES = {
+    'exact': (False, None, None),  # Full decode, plain LANCZOS
+    'balanced': (True, 2, 3.0),    # Decode at >= 2x the target, near-identical output
+    'fast': (True, 1, 2.0),        # Decode at >= the target, cheaper filter for big reductions
+}
+DEFAULT_RESAMPLE_QUALITY = 'balanced'
+
+# zlib strategies Pillow accepts as compress_type for PNG, and the levels tried by the deep PNG search
+ZLIB_STRATEGIES = {'default': 0, 'filtered': 1, 'huffman': 2, 'rle': 3, 'fixed': 4}
+PNG_SEARCH_LEVELS = (6, 9)
+
+# --- Limits and I/O ---------------------------------------------------------
+
+class ImageLimitError(Exception):
+    """The image is too large to decode, or there was no memory budget left in time."""
+
+
+class PixelMemoryBudget:
+    """
+    Counting semaphore over bytes of decoded pixel memory. Replaces unbounded
+    concurrency: small images run side by side, huge ones wait for room. A single
+    image larger than the whole budget still runs, but only on its own.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(1, max_bytes)
+        self.in_use = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, nbytes: int, timeout: float = None):
+        nbytes = min(max(0, nbytes), self.max_bytes)
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.in_use + nbytes <= self.max_bytes, timeout):
+                raise ImageLimitError("Server is busy processing other images, try again shortly.")
+            self.in_use += nbytes
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_use -= nbytes
+                self._condition.notify_all()
+
+
+pixel_budget = PixelMemoryBudget(IMAGE_MEMORY_BUDGET)
+
+
+class _SpooledOutput(tempfile.SpooledTemporaryFile):
+    """Spooled temp file whose fileno() doesn't force a rollover while it is still in memory."""
+
+    def fileno(self):
+        # Pillow asks for fileno() to write directly; SpooledTemporaryFile would move to disk for that
+        if not self._rolled:
+            raise io.UnsupportedOperation('fileno')
+        return super().fileno()
+
+
+def source_size(source) -> int:
+    """Size in bytes of an upload given as bytes or a seekable binary file."""
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    position = source.tell()
+    size = source.seek(0, os.SEEK_END)
+    source.seek(position)
+    return size
+
+
+def read_source(source) -> bytes:
+    """Returns the whole upload as bytes (for consumers that need them, e.g. pdf2image)."""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    source.seek(0)
+    return source.read()
+
+
+def decode_image(source) -> Image.Image:
+    """
+    Opens an image from bytes or directly from a binary file (no copy into memory).
+    Only the header is read; raises ImageLimitError past IMAGE_MAX_PIXELS.
+    """
+    img = Image.open(BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+    width, height = img.size
+    if width * height > IMAGE_MAX_PIXELS:
+        img.close()
+        raise ImageLimitError(f"Image is too large: {width}x{height} pixels (limit {IMAGE_MAX_PIXELS}).")
+    return img
+
+
+def estimate_image_memory(img) -> int:
+    """Rough peak bytes to process an image: the decoded frame plus one working copy, 4 bytes per pixel."""
+    width, height = img.size
+    return width * height * 4 * 2
+
+
+@contextmanager
+def open_image(source):
+    """Decodes an upload and holds its share of the pixel memory budget until the block ends."""
+    img = decode_image(source)
+    try:
+        with pixel_budget.reserve(estimate_image_memory(img), IMAGE_MEMORY_WAIT):
+            yield img
+    finally:
+        img.close()
+
+
+# --- Stages -----------------------------------------------------------------
+# Shared by the image tools and the pipeline endpoint; each takes and returns a PIL image.
+
+def choose_resample(scale, resample_quality=DEFAULT_RESAMPLE_QUALITY):
+    """Picks a filter for a downscale factor (source/target, > 1 means shrinking)."""
+    if scale <= 1:
+        return Image.Resampling.BICUBIC # Upscaling: LANCZOS only adds ringing
+    if resample_quality == 'fast' and scale >= 2:
+        return Image.Resampling.BILINEAR
+    return Image.Resampling.LANCZOS
+
+
+def resize_image(img, target_width, target_height, maintain_aspect_ratio=True,
+                 resample_quality=DEFAULT_RESAMPLE_QUALITY):
+    """
+    Fits the image inside the box (keeping aspect ratio, never enlarging) or resizes it
+    to exactly that size. Call it before anything loads the pixels so JPEG draft
+    decoding can kick in; resample_quality is one of RESIZE_PROFILES.
+    """
+    use_draft, draft_factor, reducing_gap = RESIZE_PROFILES[resample_quality]
+    source_width, source_height = img.size
+    if maintain_aspect_ratio:
+        ratio = min(int(target_width) / source_width, int(target_height) / source_height)
+        if ratio >= 1:
+            return img
+        new_size = (max(1, round(source_width * ratio)), max(1, round(source_height * ratio)))
+    else:
+        new_size = (int(target_width), int(target_height))
+
+    scale = max(source_width / new_size[0], source_height / new_size[1])
+    if use_draft and img.format == 'JPEG' and scale >= 2:
+        # No-op once the image is loaded (e.g. after a mode conversion)
+        img.draft(None, (new_size[0] * draft_factor, new_size[1] * draft_factor))
+        scale = max(img.size[0] / new_size[0], img.size[1] / new_size[1])
+    return img.resize(new_size, choose_resample(scale, resample_quality), reducing_gap=reducing_gap)
+
+
+def convert_mode(img, mode):
+    """Converts to a PIL mode such as 'RGB', 'RGBA' or 'L' (no-op if already there)."""
+    return img if img.mode == mode else img.convert(mode)
+
+
+def prepare_for_format(img, save_format):
+    """Converts modes the target encoder can't write (JPEG has no alpha or palette, WebP/AVIF no palette)."""
+    if save_format == 'JPEG' and img.mode != 'RGB':
+        return img.convert('RGB')
+    if save_format in ('WEBP', 'AVIF') and img.mode not in ('RGB', 'RGBA'):
+        return img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+    return img
+
+
+def encode_image(img, save_format, **save_kwargs):
+    """Encodes the image and returns (spooled buffer positioned at 0, size in bytes)."""
+    output_buffer = _SpooledOutput(max_size=OUTPUT_SPOOL_SIZE)
+    img.save(output_buffer, format=save_format, **save_kwargs)
+    processed_size = output_buffer.tell()
+    output_buffer.seek(0)
+    return output_buffer, processed_size
+
+
+def encode_to_target_size(img, save_format, target_bytes, tolerance=0.05,
+                          min_quality=5, max_quality=95, **save_kwargs):
+    """
+    Binary-searches the quality setting for the best encode that fits in target_bytes,
+    stopping early once a result lands within tolerance below the target. Trial
+    encodes reuse one scratch buffer. Returns (spooled buffer, size, details) where
+    details has the chosen quality, the number of attempts and whether the target was met;
+    if even min_quality is too big, that smallest encode is returned.
+    """
+    scratch = BytesIO()
+
+    def encode_at(quality):
+        scratch.seek(0)
+        scratch.truncate()
+        img.save(scratch, format=save_format, quality=quality, **save_kwargs)
+        return scratch.tell()
+
+    low, high = min_quality, max_quality
+    best_quality = None
+    last_quality = None
+    attempts = 0
+    while low <= high:
+        quality = (low + high) // 2
+        size = encode_at(quality)
+        last_quality = quality
+        attempts += 1
+        if size <= target_bytes:
+            best_quality = quality
+            if size >= target_bytes * (1 - tolerance):
+                break # Close enough, more attempts would gain a few bytes at most
+            low = quality + 1
+        else:
+            high = quality - 1
+
+    target_met = best_quality is not None
+    chosen_quality = best_quality if target_met else min_quality
+    if chosen_quality != last_quality:
+        encode_at(chosen_quality)
+        attempts += 1
+
+    output_buffer = _SpooledOutput(max_size=OUTPUT_SPOOL_SIZE)
+    output_buffer.write(scratch.getbuffer())
+    processed_size = output_buffer.tell()
+    output_buffer.seek(0)
+    return output_buffer, processed_size, {'quality': chosen_quality, 'attempts': attempts, 'target_met': target_met}
+
+def strip_opaque_alpha(img):
+    """Drops the alpha channel when every pixel is fully opaque. Returns (image, stripped)."""
+    if img.mode not in ('RGBA', 'LA'):
+        return img, False
+    if img.getchannel('A').getextrema() != (255, 255):
+        return img, False
+    return img.convert('RGB' if img.mode == 'RGBA' else 'L'), True
+
+
+def quantize_image(img, colors=256, dither=True):
+    """Lossy palette reduction to at most `colors` colours (alpha is kept via fast octree)."""
+    dither_mode = Image.Dither.FLOYDSTEINBERG if dither else Image.Dither.NONE
+    if img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info):
+        return img.convert('RGBA').quantize(colors=colors, method=Image.Quantize.FASTOCTREE, dither=dither_mode)
+    return img.convert('RGB').quantize(colors=colors, method=Image.Quantize.MEDIANCUT, dither=dither_mode)
+
+
+def encode_png_smallest(img, levels=PNG_SEARCH_LEVELS, strategies=tuple(ZLIB_STRATEGIES), **save_kwargs):
+    """
+    Encodes the PNG with every compress_level x zlib strategy combination on the
+    encoder thread pool and keeps the smallest. Returns (spooled buffer, size, details).
+    Each trial saves its own copy: Image.save keeps its options on the image (encoderinfo),
+    so trials sharing one image would encode with each other's settings. The copy is made
+    inside the trial, so at most one copy per encoder thread exists at a time.
+    """
+    img.load() # Decode once up front, not in every trial thread
+
+    def trial(level, strategy):
+        buffer = BytesIO()
+        img.copy().save(buffer, format='PNG', compress_level=level, compress_type=ZLIB_STRATEGIES[strategy], **save_kwargs)
+        return level, strategy, buffer
+
+    pool = get_encoder_pool()
+    futures = [pool.submit(trial, level, strategy) for level in levels for strategy in strategies]
+    best = None
+    for future in as_completed(futures):
+        level, strategy, buffer = future.result()
+        if best is None or buffer.tell() < best[2].tell():
+            best = (level, strategy, buffer) # Losing buffers are dropped as results come in
+
+    level, strategy, buffer = best
+    output_buffer = _SpooledOutput(max_size=OUTPUT_SPOOL_SIZE)
+    output_buffer.write(buffer.getbuffer())
+    processed_size = output_buffer.tell()
+    output_buffer.seek(0)
+    return output_buffer, processed_size, {'compress_level': level, 'compress_type': strategy, 'candidates': len(futures)}
+
+# --- Pipeline ---------------------------------------------------------------
+
+def parse_operations(raw):
+    """
+    Validates an operations list (JSON string or list) such as
+    [{"op": "resize", "width": 800, "height": 800}, {"op": "format", "format": "webp"},
+     {"op": "quality", "quality": 80}]. Raises ValueError with a client-facing message.
+    """
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Operations must be valid JSON: {e}")
+    if not isinstance(raw, list) or not raw:
+        raise ValueError("Operations must be a non-empty list.")
+
+    operations = []
+    for op in raw:
+        if not isinstance(op, dict) or op.get('op') not in PIPELINE_OPS:
+            raise ValueError(f"Unknown operation: {op}. Supported: {list(PIPELINE_OPS)}")
+        name = op['op']
+        try:
+            if name == 'resize':
+                width, height = int(op['width']), int(op['height'])
+                if width < 1 or height < 1:
+                    raise ValueError("Resize width and height must be positive.")
+                resample_quality = op.get('resample_quality', DEFAULT_RESAMPLE_QUALITY)
+                if resample_quality not in RESIZE_PROFILES:
+                    raise ValueError(f"Unsupported resample_quality: {resample_quality}. Supported: {list(RESIZE_PROFILES)}")
+                operations.append({
+                    'op': name,
+                    'width': width,
+                    'height': height,
+                    'maintain_aspect_ratio': bool(op.get('maintain_aspect_ratio', True)),
+                    'resample_quality': resample_quality,
+                })
+            elif name == 'mode':
+                if op.get('mode') not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+                    raise ValueError(f"Unsupported mode: {op.get('mode')}")
+                operations.append({'op': name, 'mode': op['mode']})
+            elif name == 'format':
+                output_format = str(op.get('format', '')).lower()
+                if output_format not in SAVE_FORMATS:
+                    raise ValueError(f"Unsupported output format: {output_format}. Supported: {list(SAVE_FORMATS)}")
+                operations.append({'op': name, 'format': output_format})
+            elif name == 'quality':
+                operations.append({
+                    'op': name,
+                    'quality': max(1, min(int(op.get('quality', 85)), 95)),
+                    'optimize': bool(op.get('optimize', True)),
+                })
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Invalid '{name}' operation: {op} ({e})")
+    return operations
+
+
+def run_pipeline(input_filename, source, operations):
+    """
+    Decodes once, applies the operations in order and encodes once. source is bytes or a binary file.
+    Returns (buffer, output_filename, original_size, processed_size, error) like the tool logic functions.
+    """
+    stem, ext = os.path.splitext(input_filename)
+    output_format = ext.lstrip('.').lower()
+    save_kwargs = {'optimize': True}
+
+    try:
+        original_size = source_size(source)
+        with open_image(source) as img:
+            for op in operations:
+                if op['op'] == 'resize':
+                    img = resize_image(img, op['width'], op['height'], op['maintain_aspect_ratio'], op['resample_quality'])
+                elif op['op'] == 'mode':
+                    img = convert_mode(img, op['mode'])
+                elif op['op'] == 'format':
+                    output_format = op['format']
+                elif op['op'] == 'quality':
+                    save_kwargs = {'quality': op['quality'], 'optimize': op['optimize']}
+
+            save_format = SAVE_FORMATS.get(output_format)
+            if save_format is None:
+                return None, None, None, None, f"Unsupported output format: {output_format}. Add a 'format' operation."
+            if save_format == 'PNG':
+                save_kwargs.pop('quality', None) # Lossless, quality doesn't apply
+
+            img = prepare_for_format(img, save_format)
+            output_buffer, processed_size = encode_image(img, save_format, **save_kwargs)
+            output_filename = f"{stem}_processed.{output_format}"
+            print(f"Pipeline - {len(operations)} op(s), Original: {original_size}, Processed: {processed_size}")
+            return output_buffer, output_filename, original_size, processed_size, None
+
+    except Exception as e:
+        error_msg = f"Error during image pipeline: {e}"
+        print(error_msg)
+        return None, None, None, None, error_msg
+
+
+def _parse_batch_params(form):
+    return {'operations': parse_operations(form.get('operations', ''))}
+
+
+def register_pipeline_routes(app):
+    """Registers /api/tool/image-pipeline/execute (one image) and /batch (many images or a ZIP)."""
+
+    @app.route('/api/tool/image-pipeline/execute', methods=['POST'])
+    @cpu_bound
+    def execute_image_pipeline():
+        if 'file' not in request.files:
+            return jsonify({"error": "No file part"}), 400
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({"error": "No selected file"}), 400
+        try:
+            operations = parse_operations(request.form.get('operations', ''))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        if wants_async(source_size(file.stream)):
+            return accepted_response(submit_image_job('image-pipeline', run_pipeline, file, {'operations': operations}))
+        cache_key = result_key(run_pipeline, file.filename, file.stream, {'operations': operations})
+        unchanged = not_modified(cache_key)
+        if unchanged:
+            return unchanged
+        started = time.perf_counter()
+        (output_buffer, output_filename, original_size, processed_size, error), cache_hit = cached_result(
+            cache_key, file.filename, lambda: run_pipeline(file.filename, file.stream, operations)
+        )
+        if error:
+            return jsonify({"error": error}), 500
+
+        output_format = output_filename.rsplit('.', 1)[-1]
+        response = make_response(send_file(
+            output_buffer,
+            mimetype=Image.MIME.get(SAVE_FORMATS[output_format], 'application/octet-stream'),
+            as_attachment=True,
+            download_name=output_filename
+        ))
+        response.headers['X-Original-Size'] = str(original_size)
+        response.headers['X-Processed-Size'] = str(processed_size)
+        response.headers['X-Processing-Time'] = f"{time.perf_counter() - started:.4f}"
+        response.headers['Access-Control-Expose-Headers'] = 'X-Original-Size, X-Processed-Size, X-Processing-Time, Content-Disposition'
+        return add_cache_headers(response, cache_key, cache_hit)
+
+    register_batch_route(app, '/api/tool/image-pipeline/batch', 'image_pipeline_batch',
+                         run_pipeline, _parse_batch_params)
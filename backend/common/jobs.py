@@ -0,0 +1,239 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Optional
+
+from flask import jsonify, request, send_file
+
+from common.config import STATE_DIR, env_float, env_int
+from common.executors import get_io_pool, get_process_pool
+from common.progress_store import create_progress_store
+
+# Finished results are kept on disk so any server process can deliver them
+JOB_RESULT_DIR = STATE_DIR / 'job_results'
+JOB_RESULT_TTL = env_float('JOB_RESULT_TTL', 3600)
+# Uploads at least this large run as a job even without async=true (0 = only when asked)
+JOB_AUTO_ASYNC_BYTES = env_int('JOB_AUTO_ASYNC_BYTES', 0)
+
+# Job lifecycle: queued -> running -> completed | error | cancelled
+FINISHED_JOB_STATES = ('completed', 'error', 'cancelled')
+
+job_store = create_progress_store('tool_jobs')
+_futures = {} # job ID -> Future, for jobs submitted by this process
+_futures_lock = threading.Lock()
+_current = threading.local() # job_id of the io job running on this thread
+_last_sweep = 0.0
+
+# Returned by an io job body that hands its job to something else, which finishes it with complete_job()
+DEFERRED = object()
+
+
+def wants_async(upload_size: Optional[int] = None) -> bool:
+    """True when the client asked for a job (async=true or 'Prefer: respond-async') or the upload is large."""
+    if request.values.get('async', 'false').lower() == 'true':
+        return True
+    if 'respond-async' in request.headers.get('Prefer', ''):
+        return True
+    return bool(JOB_AUTO_ASYNC_BYTES and upload_size is not None and upload_size >= JOB_AUTO_ASYNC_BYTES)
+
+
+def _public(job: dict) -> dict:
+    """The job as returned by the API (without server-side paths)."""
+    job = {k: v for k, v in job.items() if k not in ('result_path',)}
+    job['status_url'] = f"/api/jobs/{job['job_id']}"
+    if job['status'] == 'completed':
+        job['result_url'] = f"/api/jobs/{job['job_id']}/result"
+    return job
+
+
+def accepted_response(job: dict):
+    """202 response pointing the client at the job's status endpoint."""
+    response = jsonify(_public(job))
+    response.status_code = 202
+    response.headers['Location'] = f"/api/jobs/{job['job_id']}"
+    return response
+
+
+def submit_job(tool_id: str, kind: str, fn, *args, on_output=None, **kwargs) -> dict:
+    """
+    Runs fn(*args, **kwargs) as a job: kind 'cpu' uses the shared process pool (fn must be
+    picklable), 'io' the I/O thread pool. fn returns a dict with either 'data' (bytes),
+    'buffer' (a binary file, copied and closed) or 'path' (an existing file) plus 'filename' and optional 'mimetype'/'headers'/'details',
+    or 'json' for JSON results, or 'error'. on_output(output), if given, runs in this
+    process before the result is recorded and returns the output to record. Returns the
+    job entry.
+    """
+    _maybe_sweep()
+    job = _new_job(tool_id, kind)
+    job_id = job['job_id']
+    if kind == 'cpu':
+        future = get_process_pool().submit(fn, *args, **kwargs)
+    elif kind == 'io':
+        future = get_io_pool().submit(_run_io_job, job_id, fn, args, kwargs)
+    else:
+        raise ValueError(f"Unknown job kind: {kind}")
+    with _futures_lock:
+        _futures[job_id] = future
+    future.add_done_callback(lambda f: _finish_job(job_id, f, on_output))
+    return job
+
+
+def completed_job(tool_id: str, kind: str, output: dict) -> dict:
+    """Records a job whose result is already known (e.g. a cache hit); output is shaped like a job body's."""
+    _maybe_sweep()
+    job = _new_job(tool_id, kind)
+    return _record_output(job['job_id'], output)
+
+
+def _new_job(tool_id: str, kind: str) -> dict:
+    job_id = uuid.uuid4().hex
+    return job_store.create(job_id, {
+        'job_id': job_id,
+        'tool_id': tool_id,
+        'kind': kind,
+        'status': 'queued',
+        'created_at': time.time(),
+    })
+
+
+def _run_io_job(job_id, fn, args, kwargs):
+    job = job_store.get(job_id)
+    if job is None or job['status'] == 'cancelled':
+        return None
+    job_store.update(job_id, status='running', started_at=time.time())
+    _current.job_id = job_id
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _current.job_id = None
+
+
+def current_job_id() -> Optional[str]:
+    """The ID of the io job running on this thread, or None."""
+    return getattr(_current, 'job_id', None)
+
+
+def _finish_job(job_id: str, future, on_output=None):
+    with _futures_lock:
+        _futures.pop(job_id, None)
+    job = job_store.get(job_id)
+    if job is None or job['status'] == 'cancelled' or future.cancelled():
+        return # Cancelled while running: drop the result
+
+    try:
+        output = future.result()
+        if on_output is not None and output is not None and output is not DEFERRED:
+            output = on_output(output)
+    except Exception as e:
+        output = {'error': f"Job failed: {e}"}
+    if output is None or output is DEFERRED:
+        return
+    _record_output(job_id, output)
+
+
+def complete_job(job_id: str, output: dict) -> Optional[dict]:
+    """Finishes a DEFERRED job with a job body's output; jobs that already finished (or were cancelled) are left alone."""
+    job = job_store.get(job_id)
+    if job is None or job['status'] in FINISHED_JOB_STATES:
+        return job
+    return _record_output(job_id, output)
+
+
+def _record_output(job_id: str, output: dict) -> dict:
+    if output.get('error'):
+        return job_store.update(job_id, status='error', error=output['error'], finished_at=time.time())
+
+    fields = {'status': 'completed', 'finished_at': time.time(), 'headers': output.get('headers', {})}
+    if output.get('details'):
+        fields['details'] = output['details']
+    if 'json' in output:
+        fields['result'] = output['json']
+    else:
+        path = output.get('path')
+        if output.get('data') is not None or output.get('buffer') is not None:
+            result_dir = JOB_RESULT_DIR / job_id
+            result_dir.mkdir(parents=True, exist_ok=True)
+            path = result_dir / os.path.basename(output['filename'])
+            with open(path, 'wb') as f:
+                if output.get('buffer') is not None:
+                    with output['buffer'] as buffer:
+                        shutil.copyfileobj(buffer, f)
+                else:
+                    f.write(output['data'])
+        fields.update(result_path=str(path), filename=output['filename'], mimetype=output.get('mimetype'))
+    return job_store.update(job_id, **fields)
+
+
+def cancel_job(job_id: str) -> Optional[dict]:
+    """
+    Cancels a job. Queued work in this process is removed from its pool; work that is
+    already running (including process-pool work) finishes in the background and its
+    result is discarded. DEFERRED jobs are left to whoever finishes them, e.g. download
+    jobs cancel their download.
+    """
+    job = job_store.get(job_id)
+    if job is None or job['status'] in FINISHED_JOB_STATES:
+        return job
+    with _futures_lock:
+        future = _futures.get(job_id)
+    if future is not None:
+        future.cancel()
+    return job_store.update(job_id, status='cancelled', finished_at=time.time())
+
+
+def _maybe_sweep():
+    """Deletes result files older than JOB_RESULT_TTL (at most once a minute)."""
+    global _last_sweep
+    now = time.time()
+    if now - _last_sweep < 60 or not JOB_RESULT_DIR.exists():
+        return
+    _last_sweep = now
+    for entry in JOB_RESULT_DIR.iterdir():
+        try:
+            if now - entry.stat().st_mtime > JOB_RESULT_TTL:
+                shutil.rmtree(entry, ignore_errors=True)
+        except OSError:
+            pass
+
+
+def register_job_routes(app):
+    """Registers /api/jobs/<job_id> (status), /result and /cancel on the main app."""
+
+    @app.route('/api/jobs/<job_id>')
+    def get_job_status(job_id):
+        job = job_store.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found.'}), 404
+        with _futures_lock:
+            future = _futures.get(job_id)
+        if job['status'] == 'queued' and future is not None and future.running():
+            job['status'] = 'running' # Process-pool jobs don't report their start
+        return jsonify(_public(job))
+
+    @app.route('/api/jobs/<job_id>/result')
+    def get_job_result(job_id):
+        job = job_store.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found.'}), 404
+        if job['status'] != 'completed':
+            return jsonify({'error': f"Job is {job['status']}.", 'status': job['status']}), 409
+        if 'result' in job:
+            return jsonify(job['result'])
+        if not os.path.exists(job['result_path']):
+            return jsonify({'error': 'Result has expired.'}), 410
+        response = send_file(job['result_path'], mimetype=job.get('mimetype'),
+                             as_attachment=True, download_name=job['filename'])
+        response.headers.update(job.get('headers') or {})
+        response.headers['Access-Control-Expose-Headers'] = ', '.join(
+            list(job.get('headers') or {}) + ['Content-Disposition']
+        )
+        return response
+
+    @app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+    def cancel_job_route(job_id):
+        job = cancel_job(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found.'}), 404
+        return jsonify(_public(job))
@@ -0,0 +1,185 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import yt_dlp
+from yt_dlp.extractor.youtube import YoutubeIE
+
+from common.config import env_float, env_int
+
+
+class TTLCache:
+    """Thread-safe LRU cache with a per-entry time-to-live and a maximum entry count."""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 1800):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self._data = OrderedDict() # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key) # Mark as most recently used
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False) # Evict least recently used
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+# Format URLs returned by YouTube expire after a few hours, keep the TTL well below that
+video_info_cache = TTLCache(
+    max_entries=env_int('YTDL_INFO_CACHE_SIZE', 256),
+    ttl=env_float('YTDL_INFO_CACHE_TTL', 1800)
+)
+# cache key -> [lock, callers using it], so concurrent requests for one video extract once;
+# an entry is removed only by the last caller, so later callers can't get a second lock
+_extract_locks = {}
+_extract_locks_guard = threading.Lock()
+
+
+def canonical_video_id(url: str) -> Optional[str]:
+    """Returns the YouTube video ID for a URL without any network access, if it has one."""
+    if not url:
+        return None
+    return YoutubeIE.get_temp_id(url.strip())
+
+
+def _cache_key(url: str, cookies_file: Optional[str]) -> str:
+    video_id = canonical_video_id(url)
+    key = f"youtube:{video_id}" if video_id else f"url:{url.strip()}"
+    # Info fetched with cookies may include private/age-gated data, keep it per cookie set
+    if cookies_file:
+        try:
+            with open(cookies_file, 'rb') as f:
+                key += ':' + hashlib.sha1(f.read()).hexdigest()[:16]
+        except OSError:
+            pass
+    return key
+
+
+def extract_video_info(url: str, cookies_file: Optional[str] = None) -> dict:
+    """
+    Returns yt-dlp's (processed, JSON-safe) info dict for a URL, extracting at most
+    once per TTL. The returned dict is shared and must be treated as read-only.
+    Raises yt-dlp's exceptions when extraction fails; failures are not cached.
+    """
+    key = _cache_key(url, cookies_file)
+    info = video_info_cache.get(key)
+    if info is not None:
+        return info
+
+    with _extract_locks_guard:
+        entry = _extract_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    lock = entry[0]
+    try:
+        with lock:
+            # Another request may have finished the extraction while we waited
+            info = video_info_cache.get(key)
+            if info is not None:
+                return info
+
+            ydl_opts = {
+                'quiet': True,
+                'no_warnings': True,
+                'skip_download': True,
+            }
+            if cookies_file:
+                ydl_opts['cookiefile'] = cookies_file
+
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                info = ydl.sanitize_info(ydl.extract_info(url, download=False))
+
+            video_info_cache.set(key, info)
+            return info
+    finally:
+        with _extract_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _extract_locks[key]
+
+
+def invalidate_video_info(url: str, cookies_file: Optional[str] = None):
+    """Drops the cached info for a URL (e.g. after its format URLs expired)."""
+    video_info_cache.invalidate(_cache_key(url, cookies_file))
+
+
+def iter_batch_entries(urls, cookies_file: Optional[str] = None):
+    """
+    Lazily yields (video_id, url, title) for a list of video, playlist or channel URLs.
+    Playlists are expanded with flat extraction page by page, so the first entries
+    can be queued before the whole playlist has been listed.
+    """
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'skip_download': True,
+        'extract_flat': 'in_playlist',
+        'lazy_playlist': True,
+    }
+    if cookies_file:
+        ydl_opts['cookiefile'] = cookies_file
+
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        for url in urls:
+            video_id = canonical_video_id(url)
+            if video_id:
+                # Plain video URL, no extraction needed to queue it
+                yield video_id, url, None
+                continue
+
+            result = ydl.extract_info(url, download=False, process=False)
+            # Channel/tab URLs may resolve to another URL first (e.g. the channel's /videos tab)
+            for _ in range(3):
+                if result.get('_type') not in ('url', 'url_transparent') or not result.get('url'):
+                    break
+                if canonical_video_id(result['url']):
+                    break
+                result = ydl.extract_info(result['url'], download=False, process=False)
+            entries = result.get('entries')
+            if entries is None:
+                # A single video (possibly behind a redirect)
+                target_url = result.get('url') if result.get('_type') in ('url', 'url_transparent') else None
+                video_id = canonical_video_id(target_url or '') or result.get('id')
+                if video_id:
+                    yield video_id, target_url or result.get('webpage_url') or url, result.get('title')
+                continue
+            for entry in entries:
+                if not entry or not entry.get('id'):
+                    continue
+                entry_url = entry.get('url') or entry.get('webpage_url')
+                if entry.get('ie_key') == 'Youtube' or canonical_video_id(entry_url or ''):
+                    entry_url = f"https://www.youtube.com/watch?v={entry['id']}"
+                yield entry['id'], entry_url, entry.get('title')
@@ -0,0 +1,52 @@
+import threading
+from typing import Iterable
+
+
+class ProgressSubscription:
+    """One listener's view of a set of job keys. Pending updates are coalesced per key."""
+
+    def __init__(self, keys: Iterable[str]):
+        self.keys = set(keys)
+        self._pending = {} # key -> latest snapshot not yet delivered
+        self._cond = threading.Condition()
+
+    def push(self, key: str, snapshot: dict):
+        with self._cond:
+            self._pending[key] = snapshot # Newer snapshots replace undelivered older ones
+            self._cond.notify()
+
+    def wait(self, timeout: float) -> dict:
+        """Blocks until updates are pending (or timeout) and returns them, clearing the backlog."""
+        with self._cond:
+            if not self._pending:
+                self._cond.wait(timeout)
+            pending, self._pending = self._pending, {}
+            return pending
+
+
+class ProgressBroadcaster:
+    """Fans progress snapshots out to every subscription interested in the key."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+
+    def subscribe(self, keys: Iterable[str]) -> ProgressSubscription:
+        subscription = ProgressSubscription(keys)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: ProgressSubscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, key: str, snapshot: dict):
+        with self._lock:
+            targets = [s for s in self._subscriptions if key in s.keys]
+        for subscription in targets:
+            subscription.push(key, snapshot)
+
+    def subscriber_count(self, key: str) -> int:
+        with self._lock:
+            return sum(1 for s in self._subscriptions if key in s.keys)
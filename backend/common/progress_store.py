@@ -0,0 +1,265 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Optional
+
+from common.config import STATE_DIR, env_float, env_int
+
+# Entries in these states are kept only for FINISHED_TTL seconds
+FINISHED_STATUSES = ('completed', 'error', 'cancelled')
+
+
+class BaseProgressStore(ABC):
+    """
+    Progress entries keyed by job (video) ID. Writers use create()/update(), which
+    are atomic per entry; readers get copies, never the live entry. Finished entries
+    expire after finished_ttl, untouched ones after idle_ttl. Beyond max_entries the
+    oldest finished (or idle-expired) entries are dropped; live entries never are, so
+    with more live jobs than max_entries the store stays over the limit until they end.
+    """
+
+    def __init__(self, max_entries: int, finished_ttl: float, idle_ttl: float):
+        self.max_entries = max(1, int(max_entries))
+        self.finished_ttl = finished_ttl
+        self.idle_ttl = idle_ttl
+        self._listeners = []
+        self._last_eviction = 0.0
+
+    def add_listener(self, callback: Callable[[str, dict], None]):
+        """Registers callback(key, snapshot), called after every create/update."""
+        self._listeners.append(callback)
+
+    def _notify(self, key: str, snapshot: dict):
+        for callback in self._listeners:
+            try:
+                callback(key, snapshot)
+            except Exception as e:
+                print(f"Progress listener failed for {key}: {e}")
+
+    def _is_expired(self, entry: dict, now: float) -> bool:
+        age = now - entry.get('updated_at', now)
+        if entry.get('status') in FINISHED_STATUSES:
+            return age > self.finished_ttl
+        return age > self.idle_ttl
+
+    def _maybe_evict(self):
+        # Expiry scans are cheap but pointless on every write; run them at most every few seconds
+        now = time.time()
+        if now - self._last_eviction >= 5:
+            self._last_eviction = now
+            self.evict_expired()
+
+    def __contains__(self, key) -> bool:
+        return self.get(key) is not None
+
+    # Implemented by the backends
+    @abstractmethod
+    def get(self, key: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def create(self, key: str, entry: dict) -> dict:
+        ...
+
+    @abstractmethod
+    def update(self, key: str, **fields) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    def evict_expired(self):
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+
+class MemoryProgressStore(BaseProgressStore):
+    """In-process store guarded by a lock (single worker process)."""
+
+    def __init__(self, max_entries=1000, finished_ttl=3600, idle_ttl=6 * 3600):
+        super().__init__(max_entries, finished_ttl, idle_ttl)
+        self._entries = {}
+        self._lock = threading.RLock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return dict(entry) if entry is not None else None
+
+    def create(self, key, entry):
+        with self._lock:
+            stored = dict(entry, updated_at=time.time())
+            self._entries[key] = stored
+            self._enforce_limit()
+            snapshot = dict(stored)
+        self._notify(key, snapshot)
+        self._maybe_evict()
+        return snapshot
+
+    def update(self, key, **fields):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry.update(fields, updated_at=time.time())
+            snapshot = dict(entry)
+        self._notify(key, snapshot)
+        return snapshot
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def evict_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [k for k, e in self._entries.items() if self._is_expired(e, now)]
+            for key in expired:
+                del self._entries[key]
+        if expired:
+            print(f"Progress store: evicted {len(expired)} expired entries")
+
+    def _enforce_limit(self):
+        overflow = len(self._entries) - self.max_entries
+        if overflow <= 0:
+            return
+        # Oldest finished or idle-expired entries only; live jobs are still being followed
+        now = time.time()
+        victims = sorted(
+            (kv for kv in self._entries.items()
+             if kv[1].get('status') in FINISHED_STATUSES or self._is_expired(kv[1], now)),
+            key=lambda kv: kv[1].get('updated_at', 0)
+        )[:overflow]
+        for key, _entry in victims:
+            del self._entries[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteProgressStore(BaseProgressStore):
+    """
+    Store shared by several processes (e.g. gunicorn workers) through a SQLite
+    database in WAL mode, so any worker can answer a progress poll.
+    """
+
+    def __init__(self, db_path, max_entries=1000, finished_ttl=3600, idle_ttl=6 * 3600):
+        super().__init__(max_entries, finished_ttl, idle_ttl)
+        self.db_path = str(db_path)
+        self._local = threading.local()
+        self._connect().execute("""
+            CREATE TABLE IF NOT EXISTS progress (
+                key TEXT PRIMARY KEY,
+                status TEXT,
+                updated_at REAL NOT NULL,
+                data TEXT NOT NULL
+            )
+        """)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL') # Progress is ephemeral, skip fsync per write
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute("SELECT data FROM progress WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write(self, conn, key, entry):
+        conn.execute(
+            "INSERT OR REPLACE INTO progress (key, status, updated_at, data) VALUES (?, ?, ?, ?)",
+            (key, entry.get('status'), entry['updated_at'], json.dumps(entry))
+        )
+
+    def create(self, key, entry):
+        snapshot = dict(entry, updated_at=time.time())
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._write(conn, key, snapshot)
+            self._enforce_limit(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._notify(key, snapshot)
+        self._maybe_evict()
+        return dict(snapshot)
+
+    def update(self, key, **fields):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE') # Serialises the read-modify-write across processes
+        try:
+            row = conn.execute("SELECT data FROM progress WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            snapshot = json.loads(row[0])
+            snapshot.update(fields, updated_at=time.time())
+            self._write(conn, key, snapshot)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._notify(key, snapshot)
+        return dict(snapshot)
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM progress WHERE key = ?", (key,))
+
+    def evict_expired(self):
+        now = time.time()
+        placeholders = ','.join('?' * len(FINISHED_STATUSES))
+        cursor = self._connect().execute(
+            f"DELETE FROM progress WHERE (status IN ({placeholders}) AND updated_at < ?) OR updated_at < ?",
+            (*FINISHED_STATUSES, now - self.finished_ttl, now - self.idle_ttl)
+        )
+        if cursor.rowcount:
+            print(f"Progress store: evicted {cursor.rowcount} expired entries")
+
+    def _enforce_limit(self, conn):
+        overflow = conn.execute("SELECT COUNT(*) FROM progress").fetchone()[0] - self.max_entries
+        if overflow <= 0:
+            return
+        placeholders = ','.join('?' * len(FINISHED_STATUSES))
+        # Oldest finished or idle-expired entries only; live jobs are still being followed
+        conn.execute(
+            f"""DELETE FROM progress WHERE key IN (
+                SELECT key FROM progress
+                WHERE status IN ({placeholders}) OR updated_at < ?
+                ORDER BY updated_at ASC LIMIT ?
+            )""",
+            (*FINISHED_STATUSES, time.time() - self.idle_ttl, overflow)
+        )
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM progress").fetchone()[0]
+
+
+def create_progress_store(name: str) -> BaseProgressStore:
+    """
+    Builds the progress store selected by PROGRESS_STORE ('memory' or 'sqlite').
+    The SQLite database lives in STATE_DIR as <name>_progress.sqlite3.
+    """
+    max_entries = env_int('PROGRESS_STORE_MAX_ENTRIES', 1000)
+    finished_ttl = env_float('PROGRESS_STORE_FINISHED_TTL', 3600)
+    idle_ttl = env_float('PROGRESS_STORE_IDLE_TTL', 6 * 3600)
+    backend = os.environ.get('PROGRESS_STORE', 'memory').strip().lower()
+    if backend == 'sqlite':
+        return SQLiteProgressStore(STATE_DIR / f"{name}_progress.sqlite3", max_entries, finished_ttl, idle_ttl)
+    if backend != 'memory':
+        print(f"Warning: Unknown PROGRESS_STORE '{backend}', using in-memory store")
+    return MemoryProgressStore(max_entries, finished_ttl, idle_ttl)
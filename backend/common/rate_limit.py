@@ -0,0 +1,47 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+class HostRateLimiter:
+    """
+    Token bucket per host: on average at most `rate` requests per second to each host,
+    with bursts of up to `burst`. acquire() blocks (outside the lock) until the caller's
+    turn; rate <= 0 disables limiting.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, int(burst))
+        self._buckets = {} # host -> (tokens, updated_at); negative tokens are reserved turns
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.waited_seconds = 0.0
+
+    def acquire(self, url: str) -> float:
+        """Waits for a request slot for url's host; returns the seconds waited."""
+        if self.rate <= 0:
+            return 0.0
+        host = urlsplit(url).hostname or url
+        with self._lock:
+            now = time.monotonic()
+            tokens, updated_at = self._buckets.get(host, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate) - 1
+            self._buckets[host] = (tokens, now)
+            wait = -tokens / self.rate if tokens < 0 else 0.0
+            if wait:
+                self.waits += 1
+                self.waited_seconds += wait
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'rate_per_host': self.rate,
+                'burst': self.burst,
+                'hosts': len(self._buckets),
+                'waits': self.waits,
+                'waited_seconds': round(self.waited_seconds, 3),
+            }
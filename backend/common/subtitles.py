@@ -0,0 +1,182 @@
+import html
+import io
+import json
+import re
+from typing import Iterator, List, NamedTuple
+from xml.etree import ElementTree
+
+
+class Segment(NamedTuple):
+    """One caption: start and duration in seconds, and its text (may contain newlines)."""
+    start: float
+    duration: float
+    text: str
+
+
+# --- Parsing -------------------------------------------------------------
+
+_TIMING = re.compile(r'(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{3})\s*-->\s*(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{3})')
+_TAG = re.compile(r'<[^>]+>')
+_EVENTS_START = re.compile(r'"events"\s*:\s*\[')
+_BETWEEN_EVENTS = re.compile(r'[\s,]*')
+
+
+def _seconds(hours, minutes, seconds, millis) -> float:
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds) + int(millis) / 1000
+
+
+def iter_json3_events(data: str) -> Iterator[dict]:
+    """
+    Yields the entries of json3's top-level 'events' array one at a time, decoding each
+    in place, so the document is never held as one large parsed tree.
+    """
+    match = _EVENTS_START.search(data)
+    if not match:
+        return
+    decoder = json.JSONDecoder()
+    pos = match.end()
+    while True:
+        pos = _BETWEEN_EVENTS.match(data, pos).end()
+        if pos >= len(data) or data[pos] == ']':
+            return
+        event, pos = decoder.raw_decode(data, pos)
+        yield event
+
+
+def parse_json3(data: str) -> List[Segment]:
+    """Parses YouTube's json3 format ({'events': [{'tStartMs', 'dDurationMs', 'segs': [...]}]})."""
+    segments = []
+    for event in iter_json3_events(data):
+        if 'segs' not in event:
+            continue
+        text = ''.join(seg.get('utf8', '') for seg in event['segs']).strip()
+        if text:
+            segments.append(Segment(event.get('tStartMs', 0) / 1000, event.get('dDurationMs', 0) / 1000, text))
+    return segments
+
+
+def parse_srv3(data: str) -> List[Segment]:
+    """Parses YouTube's srv3 XML (<p t="start ms" d="duration ms">text<s>word</s></p>)."""
+    segments = []
+    for _, element in ElementTree.iterparse(io.StringIO(data)):
+        if element.tag != 'p':
+            continue
+        text = ''.join(element.itertext()).strip()
+        if text:
+            segments.append(Segment(int(element.get('t', 0)) / 1000, int(element.get('d', 0)) / 1000, text))
+        element.clear()
+    return segments
+
+
+def parse_vtt(data: str) -> List[Segment]:
+    """
+    Parses WebVTT or SRT cues (timing line followed by text lines); tags are stripped.
+    A cue ends at an empty line; YouTube's whitespace-only spacer lines inside cues are skipped.
+    """
+    segments = []
+    start = end = None
+    lines = []
+    for raw in data.splitlines() + ['']:
+        line = raw.strip()
+        if '-->' in line:
+            match = _TIMING.search(line)
+            if match:
+                start = _seconds(*match.group(1, 2, 3, 4))
+                end = _seconds(*match.group(5, 6, 7, 8))
+                lines = []
+                continue
+        if not line:
+            if start is not None and lines:
+                segments.append(Segment(start, max(0.0, end - start), '\n'.join(lines)))
+                start = None
+            elif not raw:
+                start = None
+        elif start is not None:
+            text = html.unescape(_TAG.sub('', line)).strip() if '<' in line or '&' in line else line
+            if text:
+                lines.append(text)
+    return segments
+
+
+def dedupe_rolling(segments: List[Segment]) -> List[Segment]:
+    """
+    Removes the repetition in rolling auto-captions, where each cue repeats the line(s) of
+    the previous one before adding a new line, and short transition cues repeat it whole.
+    Repeated lines are dropped; a cue that adds nothing extends the previous segment.
+    """
+    result = []
+    shown = [] # Lines of the previous cue
+    for segment in segments:
+        lines = segment.text.split('\n')
+        overlap = min(len(lines), len(shown))
+        while overlap and lines[:overlap] != shown[-overlap:]:
+            overlap -= 1
+        shown = lines
+        new_lines = lines[overlap:]
+        if new_lines:
+            result.append(Segment(segment.start, segment.duration, '\n'.join(new_lines)))
+        elif result:
+            previous = result[-1]
+            end = max(previous.start + previous.duration, segment.start + segment.duration)
+            result[-1] = previous._replace(duration=end - previous.start)
+    return result
+
+
+def parse_subtitles(data: str, ext: str, rolling: bool = False) -> List[Segment]:
+    """
+    Parses a downloaded subtitle track by its yt-dlp extension (json3, srv3, else VTT/SRT).
+    rolling=True de-duplicates auto-caption text; manual subtitles may repeat lines on purpose.
+    """
+    if ext == 'json3':
+        segments = parse_json3(data)
+    elif ext == 'srv3':
+        try:
+            segments = parse_srv3(data)
+        except ElementTree.ParseError:
+            return []
+    else:
+        segments = parse_vtt(data)
+    return dedupe_rolling(segments) if rolling else segments
+
+
+# --- Rendering -----------------------------------------------------------
+
+def _timestamp(seconds: float, separator: str) -> str:
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+
+def render_text(segments: List[Segment]) -> str:
+    return '\n'.join(segment.text for segment in segments)
+
+
+def render_srt(segments: List[Segment]) -> str:
+    blocks = []
+    for index, segment in enumerate(segments, 1):
+        blocks.append(f"{index}\n{_timestamp(segment.start, ',')} --> "
+                      f"{_timestamp(segment.start + segment.duration, ',')}\n{segment.text}\n")
+    return '\n'.join(blocks)
+
+
+def render_vtt(segments: List[Segment]) -> str:
+    blocks = ['WEBVTT\n']
+    for segment in segments:
+        blocks.append(f"{_timestamp(segment.start, '.')} --> "
+                      f"{_timestamp(segment.start + segment.duration, '.')}\n{segment.text}\n")
+    return '\n'.join(blocks)
+
+
+def segments_to_json(segments: List[Segment]) -> list:
+    return [{'start': round(s.start, 3), 'duration': round(s.duration, 3), 'text': s.text} for s in segments]
+
+
+# format name -> (renderer, mimetype, file extension)
+RENDERERS = {
+    'text': (render_text, 'text/plain', 'txt'),
+    'srt': (render_srt, 'application/x-subrip', 'srt'),
+    'vtt': (render_vtt, 'text/vtt', 'vtt'),
+    'json': (lambda segments: json.dumps(segments_to_json(segments), ensure_ascii=False), 'application/json', 'json'),
+}
@@ -0,0 +1,193 @@
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+from typing import Callable, Optional
+
+from werkzeug.wrappers import Response
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def _env_ids(name: str) -> Optional[set]:
+    """Reads a comma-separated list of tool IDs; None when the variable is unset or empty."""
+    value = os.environ.get(name, '').strip()
+    if not value:
+        return None
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+
+def load_tool_module(tool_dir: str, module_name: str):
+    """
+    Imports <tool_dir>/<module_name>.py under its bare module name, so worker processes
+    (which have tool_dir on sys.path) can unpickle functions defined in it.
+    """
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(tool_dir, f"{module_name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except Exception:
+        sys.modules.pop(module_name, None)
+        raise
+    return module
+
+
+def find_tool_class(module, class_name: Optional[str] = None):
+    """Returns the named class, or the first class whose name ends with 'Tool' (one tool per file)."""
+    if class_name:
+        return getattr(module, class_name)
+    for name, obj in module.__dict__.items():
+        if isinstance(obj, type) and name.endswith('Tool'):
+            return obj
+    return None
+
+
+class LazyTool:
+    """A manifest entry: metadata is known up front, the module is imported on first use."""
+
+    def __init__(self, spec: dict):
+        self.module_name = spec['module']
+        self.class_name = spec.get('class')
+        self.url_prefixes = tuple(spec['url_prefixes'])
+        self.info = spec['info']
+        self.id = self.info['id']
+        self.hidden = spec.get('hidden', False) # Routes only, not offered in /api/tools
+        self.instance = None
+        self.app = None
+        self.load_seconds = None
+        self.lock = threading.Lock()
+
+
+class ToolRegistry:
+    """
+    Tools listed in tools/manifest.json are imported on the first request under one of their
+    URL prefixes. Each gets its own Flask app from create_app(tool_id), so routes are never
+    added to an app that already served requests. Tools without a manifest entry are imported
+    at startup and register on the main app, as before.
+
+    TOOLS_ENABLED / TOOLS_DISABLED (comma-separated IDs) choose which tools exist at all;
+    TOOLS_PRELOAD lists tools to import at startup anyway ('all' for every enabled tool).
+    """
+
+    def __init__(self, tool_dir: str, create_app: Callable[[str], object]):
+        self.tool_dir = tool_dir
+        self.create_app = create_app
+        self.enabled_ids = _env_ids('TOOLS_ENABLED')
+        self.disabled_ids = _env_ids('TOOLS_DISABLED') or set()
+        self.preload_ids = _env_ids('TOOLS_PRELOAD') or set()
+        self.lazy_tools = [] # LazyTool, in manifest order
+        self.eager_tools = [] # Instances registered on the main app
+        self.disabled_prefixes = ()
+
+    def is_enabled(self, tool_id: str) -> bool:
+        if tool_id in self.disabled_ids:
+            return False
+        return self.enabled_ids is None or tool_id in self.enabled_ids
+
+    def discover(self, app):
+        """Reads the manifest and loads tools that aren't in it onto app."""
+        manifest_path = os.path.join(self.tool_dir, MANIFEST_NAME)
+        specs = []
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding='utf-8') as f:
+                specs = json.load(f)
+        listed_modules = {spec['module'] for spec in specs}
+
+        disabled_prefixes = []
+        for spec in specs:
+            tool = LazyTool(spec)
+            if not self.is_enabled(tool.id):
+                disabled_prefixes.extend(tool.url_prefixes)
+                print(f"Tool disabled by configuration: {tool.id}")
+                continue
+            self.lazy_tools.append(tool)
+            print(f"Registered tool: {tool.info['name']} ({tool.id}, loads on first use)")
+        self.disabled_prefixes = tuple(disabled_prefixes)
+
+        for filename in sorted(os.listdir(self.tool_dir)):
+            module_name = filename[:-3]
+            if not filename.endswith('_tool.py') or module_name in listed_modules:
+                continue
+            try:
+                tool_class = find_tool_class(load_tool_module(self.tool_dir, module_name))
+                if tool_class is None:
+                    print(f"Warning: No tool class found in {filename}")
+                    continue
+                tool_instance = tool_class()
+                tool_id = tool_instance.get_info()['id']
+                if not self.is_enabled(tool_id):
+                    print(f"Tool disabled by configuration: {tool_id}")
+                    continue
+                tool_instance.register_routes(app)
+                self.eager_tools.append(tool_instance)
+                print(f"Registered tool: {tool_instance.get_info()['name']} ({tool_id}, not in {MANIFEST_NAME})")
+            except Exception as e:
+                print(f"Error loading tool from {filename}: {e}")
+
+        for tool in self.lazy_tools:
+            if 'all' in self.preload_ids or tool.id in self.preload_ids:
+                try:
+                    self.load(tool)
+                except Exception:
+                    pass # Reported by load(); the next request retries
+
+    def load(self, tool: LazyTool):
+        """Imports the tool and builds its app (once; concurrent first requests wait for it)."""
+        if tool.app is not None:
+            return tool.app
+        with tool.lock:
+            if tool.app is None:
+                started = time.perf_counter()
+                try:
+                    module = load_tool_module(self.tool_dir, tool.module_name)
+                    instance = find_tool_class(module, tool.class_name)()
+                    tool_app = self.create_app(tool.id)
+                    instance.register_routes(tool_app)
+                except Exception as e:
+                    print(f"Error loading tool {tool.id} from {tool.module_name}.py: {e}")
+                    raise
+                if instance.get_info() != tool.info:
+                    print(f"Warning: {MANIFEST_NAME} entry for {tool.id} differs from its get_info(); update the manifest")
+                tool.instance = instance
+                tool.load_seconds = round(time.perf_counter() - started, 4)
+                tool.app = tool_app
+                print(f"Loaded tool {tool.id} in {tool.load_seconds}s")
+        return tool.app
+
+    def match(self, path: str) -> Optional[LazyTool]:
+        for tool in self.lazy_tools:
+            if path.startswith(tool.url_prefixes):
+                return tool
+        return None
+
+    def infos(self) -> list:
+        """Info of every enabled, listed tool, without importing any of them."""
+        return ([tool.info for tool in self.lazy_tools if not tool.hidden]
+                + [tool.get_info() for tool in self.eager_tools])
+
+    def status(self) -> list:
+        return [{'id': tool.id, 'loaded': tool.app is not None, 'load_seconds': tool.load_seconds}
+                for tool in self.lazy_tools]
+
+    def wsgi_middleware(self, wsgi_app):
+        """Wraps the main app's wsgi_app: requests under a lazy tool's prefix go to that tool's app."""
+        def dispatch(environ, start_response):
+            path = environ.get('PATH_INFO', '')
+            tool = self.match(path)
+            if tool is not None:
+                try:
+                    tool_app = self.load(tool)
+                except Exception as e:
+                    return _json_error(f"Tool {tool.id} failed to load: {e}", 500)(environ, start_response)
+                return tool_app(environ, start_response)
+            if path.startswith(self.disabled_prefixes):
+                return _json_error("This tool is disabled on this server.", 404)(environ, start_response)
+            return wsgi_app(environ, start_response)
+        return dispatch
+
+
+def _json_error(message: str, status: int) -> Response:
+    return Response(json.dumps({'error': message}), status=status, mimetype='application/json')
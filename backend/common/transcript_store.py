@@ -0,0 +1,366 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import List, Optional
+
+from common.subtitles import Segment
+
+KINDS = ('manual', 'auto')
+
+# Terms of a search query: "quoted phrases" or single words, optionally with a trailing * (prefix)
+_QUERY_TERM = re.compile(r'"([^"]+)"(\*?)|(\S+?)(\*?)(?=\s|$)')
+
+
+def fts5_available(conn: sqlite3.Connection) -> bool:
+    """True if this SQLite build includes the FTS5 extension."""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def to_match_query(query: str) -> str:
+    """
+    Turns user input into an FTS5 query: every word or "quoted phrase" must appear
+    (implicit AND), a trailing * matches prefixes, and FTS5 operators are taken literally.
+    """
+    terms = []
+    for phrase, phrase_star, word, word_star in _QUERY_TERM.findall(query):
+        text = (phrase or word).replace('"', '""').strip()
+        if text:
+            terms.append(f'"{text}"' + (phrase_star or word_star))
+    return ' '.join(terms)
+
+
+def _encode_segments(segments: List[Segment]) -> bytes:
+    return zlib.compress(json.dumps([list(s) for s in segments], ensure_ascii=False,
+                                    separators=(',', ':')).encode('utf-8'))
+
+
+def _decode_segments(data: bytes) -> List[Segment]:
+    return [Segment(*item) for item in json.loads(zlib.decompress(data))]
+
+
+class TranscriptStore:
+    """
+    Parsed transcripts in SQLite, keyed by video ID, language and kind (manual or auto).
+    Segments are stored once (zlib-compressed JSON) and rendered to any format on demand.
+    Entries expire ttl seconds after they were fetched; beyond max_bytes the least
+    recently used transcripts are evicted. The subtitle tracks each video offers are
+    kept too, so requests for a language a video lacks need no extraction either.
+
+    Every stored transcript is also added to a full-text (FTS5) index of its segments,
+    one row per segment with its timing. The index is updated per transcript as they
+    arrive and outlives cache eviction, but has its own limit: beyond index_max_bytes
+    of indexed text the least recently used transcripts (fetched, served or found by
+    a search) leave the index.
+    """
+
+    def __init__(self, db_path, max_bytes: int, ttl: float, index_max_bytes: int):
+        self.db_path = str(db_path)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.index_max_bytes = index_max_bytes
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS transcripts (
+                video_id TEXT NOT NULL,
+                lang TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                title TEXT,
+                source_ext TEXT,
+                segments BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (video_id, lang, kind)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id TEXT PRIMARY KEY,
+                title TEXT,
+                tracks TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+        self.searchable = fts5_available(conn)
+        if self.searchable:
+            conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(
+                    text, video_id UNINDEXED, lang UNINDEXED, kind UNINDEXED,
+                    start_ms UNINDEXED, end_ms UNINDEXED,
+                    tokenize = 'unicode61 remove_diacritics 2'
+                )
+            """)
+            # Each indexed transcript owns a contiguous rowid range, so replacing it is a range delete
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS indexed (
+                    video_id TEXT NOT NULL,
+                    lang TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    title TEXT,
+                    first_rowid INTEGER NOT NULL,
+                    last_rowid INTEGER NOT NULL,
+                    indexed_at REAL NOT NULL,
+                    size INTEGER NOT NULL DEFAULT 0,
+                    last_access REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (video_id, lang, kind)
+                )
+            """)
+            # Indexes created before the index had a size limit
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(indexed)')]
+            if 'size' not in columns:
+                conn.execute('ALTER TABLE indexed ADD COLUMN size INTEGER NOT NULL DEFAULT 0')
+                conn.execute('ALTER TABLE indexed ADD COLUMN last_access REAL NOT NULL DEFAULT 0')
+                conn.execute(
+                    "UPDATE indexed SET last_access = indexed_at, size = (SELECT COALESCE(SUM(LENGTH(CAST(text AS BLOB))), 0) "
+                    "FROM segments_fts WHERE rowid BETWEEN indexed.first_rowid AND indexed.last_rowid)"
+                )
+            # Only once: afterwards a stored transcript missing from the index was evicted from it
+            if conn.execute("SELECT 1 FROM counters WHERE name = 'index_backfilled'").fetchone() is None:
+                self._index_missing()
+                conn.execute("INSERT OR REPLACE INTO counters (name, value) VALUES ('index_backfilled', 1)")
+        else:
+            print("Transcript search disabled: this SQLite build has no FTS5")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str):
+        self._connect().execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,)
+        )
+
+    def get(self, video_id: str, lang: str, kind: str = 'any') -> Optional[dict]:
+        """
+        Returns the cached transcript (video_id, lang, kind, title, segments, ...) or None.
+        lang also matches regional variants ('en' finds 'en-US'); kind 'any' prefers manual.
+        """
+        conn = self._connect()
+        kinds = KINDS if kind == 'any' else (kind,)
+        rows = conn.execute(
+            f"SELECT * FROM transcripts WHERE video_id = ? AND (lang = ? OR lang LIKE ? || '-%') "
+            f"AND kind IN ({','.join('?' * len(kinds))}) AND created_at >= ?",
+            (video_id, lang, lang, *kinds, time.time() - self.ttl)
+        ).fetchall()
+        if not rows:
+            self._count('misses')
+            return None
+        row = min(rows, key=lambda r: (KINDS.index(r['kind']), r['lang'] != lang))
+        conn.execute("UPDATE transcripts SET last_access = ? WHERE video_id = ? AND lang = ? AND kind = ?",
+                     (time.time(), row['video_id'], row['lang'], row['kind']))
+        if self.searchable:
+            conn.execute("UPDATE indexed SET last_access = ? WHERE video_id = ? AND lang = ? AND kind = ?",
+                         (time.time(), row['video_id'], row['lang'], row['kind']))
+        self._count('hits')
+        entry = {k: row[k] for k in ('video_id', 'lang', 'kind', 'title', 'source_ext', 'created_at')}
+        entry['segments'] = _decode_segments(row['segments'])
+        return entry
+
+    def put(self, video_id: str, lang: str, kind: str, title: Optional[str], source_ext: str,
+            segments: List[Segment]):
+        data = _encode_segments(segments)
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO transcripts "
+                "(video_id, lang, kind, title, source_ext, segments, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (video_id, lang, kind, title, source_ext, data, len(data), now, now)
+            )
+            if self.searchable:
+                self._index(conn, video_id, lang, kind, title, segments)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self.evict()
+        self.evict_index()
+
+    # --- Search index ------------------------------------------------------
+
+    def _index(self, conn, video_id: str, lang: str, kind: str, title: Optional[str], segments: List[Segment]):
+        """(Re)indexes one transcript's segments; runs inside the caller's transaction."""
+        old = conn.execute(
+            "SELECT first_rowid, last_rowid FROM indexed WHERE video_id = ? AND lang = ? AND kind = ?",
+            (video_id, lang, kind)
+        ).fetchone()
+        if old is not None:
+            conn.execute("DELETE FROM segments_fts WHERE rowid BETWEEN ? AND ?", tuple(old))
+        first_rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) + 1 FROM segments_fts").fetchone()[0]
+        conn.executemany(
+            "INSERT INTO segments_fts (rowid, text, video_id, lang, kind, start_ms, end_ms) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((first_rowid + i, s.text, video_id, lang, kind, int(round(s.start * 1000)),
+              int(round((s.start + s.duration) * 1000))) for i, s in enumerate(segments))
+        )
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO indexed "
+            "(video_id, lang, kind, title, first_rowid, last_rowid, indexed_at, size, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (video_id, lang, kind, title, first_rowid, first_rowid + len(segments) - 1, now,
+             sum(len(s.text.encode('utf-8')) for s in segments), now)
+        )
+
+    def _index_missing(self):
+        """Indexes stored transcripts that aren't in the index yet (e.g. fetched before it existed)."""
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT t.video_id, t.lang, t.kind, t.title, t.segments FROM transcripts t "
+            "LEFT JOIN indexed i ON i.video_id = t.video_id AND i.lang = t.lang AND i.kind = t.kind "
+            "WHERE i.video_id IS NULL"
+        ).fetchall()
+        for row in rows:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._index(conn, row['video_id'], row['lang'], row['kind'], row['title'],
+                            _decode_segments(row['segments']))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        if rows:
+            print(f"Transcript search: indexed {len(rows)} stored transcript(s)")
+
+    def search(self, query: str, limit: int = 20, offset: int = 0, lang: Optional[str] = None,
+               video_id: Optional[str] = None) -> dict:
+        """
+        Ranked (BM25) segment hits for query, each with a snippet (matches wrapped in
+        <mark></mark>, text not HTML-escaped) and its start/end time in milliseconds.
+        """
+        match = to_match_query(query)
+        if not match:
+            return {'query': query, 'total': 0, 'videos': 0, 'hits': []}
+        filters, values = '', []
+        if lang:
+            filters += " AND (f.lang = ? OR f.lang LIKE ? || '-%')"
+            values += [lang, lang]
+        if video_id:
+            filters += " AND f.video_id = ?"
+            values.append(video_id)
+
+        conn = self._connect()
+        total, videos = conn.execute(
+            f"SELECT COUNT(*), COUNT(DISTINCT f.video_id) FROM segments_fts f WHERE segments_fts MATCH ?{filters}",
+            (match, *values)
+        ).fetchone()
+        rows = conn.execute(
+            f"SELECT f.video_id, f.lang, f.kind, f.start_ms, f.end_ms, i.title, f.rank AS score, "
+            f"snippet(segments_fts, 0, '<mark>', '</mark>', '…', 24) AS snippet "
+            f"FROM segments_fts f JOIN indexed i ON i.video_id = f.video_id AND i.lang = f.lang AND i.kind = f.kind "
+            f"WHERE segments_fts MATCH ?{filters} ORDER BY f.rank LIMIT ? OFFSET ?",
+            (match, *values, limit, offset)
+        ).fetchall()
+        hits = []
+        for row in rows:
+            hit = dict(row)
+            hit['score'] = round(-hit['score'], 6) # bm25() is lower-is-better; report higher-is-better
+            hits.append(hit)
+        # Transcripts people find stay in the index longest
+        conn.executemany(
+            "UPDATE indexed SET last_access = ? WHERE video_id = ? AND lang = ? AND kind = ?",
+            {(time.time(), h['video_id'], h['lang'], h['kind']) for h in hits}
+        )
+        return {'query': query, 'total': total, 'videos': videos, 'hits': hits}
+
+    def get_tracks(self, video_id: str) -> Optional[dict]:
+        """Returns {'title', 'tracks': {'manual': [langs], 'auto': [langs]}} if known and fresh."""
+        row = self._connect().execute(
+            "SELECT title, tracks FROM videos WHERE video_id = ? AND fetched_at >= ?",
+            (video_id, time.time() - self.ttl)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'title': row['title'], 'tracks': json.loads(row['tracks'])}
+
+    def put_tracks(self, video_id: str, title: Optional[str], tracks: dict):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO videos (video_id, title, tracks, fetched_at) VALUES (?, ?, ?, ?)",
+            (video_id, title, json.dumps(tracks), time.time())
+        )
+
+    def evict(self):
+        """Drops expired entries, then the least recently used transcripts until the store fits in max_bytes."""
+        conn = self._connect()
+        cutoff = time.time() - self.ttl
+        conn.execute("DELETE FROM transcripts WHERE created_at < ?", (cutoff,))
+        conn.execute("DELETE FROM videos WHERE fetched_at < ?", (cutoff,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute(
+            "SELECT video_id, lang, kind, size FROM transcripts ORDER BY last_access ASC"
+        ).fetchall()
+        for row in rows:
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM transcripts WHERE video_id = ? AND lang = ? AND kind = ?",
+                         (row['video_id'], row['lang'], row['kind']))
+            total -= row['size']
+
+    def evict_index(self):
+        """Removes the least recently used transcripts from the search index until it fits in index_max_bytes."""
+        if not self.searchable:
+            return
+        conn = self._connect()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM indexed").fetchone()[0]
+        if total <= self.index_max_bytes:
+            return
+        rows = conn.execute(
+            "SELECT video_id, lang, kind, first_rowid, last_rowid, size FROM indexed ORDER BY last_access ASC"
+        ).fetchall()
+        for row in rows:
+            if total <= self.index_max_bytes:
+                break
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute("DELETE FROM segments_fts WHERE rowid BETWEEN ? AND ?", (row['first_rowid'], row['last_rowid']))
+                conn.execute("DELETE FROM indexed WHERE video_id = ? AND lang = ? AND kind = ?",
+                             (row['video_id'], row['lang'], row['kind']))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            total -= row['size']
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM transcripts").fetchone()
+        videos = conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+        hits = counters.get('hits', 0)
+        misses = counters.get('misses', 0)
+        indexed, index_bytes = (conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM indexed").fetchone()
+                                if self.searchable else (0, 0))
+        return {
+            'transcripts': entries,
+            'indexed_transcripts': indexed,
+            'index_bytes': index_bytes,
+            'index_max_bytes': self.index_max_bytes,
+            'search_available': self.searchable,
+            'videos': videos,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+        }
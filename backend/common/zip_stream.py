@@ -0,0 +1,57 @@
+import time
+import zipfile
+from typing import Iterable, Iterator, Tuple, Union
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class _StreamBuffer:
+    """Write-only, non-seekable sink for ZipFile; the generator drains it as it goes."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries: Iterable[Tuple[str, Union[str, bytes]]],
+               compression: int = zipfile.ZIP_STORED) -> Iterator[bytes]:
+    """
+    Yields a ZIP archive chunk by chunk. entries yields (arcname, source), where source
+    is a file path or bytes; it may block, so members are written as they become ready.
+    Nothing is buffered beyond one chunk, and the archive never needs to be seekable.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=compression, allowZip64=True) as archive:
+        for arcname, source in entries:
+            member = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+            member.compress_type = compression
+            if isinstance(source, (bytes, bytearray)):
+                with archive.open(member, 'w') as dest:
+                    dest.write(source)
+            else:
+                # Size is unknown up front, so always allow ZIP64 for file members
+                with archive.open(member, 'w', force_zip64=True) as dest, open(source, 'rb') as src:
+                    while True:
+                        chunk = src.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        dest.write(chunk)
+                        yield buffer.drain()
+            yield buffer.drain()
+    yield buffer.drain() # Central directory
@@ -1,57 +1,152 @@
 import os
-from io import BytesIO
-from PIL import Image
 from flask import request, send_file, jsonify, make_response
+from common.executors import cpu_bound
+from common.image_batch import register_batch_route, submit_image_job
+from common.image_cache import add_cache_headers, cached_result, not_modified, result_key
+from common.jobs import accepted_response, wants_async
+from common.image_pipeline import (LOSSY_FORMATS, SAVE_FORMATS, encode_image, encode_png_smallest, encode_to_target_size,
+                                   open_image, prepare_for_format, quantize_image, source_size, strip_opaque_alpha)
 
-SUPPORTED_FORMATS = ['png', 'jpeg', 'jpg']
+SUPPORTED_FORMATS = ['png', 'jpeg', 'jpg'] + [f for f in ('webp', 'avif') if f in SAVE_FORMATS]
+PNG_MODES = ['standard', 'deep']
 
-def _compress_image_logic(file_storage, quality=85):
+def _compress_image_logic(file_storage, **options):
     """Internal logic for image compression. Reads file, compresses, returns sizes."""
-    input_filename = file_storage.filename
+    # Decode straight from the (spooled) upload stream instead of copying it into memory
+    return _compress_image_bytes(file_storage.filename, file_storage.stream, **options)
+
+def _compress_image_bytes(input_filename, source, quality=85, output_format=None, lossless=False, target_size_kb=None,
+                          png_mode='standard', png_colors=None, png_dither=True):
+    """
+    Compresses an image given as bytes or a binary file. Request-independent, so it can run in a worker process.
+    output_format defaults to the input format. With target_size_kb the quality is searched instead of fixed.
+    png_mode='deep' strips opaque alpha and the ICC profile, optionally quantises to png_colors, and keeps
+    the smallest of several zlib settings.
+    Returns the usual 5-tuple plus a details dict (format, quality, search results) for headers/manifests.
+    """
     input_format = input_filename.split('.')[-1].lower()
+    output_format = (output_format or input_format).lower()
 
-    if input_format not in SUPPORTED_FORMATS:
-        error_msg = f"Unsupported format for compression: {input_format}"
+    if input_format not in SUPPORTED_FORMATS or output_format not in SUPPORTED_FORMATS:
+        error_msg = f"Unsupported format for compression: input={input_format}, output={output_format}"
         print(error_msg)
-        return None, None, None, None, error_msg
+        return None, None, None, None, error_msg, None
 
-    output_filename = f"{os.path.splitext(input_filename)[0]}_compressed.{input_format}"
-    output_buffer = BytesIO()
+    output_filename = f"{os.path.splitext(input_filename)[0]}_compressed.{output_format}"
+    save_format = SAVE_FORMATS[output_format]
+    if lossless and save_format != 'WEBP':
+        error_msg = "Lossless mode is only available for WebP output."
+        print(error_msg)
+        return None, None, None, None, error_msg, None
+    if target_size_kb and (lossless or save_format not in LOSSY_FORMATS):
+        error_msg = ("target_size_kb needs a lossy format (jpg, webp or avif), not "
+                     f"{'lossless mode' if lossless else output_format}.")
+        print(error_msg)
+        return None, None, None, None, error_msg, None
 
     try:
-        # Read entire file content to accurately get original size
-        file_content = file_storage.read()
-        original_size = len(file_content)
-        file_storage.seek(0) # Reset stream
-
-        img = Image.open(BytesIO(file_content)) # Open from bytes
-
-        save_format = 'JPEG' if input_format in ['jpg', 'jpeg'] else 'PNG'
-        save_kwargs = {}
-
-        # Ensure RGB mode for JPG saving if original is RGBA (like PNG)
-        if save_format == 'JPEG' and img.mode != 'RGB':
-            img = img.convert('RGB')
-
-        if save_format == 'PNG':
-            save_kwargs['optimize'] = True
-        elif save_format == 'JPEG':
-            quality = max(1, min(int(quality), 95)) # Clamp quality between 1 and 95
-            save_kwargs['quality'] = quality
-            save_kwargs['optimize'] = True
-
-        img.save(output_buffer, format=save_format, **save_kwargs)
-
-        processed_size = output_buffer.tell()
-        output_buffer.seek(0)
-        print(f"Compression - Original: {original_size}, Processed: {processed_size}")
-
-        return output_buffer, output_filename, original_size, processed_size, None
+        original_size = source_size(source)
+
+        with open_image(source) as img:
+            # Ensure RGB mode for JPG saving if original is RGBA (like PNG)
+            img = prepare_for_format(img, save_format)
+            details = {'format': output_format}
+
+            if save_format == 'PNG':
+                save_kwargs = {'optimize': True}
+            elif save_format == 'WEBP' and lossless:
+                # For lossless WebP, quality is compression effort; 100 is smallest
+                save_kwargs = {'lossless': True, 'quality': 100}
+                details['lossless'] = True
+            else:
+                save_kwargs = {'quality': max(1, min(int(quality), 95))} # Clamp quality between 1 and 95
+                if save_format == 'JPEG':
+                    save_kwargs['optimize'] = True
+
+            if save_format == 'PNG' and png_mode == 'deep':
+                img, alpha_stripped = strip_opaque_alpha(img)
+                if png_colors:
+                    img = quantize_image(img, png_colors, png_dither)
+                    details['quantized_colors'] = png_colors
+                # icc_profile=None: Pillow would otherwise copy the source's ICC chunk; text/EXIF chunks aren't written
+                output_buffer, processed_size, search = encode_png_smallest(img, icc_profile=None)
+                details.update(png_mode='deep', alpha_stripped=alpha_stripped, metadata_stripped=True, **search)
+            elif target_size_kb:
+                save_kwargs.pop('quality')
+                output_buffer, processed_size, search = encode_to_target_size(
+                    img, save_format, int(target_size_kb * 1024), **save_kwargs
+                )
+                details.update(search)
+                details['target_size_kb'] = target_size_kb
+            else:
+                output_buffer, processed_size = encode_image(img, save_format, **save_kwargs)
+                if 'quality' in save_kwargs and not lossless:
+                    details['quality'] = save_kwargs['quality']
+
+            print(f"Compression - Original: {original_size}, Processed: {processed_size}, {details}")
+
+            return output_buffer, output_filename, original_size, processed_size, None, details
 
     except Exception as e:
         error_msg = f"Error during image compression: {e}"
         print(error_msg)
-        return None, None, None, None, error_msg
+        return None, None, None, None, error_msg, None
+
+def _parse_compression_params(form):
+    """Reads quality, output format, lossless and target size; raises ValueError with a client message."""
+    try:
+        quality = int(form.get('quality', 85))
+    except ValueError:
+        raise ValueError("Invalid quality value, must be an integer.")
+
+    output_format = (form.get('output_format') or '').lower() or None
+    if output_format is not None and output_format not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported output format: {output_format}. Supported: {SUPPORTED_FORMATS}")
+
+    lossless = form.get('lossless', 'false').lower() == 'true'
+
+    target_size_kb = None
+    if form.get('target_size_kb'):
+        try:
+            target_size_kb = float(form['target_size_kb'])
+        except ValueError:
+            raise ValueError("Invalid target_size_kb, must be a number.")
+        if target_size_kb <= 0:
+            raise ValueError("target_size_kb must be positive.")
+        if lossless:
+            raise ValueError("target_size_kb needs a lossy format (jpg, webp or avif), not lossless mode.")
+        if output_format == 'png':
+            raise ValueError("target_size_kb needs a lossy format (jpg, webp or avif), not png.")
+
+    png_mode = form.get('png_mode', 'standard').lower()
+    if png_mode not in PNG_MODES:
+        raise ValueError(f"Invalid png_mode: {png_mode}. Supported: {PNG_MODES}")
+    png_colors = None
+    if form.get('png_colors'):
+        try:
+            png_colors = int(form['png_colors'])
+        except ValueError:
+            raise ValueError("Invalid png_colors, must be an integer.")
+        if not 2 <= png_colors <= 256:
+            raise ValueError("png_colors must be between 2 and 256.")
+    png_dither = form.get('png_dither', 'true').lower() == 'true'
+
+    return {
+        'quality': quality,
+        'output_format': output_format,
+        'lossless': lossless,
+        'target_size_kb': target_size_kb,
+        'png_mode': png_mode,
+        'png_colors': png_colors,
+        'png_dither': png_dither,
+    }
+
+def _compression_headers(details):
+    """Turns the details dict into X-Compression-* headers (e.g. X-Compression-Quality)."""
+    return {
+        'X-Compression-' + key.replace('_', '-').title(): str(value).lower() if isinstance(value, bool) else str(value)
+        for key, value in details.items()
+    }
 
 
 class ImageCompressorTool:
@@ -59,13 +154,18 @@ class ImageCompressorTool:
         return {
             'id': 'image-compressor',
             'name': 'Image Compressor',
-            'description': 'Compress PNG or JPG/JPEG images.',
+            'description': 'Compress PNG, JPG/JPEG, WebP or AVIF images, optionally to a target size.',
             'endpoint': '/api/tool/image-compressor/execute',
+            'batch_endpoint': '/api/tool/image-compressor/batch',
             'icon': 'bi-file-earmark-zip'
         }
 
     def register_routes(self, app):
+        register_batch_route(app, '/api/tool/image-compressor/batch', 'image_compressor_batch',
+                             _compress_image_bytes, _parse_compression_params)
+
         @app.route('/api/tool/image-compressor/execute', methods=['POST'])
+        @cpu_bound
         def execute_image_compression():
             if 'file' not in request.files:
                 return jsonify({"error": "No file part"}), 400
@@ -73,24 +173,35 @@ class ImageCompressorTool:
             if file.filename == '':
                 return jsonify({"error": "No selected file"}), 400
 
-            quality = 85 # Default quality
-            input_format = file.filename.split('.')[-1].lower()
-            if input_format in ['jpg', 'jpeg']:
-                try:
-                    # Get quality only if it's relevant
-                    quality = int(request.form.get('quality', 85))
-                except ValueError:
-                    return jsonify({"error": "Invalid quality value, must be an integer."}), 400
+            try:
+                params = _parse_compression_params(request.form)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
 
+            input_format = file.filename.split('.')[-1].lower()
             if input_format not in SUPPORTED_FORMATS:
                  return jsonify({"error": f"Unsupported format: {input_format}. Supported: {SUPPORTED_FORMATS}"}), 400
+            output_format = params['output_format'] or input_format
+            if params['lossless'] and output_format != 'webp':
+                return jsonify({"error": "Lossless mode is only available for WebP output."}), 400
+            if params['target_size_kb'] and output_format == 'png':
+                return jsonify({"error": "target_size_kb needs a lossy format (jpg, webp or avif), not png."}), 400
 
             if file:
-                output_buffer, output_filename, original_size, processed_size, error = _compress_image_logic(file, quality)
+                if wants_async(source_size(file.stream)):
+                    return accepted_response(submit_image_job('image-compressor', _compress_image_bytes, file, params,
+                                                              headers_fn=_compression_headers))
+                cache_key = result_key(_compress_image_bytes, file.filename, file.stream, params)
+                unchanged = not_modified(cache_key)
+                if unchanged:
+                    return unchanged
+                (output_buffer, output_filename, original_size, processed_size, error, details), cache_hit = cached_result(
+                    cache_key, file.filename, lambda: _compress_image_logic(file, **params)
+                )
                 if error:
                     return jsonify({"error": error}), 500
                 if output_buffer and output_filename:
-                    mime_type = f'image/{input_format}' if input_format != 'jpg' else 'image/jpeg'
+                    mime_type = f'image/{output_format}' if output_format != 'jpg' else 'image/jpeg'
                     response = make_response(send_file(
                         output_buffer,
                         mimetype=mime_type,
@@ -100,8 +211,12 @@ class ImageCompressorTool:
                     # Add custom headers for size info
                     response.headers['X-Original-Size'] = str(original_size)
                     response.headers['X-Processed-Size'] = str(processed_size)
+                    compression_headers = _compression_headers(details)
+                    response.headers.update(compression_headers)
                     # Required for frontend JS to read custom headers
-                    response.headers['Access-Control-Expose-Headers'] = 'X-Original-Size, X-Processed-Size, Content-Disposition'
-                    return response
+                    response.headers['Access-Control-Expose-Headers'] = ', '.join(
+                        ['X-Original-Size', 'X-Processed-Size'] + list(compression_headers) + ['Content-Disposition']
+                    )
+                    return add_cache_headers(response, cache_key, cache_hit)
 
-            return jsonify({"error": "File processing failed"}), 500
\ No newline at end of file
+            return jsonify({"error": "File processing failed"}), 500
@@ -1,24 +1,40 @@
 import os
-from io import BytesIO
-from PIL import Image
-from pdf2image import convert_from_bytes
-from flask import request, send_file, jsonify, make_response
+import shutil
+import tempfile
+from pdf2image import convert_from_path, pdfinfo_from_path
+from flask import Response, request, send_file, jsonify, make_response, stream_with_context
+from common.capabilities import has_binary
+from common.config import env_int
+from common.executors import cpu_bound, cpu_slot
+from common.image_batch import register_batch_route, submit_image_job
+from common.image_cache import add_cache_headers, cached_result, not_modified, result_key
+from common.jobs import accepted_response, wants_async
+from common.zip_stream import stream_zip
+from common.image_pipeline import (SAVE_FORMATS, convert_mode, encode_image, open_image, prepare_for_format,
+                                   read_source, source_size)
 
-SUPPORTED_INPUT_FORMATS = ['pdf', 'png', 'jpeg', 'jpg']
-SUPPORTED_OUTPUT_FORMATS = ['png', 'jpg']
+SUPPORTED_INPUT_FORMATS = ['pdf', 'png', 'jpeg', 'jpg'] + [f for f in ('webp', 'avif') if f in SAVE_FORMATS]
+SUPPORTED_OUTPUT_FORMATS = ['png', 'jpg'] + [f for f in ('webp', 'avif') if f in SAVE_FORMATS]
 
-def _convert_image_logic(file_storage):
+# Multi-page PDF rendering: poppler processes per chunk of pages, and limits per request
+PDF_RENDER_THREADS = env_int('PDF_RENDER_THREADS', min(4, os.cpu_count() or 1))
+PDF_MAX_PAGES = env_int('PDF_MAX_PAGES', 500)
+PDF_DEFAULT_DPI = 200
+PDF_DPI_RANGE = (36, 600)
+POPPLER_FORMATS = {'png': 'png', 'jpg': 'jpeg'} # Poppler writes these directly, no Pillow re-encode
+
+def _convert_image_logic(file_storage, output_format='png'):
     """Internal logic for image conversion. Reads file, converts, returns sizes."""
-    input_filename = file_storage.filename
+    # Decode straight from the (spooled) upload stream instead of copying it into memory
+    return _convert_image_bytes(file_storage.filename, file_storage.stream, output_format)
+
+def _convert_image_bytes(input_filename, source, output_format='png'):
+    """Converts an image or PDF given as bytes or a binary file. Request-independent, so it can run in a worker process."""
     input_format = input_filename.split('.')[-1].lower()
+    output_format = output_format.lower()
 
     try:
-        # Read entire file content to accurately get original size
-        file_content = file_storage.read()
-        original_size = len(file_content)
-        file_storage.seek(0) # Reset stream position if needed elsewhere (though not strictly necessary here as we use file_content)
-
-        output_format = request.form.get('output_format', 'png').lower() # Get format from request context
+        original_size = source_size(source)
 
         if input_format not in SUPPORTED_INPUT_FORMATS or output_format not in SUPPORTED_OUTPUT_FORMATS:
             error_msg = f"Unsupported format: input={input_format}, output={output_format}"
@@ -26,31 +42,30 @@ def _convert_image_logic(file_storage):
             return None, None, None, None, error_msg
 
         output_filename = f"{os.path.splitext(input_filename)[0]}_converted.{output_format}"
-        output_buffer = BytesIO()
+        save_format = SAVE_FORMATS[output_format]
 
         if input_format == 'pdf':
-            images = convert_from_bytes(file_content, first_page=1, last_page=1, fmt=output_format)
-            if images:
-                img = images[0]
-                if output_format == 'jpg' and img.mode != 'RGB':
-                    img = img.convert('RGB')
-                img.save(output_buffer, format=output_format.upper())
-            else:
-                error_msg = "Failed to extract image from PDF."
+            if not has_binary('pdftoppm'):
+                error_msg = "PDF conversion requires Poppler (pdftoppm), which is not installed."
                 print(error_msg)
                 return None, None, None, None, error_msg
+            # First page only; the execute endpoint handles page ranges (see _render_pdf_response)
+            with tempfile.TemporaryDirectory(prefix='pdf_render_') as work_dir:
+                pdf_path = os.path.join(work_dir, 'source.pdf')
+                with open(pdf_path, 'wb') as pdf_file:
+                    pdf_file.write(read_source(source))
+                _, path = next(_render_pdf_pages(pdf_path, [1], output_format, PDF_DEFAULT_DPI, None, work_dir))
+                with open_image(path) as img:
+                    img = prepare_for_format(img, save_format)
+                    output_buffer, processed_size = encode_image(img, save_format)
         else:
-            img = Image.open(BytesIO(file_content)) # Open from bytes
-            if output_format == 'jpg' and img.mode != 'RGB':
-                img = img.convert('RGB')
-            elif output_format == 'png' and img.mode == 'P':
-                 img = img.convert('RGBA')
-            # No conversion needed for RGB -> PNG or RGBA -> PNG
+            with open_image(source) as img:
+                if output_format == 'png' and img.mode == 'P':
+                    img = convert_mode(img, 'RGBA')
+                # No conversion needed for RGB -> PNG or RGBA -> PNG
+                img = prepare_for_format(img, save_format)
+                output_buffer, processed_size = encode_image(img, save_format)
 
-            img.save(output_buffer, format=output_format.upper())
-
-        processed_size = output_buffer.tell()
-        output_buffer.seek(0)
         print(f"Conversion - Original: {original_size}, Processed: {processed_size}")
         return output_buffer, output_filename, original_size, processed_size, None
 
@@ -59,19 +74,205 @@ def _convert_image_logic(file_storage):
         print(error_msg)
         return None, None, None, None, error_msg
 
+def _parse_page_ranges(spec, page_count):
+    """Turns '1-3,5,8-' (or 'all') into sorted page numbers within 1..page_count; raises ValueError."""
+    spec = (spec or '1').strip().lower()
+    if spec == 'all':
+        spec = '1-'
+    pages = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if '-' in part:
+                start, end = part.split('-', 1)
+                start = int(start) if start.strip() else 1
+                end = int(end) if end.strip() else page_count
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise ValueError(f"Invalid page range: '{part}'. Use e.g. '1-3,5,8-' or 'all'.")
+        if start < 1 or end < start:
+            raise ValueError(f"Invalid page range: '{part}'.")
+        if start > page_count:
+            raise ValueError(f"Page {start} is out of range, the PDF has {page_count} page(s).")
+        pages.update(range(start, min(end, page_count) + 1))
+    if not pages:
+        raise ValueError("No pages selected.")
+    if len(pages) > PDF_MAX_PAGES:
+        raise ValueError(f"Too many pages selected ({len(pages)}), the limit is {PDF_MAX_PAGES}.")
+    return sorted(pages)
+
+def _parse_pdf_options(form):
+    """Reads dpi and the optional width/height target (pixels, either may be omitted)."""
+    try:
+        dpi = int(form.get('dpi', PDF_DEFAULT_DPI))
+        width = int(form['width']) if form.get('width') else None
+        height = int(form['height']) if form.get('height') else None
+    except ValueError:
+        raise ValueError("dpi, width and height must be integers.")
+    if not PDF_DPI_RANGE[0] <= dpi <= PDF_DPI_RANGE[1]:
+        raise ValueError(f"dpi must be between {PDF_DPI_RANGE[0]} and {PDF_DPI_RANGE[1]}.")
+    if (width is not None and width < 1) or (height is not None and height < 1):
+        raise ValueError("width and height must be positive.")
+    # pdf2image/pdftoppm: scale to fit the given dimension(s), overriding dpi
+    size = (width, height) if width or height else None
+    return dpi, size
+
+def _page_chunks(pages, chunk_size):
+    """Splits sorted page numbers into contiguous runs of at most chunk_size pages."""
+    chunk = []
+    for page in pages:
+        if chunk and (page != chunk[-1] + 1 or len(chunk) == chunk_size):
+            yield chunk
+            chunk = []
+        chunk.append(page)
+    if chunk:
+        yield chunk
+
+def _render_pdf_pages(pdf_path, pages, output_format, dpi, size, work_dir):
+    """
+    Renders pages chunk by chunk: pdftoppm writes each chunk straight to work_dir
+    using PDF_RENDER_THREADS processes, and we yield (page, path) before the next
+    chunk starts, so neither RAM nor the temp dir ever holds the whole document.
+    """
+    for index, chunk in enumerate(_page_chunks(pages, PDF_RENDER_THREADS * 2)):
+        paths = convert_from_path(
+            pdf_path, dpi=dpi, first_page=chunk[0], last_page=chunk[-1],
+            fmt=POPPLER_FORMATS.get(output_format, 'png'), size=size,
+            output_folder=work_dir, output_file=f"chunk{index}_", paths_only=True,
+            thread_count=min(PDF_RENDER_THREADS, len(chunk))
+        )
+        if len(paths) != len(chunk):
+            raise RuntimeError(f"Poppler rendered {len(paths)} of {len(chunk)} page(s) starting at page {chunk[0]}.")
+        # Threads cover consecutive page blocks, so paths are in page order
+        for page, path in zip(chunk, paths):
+            if output_format not in POPPLER_FORMATS:
+                path = _reencode_page(path, output_format)
+            yield page, path
+
+def _reencode_page(path, output_format):
+    """Converts a page Poppler rendered as PNG to a format it can't write (WebP, AVIF); returns the new path."""
+    save_format = SAVE_FORMATS[output_format]
+    target = f"{os.path.splitext(path)[0]}.{output_format}"
+    with open_image(path) as img:
+        prepare_for_format(img, save_format).save(target, format=save_format)
+    os.remove(path)
+    return target
+
+def _render_pdf_response(file, output_format, form):
+    """
+    Handles a PDF upload on the execute endpoint: one selected page comes back as an
+    image like before, several pages as a streamed ZIP.
+    """
+    for binary in ('pdftoppm', 'pdfinfo'):
+        if not has_binary(binary):
+            return jsonify({"error": f"PDF conversion requires Poppler ({binary}), which is not installed."}), 500
+
+    work_dir = tempfile.mkdtemp(prefix='pdf_render_')
+    try:
+        # Poppler reads the document from disk instead of an in-memory blob
+        pdf_path = os.path.join(work_dir, 'source.pdf')
+        with open(pdf_path, 'wb') as pdf_file:
+            shutil.copyfileobj(file.stream, pdf_file)
+        original_size = os.path.getsize(pdf_path)
+        try:
+            dpi, size = _parse_pdf_options(form)
+            page_count = int(pdfinfo_from_path(pdf_path)['Pages'])
+            pages = _parse_page_ranges(form.get('pages', '1'), page_count)
+        except ValueError as e:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        error_msg = f"Error reading PDF: {e}"
+        print(error_msg)
+        return jsonify({"error": error_msg}), 500
+
+    stem = os.path.splitext(file.filename)[0]
+    mimetype = 'image/jpeg' if output_format == 'jpg' else f'image/{output_format}'
+    print(f"PDF render - {len(pages)} of {page_count} page(s) at {dpi} dpi, size={size}")
+
+    if len(pages) == 1:
+        try:
+            _, path = next(_render_pdf_pages(pdf_path, pages, output_format, dpi, size, work_dir))
+            rendered = open(path, 'rb') # Stays readable after the directory is removed (POSIX)
+            processed_size = os.fstat(rendered.fileno()).st_size
+        except Exception as e:
+            error_msg = f"Error during PDF rendering: {e}"
+            print(error_msg)
+            return jsonify({"error": error_msg}), 500
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        response = make_response(send_file(
+            rendered,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=f"{stem}_converted.{output_format}"
+        ))
+        response.content_length = processed_size
+        response.headers['X-Original-Size'] = str(original_size)
+        response.headers['X-Processed-Size'] = str(processed_size)
+        response.headers['Access-Control-Expose-Headers'] = 'X-Original-Size, X-Processed-Size, Content-Disposition'
+        return response
+
+    def entries():
+        try:
+            previous = None
+            rendered = _render_pdf_pages(pdf_path, pages, output_format, dpi, size, work_dir)
+            while True:
+                # The @cpu_bound slot is released once the view returns; rendering while streaming
+                # takes one again per step, but not while the ZIP is being sent to the client
+                with cpu_slot():
+                    item = next(rendered, None)
+                if item is None:
+                    break
+                page, path = item
+                if previous:
+                    os.remove(previous) # Already written into the ZIP
+                yield f"{stem}_page{page:0{len(str(page_count))}d}.{output_format}", path
+                previous = path
+        finally:
+            # Also runs when the client disconnects mid-stream
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    response = Response(stream_with_context(stream_zip(entries())), mimetype='application/zip', headers={
+        'Content-Disposition': f'attachment; filename="{stem}_pages.zip"',
+        'X-Original-Size': str(original_size),
+        'X-Page-Count': str(len(pages)),
+        'Access-Control-Expose-Headers': 'X-Original-Size, X-Page-Count, Content-Disposition',
+        'X-Accel-Buffering': 'no',
+    })
+    # The generator's cleanup never runs if the response is dropped before streaming starts
+    response.call_on_close(lambda: shutil.rmtree(work_dir, ignore_errors=True))
+    return response
+
+def _parse_batch_params(form):
+    """Reads the output format shared by every file in a batch."""
+    output_format = form.get('output_format', 'png').lower()
+    if output_format not in SUPPORTED_OUTPUT_FORMATS:
+        raise ValueError(f"Invalid output format: {output_format}. Supported: {SUPPORTED_OUTPUT_FORMATS}")
+    return {'output_format': output_format}
+
 
 class ImageConverterTool:
     def get_info(self):
         return {
             'id': 'image-converter',
             'name': 'Image Converter',
-            'description': 'Convert image formats (PDF, PNG, JPG/JPEG to PNG or JPG).',
+            'description': 'Convert image formats (PDF, PNG, JPG/JPEG to PNG, JPG, WebP or AVIF).',
             'endpoint': '/api/tool/image-converter/execute',
+            'batch_endpoint': '/api/tool/image-converter/batch',
             'icon': 'bi-arrow-left-right'
         }
 
     def register_routes(self, app):
+        register_batch_route(app, '/api/tool/image-converter/batch', 'image_converter_batch',
+                             _convert_image_bytes, _parse_batch_params)
+
         @app.route('/api/tool/image-converter/execute', methods=['POST'])
+        @cpu_bound
         def execute_image_conversion():
             if 'file' not in request.files:
                 return jsonify({"error": "No file part"}), 400
@@ -79,20 +280,34 @@ class ImageConverterTool:
             if file.filename == '':
                 return jsonify({"error": "No selected file"}), 400
 
-            output_format = request.form.get('output_format', 'png').lower() # Still needed for logic fn
+            output_format = request.form.get('output_format', 'png').lower()
             if output_format not in SUPPORTED_OUTPUT_FORMATS:
                  return jsonify({"error": f"Invalid output format: {output_format}. Supported: {SUPPORTED_OUTPUT_FORMATS}"}), 400
 
+            if file.filename.split('.')[-1].lower() == 'pdf':
+                # Page ranges are streamed as they render; there is no single result to park in a job
+                if request.values.get('async', 'false').lower() == 'true':
+                    return jsonify({"error": "async=true is not supported for PDF input."}), 400
+                return _render_pdf_response(file, output_format, request.form)
+
             if file:
-                # Pass file storage directly, logic function now handles reading and format
-                output_buffer, output_filename, original_size, processed_size, error = _convert_image_logic(file)
+                params = {'output_format': output_format}
+                if wants_async(source_size(file.stream)):
+                    return accepted_response(submit_image_job('image-converter', _convert_image_bytes, file, params))
+                cache_key = result_key(_convert_image_bytes, file.filename, file.stream, params)
+                unchanged = not_modified(cache_key)
+                if unchanged:
+                    return unchanged
+                (output_buffer, output_filename, original_size, processed_size, error), cache_hit = cached_result(
+                    cache_key, file.filename, lambda: _convert_image_logic(file, output_format)
+                )
 
                 if error:
                     return jsonify({"error": error}), 500
                 if output_buffer and output_filename:
                     response = make_response(send_file(
                         output_buffer,
-                        mimetype=f'image/{output_format}',
+                        mimetype='image/jpeg' if output_format == 'jpg' else f'image/{output_format}',
                         as_attachment=True,
                         download_name=output_filename
                     ))
@@ -101,6 +316,6 @@ class ImageConverterTool:
                     response.headers['X-Processed-Size'] = str(processed_size)
                     # Required for frontend JS to read custom headers
                     response.headers['Access-Control-Expose-Headers'] = 'X-Original-Size, X-Processed-Size, Content-Disposition'
-                    return response
+                    return add_cache_headers(response, cache_key, cache_hit)
 
             return jsonify({"error": "File processing failed"}), 500
\ No newline at end of file
@@ -0,0 +1,18 @@
+from common.image_pipeline import register_pipeline_routes
+
+
+class ImagePipelineTool:
+    """Single-pass resize/convert/compress endpoint built from the image tools' shared stages (API only)."""
+
+    def get_info(self):
+        return {
+            'id': 'image-pipeline',
+            'name': 'Image Pipeline',
+            'description': 'Resize, convert and compress an image in one pass.',
+            'endpoint': '/api/tool/image-pipeline/execute',
+            'batch_endpoint': '/api/tool/image-pipeline/batch',
+            'icon': 'bi-layers'
+        }
+
+    def register_routes(self, app):
+        register_pipeline_routes(app)
@@ -1,13 +1,24 @@
 import os
-from io import BytesIO
-from PIL import Image
 from flask import request, send_file, jsonify, make_response
+from common.executors import cpu_bound
+from common.image_batch import register_batch_route, submit_image_job
+from common.image_cache import add_cache_headers, cached_result, not_modified, result_key
+from common.jobs import accepted_response, wants_async
+from common.image_pipeline import (DEFAULT_RESAMPLE_QUALITY, RESIZE_PROFILES, encode_image, open_image,
+                                   prepare_for_format, resize_image, source_size)
 
 SUPPORTED_FORMATS = ['png', 'jpeg', 'jpg']
 
-def _resize_image_logic(file_storage, target_width, target_height, maintain_aspect_ratio=True):
+def _resize_image_logic(file_storage, target_width, target_height, maintain_aspect_ratio=True,
+                        resample_quality=DEFAULT_RESAMPLE_QUALITY):
     """Internal logic for image resizing. Reads file, resizes, returns sizes."""
-    input_filename = file_storage.filename
+    # Decode straight from the (spooled) upload stream instead of copying it into memory
+    return _resize_image_bytes(file_storage.filename, file_storage.stream, target_width, target_height,
+                               maintain_aspect_ratio, resample_quality)
+
+def _resize_image_bytes(input_filename, source, target_width, target_height, maintain_aspect_ratio=True,
+                        resample_quality=DEFAULT_RESAMPLE_QUALITY):
+    """Resizes an image given as bytes or a binary file. Request-independent, so it can run in a worker process."""
     input_format = input_filename.split('.')[-1].lower()
 
     if input_format not in SUPPORTED_FORMATS:
@@ -16,51 +27,54 @@ def _resize_image_logic(file_storage, target_width, target_height, maintain_aspe
         return None, None, None, None, error_msg
 
     output_filename = f"{os.path.splitext(input_filename)[0]}_resized.{input_format}"
-    output_buffer = BytesIO()
 
     try:
-        # Read entire file content to accurately get original size
-        file_content = file_storage.read()
-        original_size = len(file_content)
-        file_storage.seek(0) # Reset stream
-
-        img = Image.open(BytesIO(file_content)) # Open from bytes
-        original_width, original_height = img.size
-
-        save_format = 'JPEG' if input_format in ['jpg', 'jpeg'] else 'PNG'
-        if save_format == 'JPEG' and img.mode != 'RGB':
-            img = img.convert('RGB')
+        original_size = source_size(source)
 
-        new_size = (target_width, target_height)
+        with open_image(source) as img:
+            original_width, original_height = img.size
 
-        if maintain_aspect_ratio:
-            img.thumbnail(new_size, Image.Resampling.LANCZOS)
+            save_format = 'JPEG' if input_format in ['jpg', 'jpeg'] else 'PNG'
+            # Resize before any mode conversion: converting loads the full-size pixels and rules out draft decoding
+            img = resize_image(img, target_width, target_height, maintain_aspect_ratio, resample_quality)
+            img = prepare_for_format(img, save_format)
             final_size = img.size
-        else:
-            img = img.resize(new_size, Image.Resampling.LANCZOS)
-            final_size = new_size
 
-        print(f"Resizing - Original: {original_width}x{original_height}, Resized to: {final_size[0]}x{final_size[1]}")
+            print(f"Resizing - Original: {original_width}x{original_height}, Resized to: {final_size[0]}x{final_size[1]}")
 
-        save_kwargs = {}
-        if save_format == 'JPEG':
-            save_kwargs['quality'] = 95
-            save_kwargs['optimize'] = True
-        elif save_format == 'PNG':
-             save_kwargs['optimize'] = True
+            save_kwargs = {'optimize': True}
+            if save_format == 'JPEG':
+                save_kwargs['quality'] = 95
 
-        img.save(output_buffer, format=save_format, **save_kwargs)
-
-        processed_size = output_buffer.tell()
-        output_buffer.seek(0)
-        print(f"Resizing - Original Size: {original_size}, Processed Size: {processed_size}")
-        return output_buffer, output_filename, original_size, processed_size, None
+            output_buffer, processed_size = encode_image(img, save_format, **save_kwargs)
+            print(f"Resizing - Original Size: {original_size}, Processed Size: {processed_size}")
+            return output_buffer, output_filename, original_size, processed_size, None
 
     except Exception as e:
         error_msg = f"Error during image resizing: {e}"
         print(error_msg)
         return None, None, None, None, error_msg
 
+def _parse_resample_quality(form):
+    resample_quality = form.get('resample_quality', DEFAULT_RESAMPLE_QUALITY).lower()
+    if resample_quality not in RESIZE_PROFILES:
+        raise ValueError(f"Invalid resample_quality: {resample_quality}. Supported: {list(RESIZE_PROFILES)}")
+    return resample_quality
+
+def _parse_batch_params(form):
+    """Reads the resize options shared by every file in a batch."""
+    try:
+        target_width = int(form.get('width'))
+        target_height = int(form.get('height'))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid width or height provided. Must be integers.")
+    return {
+        'target_width': target_width,
+        'target_height': target_height,
+        'maintain_aspect_ratio': form.get('maintain_aspect_ratio', 'true').lower() == 'true',
+        'resample_quality': _parse_resample_quality(form),
+    }
+
 
 class ImageResizerTool:
     def get_info(self):
@@ -69,11 +83,16 @@ class ImageResizerTool:
             'name': 'Image Resizer',
             'description': 'Resize PNG or JPG/JPEG images to specific dimensions.',
             'endpoint': '/api/tool/image-resizer/execute',
+            'batch_endpoint': '/api/tool/image-resizer/batch',
             'icon': 'bi-aspect-ratio'
         }
 
     def register_routes(self, app):
+        register_batch_route(app, '/api/tool/image-resizer/batch', 'image_resizer_batch',
+                             _resize_image_bytes, _parse_batch_params)
+
         @app.route('/api/tool/image-resizer/execute', methods=['POST'])
+        @cpu_bound
         def execute_image_resizing():
             if 'file' not in request.files:
                 return jsonify({"error": "No file part"}), 400
@@ -88,14 +107,31 @@ class ImageResizerTool:
                  return jsonify({"error": "Invalid width or height provided. Must be integers."}), 400
 
             maintain_aspect_ratio = request.form.get('maintain_aspect_ratio', 'true').lower() == 'true'
+            try:
+                resample_quality = _parse_resample_quality(request.form)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
 
             input_format = file.filename.split('.')[-1].lower()
             if input_format not in SUPPORTED_FORMATS:
                  return jsonify({"error": f"Unsupported format: {input_format}. Supported: {SUPPORTED_FORMATS}"}), 400
 
             if file:
-                output_buffer, output_filename, original_size, processed_size, error = _resize_image_logic(
-                    file, target_width, target_height, maintain_aspect_ratio
+                # Same parameters as the batch route, so both share cache entries
+                params = {
+                    'target_width': target_width,
+                    'target_height': target_height,
+                    'maintain_aspect_ratio': maintain_aspect_ratio,
+                    'resample_quality': resample_quality,
+                }
+                if wants_async(source_size(file.stream)):
+                    return accepted_response(submit_image_job('image-resizer', _resize_image_bytes, file, params))
+                cache_key = result_key(_resize_image_bytes, file.filename, file.stream, params)
+                unchanged = not_modified(cache_key)
+                if unchanged:
+                    return unchanged
+                (output_buffer, output_filename, original_size, processed_size, error), cache_hit = cached_result(
+                    cache_key, file.filename, lambda: _resize_image_logic(file, **params)
                 )
                 if error:
                     return jsonify({"error": error}), 500
@@ -112,6 +148,6 @@ class ImageResizerTool:
                     response.headers['X-Processed-Size'] = str(processed_size)
                     # Required for frontend JS to read custom headers
                     response.headers['Access-Control-Expose-Headers'] = 'X-Original-Size, X-Processed-Size, Content-Disposition'
-                    return response
+                    return add_cache_headers(response, cache_key, cache_hit)
 
             return jsonify({"error": "File processing failed"}), 500
\ No newline at end of file
@@ -1,24 +1,128 @@
-from flask import request, send_file, jsonify, Response, Blueprint
+from flask import request, send_file, jsonify, Response, Blueprint, stream_with_context
 import yt_dlp
 import os
 import tempfile
 from pathlib import Path
-import subprocess
 import sys
 import json
-import time
+import copy
+import mimetypes
 import threading
+import time
+import uuid
 from typing import Optional
 import re
+import shutil
 import atexit # Import atexit for cleanup
 import tempfile # Ensure tempfile is imported
+from common.capabilities import has_binary
+from common.child_processes import terminate_children
+from common.config import STATE_DIR, env_float, env_int
+from common.download_cache import DownloadCache, make_cache_key
+from common.download_queue import DownloadQueue
+from common.executors import get_io_pool
+from common.jobs import DEFERRED, accepted_response, complete_job, current_job_id, job_store, submit_job
+from common.progress_events import ProgressBroadcaster
+from common.progress_store import FINISHED_STATUSES, create_progress_store
+from common.zip_stream import stream_zip
+from common.metadata_cache import (canonical_video_id, extract_video_info, invalidate_video_info,
+                                   iter_batch_entries, video_info_cache)
 
 # Configure the download directory (relative to the backend directory)
 DOWNLOAD_DIR = Path("../downloads")
 DOWNLOAD_DIR.mkdir(exist_ok=True)
 
-# Store download progress - structure will be updated by the hook
-download_progress = {}
+# Finished downloads are kept here by content key (video, format, postprocessing) and reused
+CACHE_DIR = DOWNLOAD_DIR / 'cache'
+CACHE_MAX_BYTES = env_int('YTDL_CACHE_MAX_BYTES', 20 * 1024 ** 3)
+CACHE_DB_PATH = STATE_DIR / 'download_cache.sqlite3'
+
+# Download scheduler settings: at most this many yt-dlp/ffmpeg pipelines run at once
+MAX_CONCURRENT_DOWNLOADS = env_int('YTDL_MAX_CONCURRENT_DOWNLOADS', 2)
+QUEUE_DB_PATH = STATE_DIR / 'download_queue.sqlite3'
+# Parallel fragment downloads per job for DASH/HLS formats
+CONCURRENT_FRAGMENTS = env_int('YTDL_CONCURRENT_FRAGMENTS', 4)
+# Finished files may be cached by the browser this long (seconds)
+FILE_MAX_AGE = env_int('YTDL_FILE_MAX_AGE', 3600)
+# How long /stream waits for the first downloaded bytes before giving up (seconds)
+STREAM_START_TIMEOUT = env_int('YTDL_STREAM_START_TIMEOUT', 60)
+STREAM_CHUNK_SIZE = 256 * 1024
+# How often /execute jobs waiting for downloads check for job cancels and downloads finished
+# by other server processes (local downloads report their terminal event immediately)
+JOB_WATCH_INTERVAL = 1.0
+# Downloads that clients stopped following (progress polls, SSE, batch status, jobs) are
+# cancelled after this many seconds (0 = never). Downloads nobody ever followed are left alone.
+IDLE_CANCEL_SECONDS = env_float('YTDL_IDLE_CANCEL_SECONDS', 120)
+# Clients following a download refresh its last_seen_at at most this often
+WATCH_WRITE_INTERVAL = max(1.0, IDLE_CANCEL_SECONDS / 4)
+# How often a running download checks for cancel requests (made by any process) and idleness
+CANCEL_CHECK_INTERVAL = 1.0
+# Upper bound on videos a single batch/playlist request may expand to
+BATCH_MAX_ITEMS = env_int('YTDL_BATCH_MAX_ITEMS', 500)
+
+# Server-Sent Events: minimum seconds between batches sent to one client, and keep-alive period
+SSE_MIN_INTERVAL = env_float('YTDL_SSE_MIN_INTERVAL', 0.5)
+SSE_HEARTBEAT_INTERVAL = 15
+# Idle-tick period: re-checks queue positions and picks up updates written by other worker processes
+SSE_QUEUE_CHECK_INTERVAL = 2
+
+# Store download progress - structure will be updated by the hook.
+# Thread-safe, bounded and expiring; PROGRESS_STORE=sqlite shares it between worker processes.
+download_progress = create_progress_store('youtube_downloader')
+# Pushes progress snapshots to /progress/stream subscribers
+progress_events = ProgressBroadcaster()
+download_progress.add_listener(progress_events.publish)
+
+# The hook fires for every received chunk; persist 'downloading' updates at most this often per video
+HOOK_MIN_INTERVAL = 0.25
+_last_hook_write = {}
+_last_watch_write = {}
+
+
+class ActiveDownload:
+    """A download running in this process. Once cancelled, the yt-dlp hooks raise and its watcher stops ffmpeg."""
+
+    def __init__(self, video_id, temp_dir):
+        self.video_id = video_id
+        self.temp_dir = temp_dir
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+        self.reason = None
+
+    def cancel(self, reason):
+        if not self.cancelled.is_set():
+            self.reason = reason
+            self.cancelled.set()
+
+    def raise_if_cancelled(self):
+        if self.cancelled.is_set():
+            raise yt_dlp.utils.DownloadCancelled(self.reason)
+
+
+# Downloads running in this process, by video ID
+_active_downloads = {}
+
+def new_progress_entry(video_id, url, title, status='info_loaded'):
+    """Builds a fresh progress-tracking entry for a video."""
+    return {
+        'video_id': video_id,
+        'url': url,
+        'title': title,
+        'status': status,
+        'progress': 0,
+        'speed': 'N/A',
+        'eta': 'N/A',
+        'filename': None,
+        'error': None,
+        'queue_position': None,
+        '_temp_filename': None,
+        '_partial_filename': None,
+        '_streamable': False
+    }
+
+def sanitize_title(title):
+    """Turns a video title into a safe file name stem."""
+    return "".join(c if c.isalnum() or c in (' ', '-', '_') else '_' for c in title).strip()
 
 def my_progress_hook(d):
     # Attempt to get video_id from info_dict first
@@ -31,62 +135,143 @@ def my_progress_hook(d):
          # For now, assume ID is usually available when 'downloading' status occurs
          pass # Placeholder for more complex filename-to-ID mapping if needed
 
-    # If we have an ID and it's being tracked
-    if video_id and video_id in download_progress:
-        current_status = download_progress[video_id]
-        hook_status = d['status']
-
-        if hook_status == 'downloading':
-            total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
-            downloaded_bytes = d.get('downloaded_bytes')
-            speed = d.get('speed')
-            eta = d.get('eta')
-
-            if total_bytes and downloaded_bytes is not None: # Ensure downloaded_bytes is not None
-                current_status['progress'] = round((downloaded_bytes / total_bytes) * 100, 1)
-            else:
-                # Keep previous progress or 0 if unknown
-                current_status['progress'] = current_status.get('progress', 0)
-
-            current_status['speed'] = f"{speed / 1024 / 1024:.2f} MB/s" if speed else "N/A"
-            # Format ETA nicely
-            if eta is not None:
-                 minutes, seconds = divmod(int(eta), 60)
-                 current_status['eta'] = f"{minutes:02d}:{seconds:02d}"
-            else:
-                 current_status['eta'] = "N/A"
-
-            current_status['status'] = 'downloading'
-
-        elif hook_status == 'finished':
-            # This hook might fire before post-processing. Mark progress 100%.
-            # The final 'completed' status is set after ydl.download() finishes successfully.
-            current_status['progress'] = 100
-            # Store the temporary filename from the hook if available
-            if 'filename' in d:
-                 current_status['_temp_filename'] = d['filename']
-            # Don't set status to 'completed' here yet, wait for thread confirmation
-
-        elif hook_status == 'error':
-            current_status['status'] = 'error'
-            current_status['error'] = d.get('error', 'yt-dlp download error') # Get specific error if provided
-            current_status['progress'] = 0 # Reset progress on error
+    if not video_id:
+        return
 
-        # Update the global dictionary (ensure thread safety if scaling needed, but ok for now)
-        download_progress[video_id] = current_status
-    # else:
-        # Optional: Handle cases where hook is called for an untracked ID
-        # print(f"Warning: Progress hook called for an untracked ID. Data: {d}")
+    # Raising here makes yt-dlp abandon the download (including parallel fragment downloads)
+    active = _active_downloads.get(video_id)
+    if active is not None:
+        active.raise_if_cancelled()
+
+    hook_status = d['status']
+    changes = {}
+
+    if hook_status == 'downloading':
+        now = time.monotonic()
+        if now - _last_hook_write.get(video_id, 0) < HOOK_MIN_INTERVAL:
+            return
+        _last_hook_write[video_id] = now
+
+        total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
+        downloaded_bytes = d.get('downloaded_bytes')
+        speed = d.get('speed')
+        eta = d.get('eta')
+
+        if total_bytes and downloaded_bytes is not None: # Ensure downloaded_bytes is not None
+            changes['progress'] = round((downloaded_bytes / total_bytes) * 100, 1)
+        # else: keep previous progress if unknown
+
+        changes['speed'] = f"{speed / 1024 / 1024:.2f} MB/s" if speed else "N/A"
+        # Raw numbers for aggregate (batch) reporting
+        changes['speed_bps'] = speed or 0
+        changes['downloaded_bytes'] = downloaded_bytes or 0
+        changes['total_bytes'] = total_bytes
+        # Partial file for /stream; only single-file formats with audio and video can be played while growing
+        info = d.get('info_dict', {})
+        changes['_partial_filename'] = d.get('tmpfilename')
+        changes['_streamable'] = info.get('vcodec') not in (None, 'none') and info.get('acodec') not in (None, 'none')
+        # Format ETA nicely
+        if eta is not None:
+             minutes, seconds = divmod(int(eta), 60)
+             changes['eta'] = f"{minutes:02d}:{seconds:02d}"
+        else:
+             changes['eta'] = "N/A"
+
+        changes['status'] = 'downloading'
+
+    elif hook_status == 'finished':
+        _last_hook_write.pop(video_id, None)
+        # This hook might fire before post-processing. Mark progress 100%.
+        # The final 'completed' status is set after ydl.download() finishes successfully.
+        changes['progress'] = 100
+        changes['speed_bps'] = 0
+        # Store the temporary filename from the hook if available
+        if 'filename' in d:
+             changes['_temp_filename'] = d['filename']
+        # Don't set status to 'completed' here yet, wait for thread confirmation
+
+    elif hook_status == 'error':
+        _last_hook_write.pop(video_id, None)
+        changes['status'] = 'error'
+        changes['error'] = d.get('error', 'yt-dlp download error') # Get specific error if provided
+        changes['progress'] = 0 # Reset progress on error
+
+    # Atomic merge into the tracked entry; untracked IDs are ignored
+    if changes:
+        download_progress.update(video_id, **changes)
+
+
+def my_postprocessor_hook(d):
+    """Keeps a cancelled download from starting its next postprocessing step (merge, conversion)."""
+    active = _active_downloads.get(d.get('info_dict', {}).get('id'))
+    if active is not None:
+        active.raise_if_cancelled()
+
+def touch_watcher(video_id, entry=None):
+    """Records that a client still follows a download, so idle detection leaves it running."""
+    if IDLE_CANCEL_SECONDS <= 0:
+        return
+    if entry is not None and entry.get('status') in FINISHED_STATUSES:
+        _last_watch_write.pop(video_id, None)
+        return
+    now = time.monotonic()
+    if now - _last_watch_write.get(video_id, 0) < WATCH_WRITE_INTERVAL:
+        return
+    _last_watch_write[video_id] = now
+    download_progress.update(video_id, last_seen_at=time.time())
 
+def cancel_reason(video_id, entry) -> Optional[str]:
+    """Why a download should stop: an explicit cancel request, or clients that stopped following it."""
+    if entry is None:
+        return None
+    if entry.get('cancel_requested'):
+        return entry['cancel_requested']
+    last_seen = entry.get('last_seen_at')
+    if (IDLE_CANCEL_SECONDS > 0 and last_seen and time.time() - last_seen > IDLE_CANCEL_SECONDS
+            and not progress_events.subscriber_count(video_id)):
+        return f"No client has followed this download for {int(IDLE_CANCEL_SECONDS)} seconds."
+    return None
+
+def watch_download(active: ActiveDownload):
+    """
+    Runs beside a download: picks up cancel requests (which may arrive in another server
+    process) and idle timeouts, and terminates ffmpeg processes working in the download's
+    temp directory, since ffmpeg never calls the progress hook.
+    """
+    while not active.finished.wait(CANCEL_CHECK_INTERVAL):
+        if not active.cancelled.is_set():
+            reason = cancel_reason(active.video_id, download_progress.get(active.video_id))
+            if reason:
+                active.cancel(reason)
+        if active.cancelled.is_set():
+            stopped = terminate_children(active.temp_dir)
+            if stopped:
+                print(f"Stopped {stopped} ffmpeg process(es) of cancelled download {active.video_id}")
+
+def cancel_download(video_id, reason='Cancelled by user.') -> Optional[dict]:
+    """
+    Cancels a queued or running download and returns its progress entry. Queued jobs leave
+    the queue right away; running ones are flagged and stop within CANCEL_CHECK_INTERVAL
+    in whichever process runs them, removing their temp files.
+    """
+    entry = download_progress.get(video_id)
+    if entry is None or entry['status'] in FINISHED_STATUSES:
+        return entry
+    job = download_queue.get_active_job(video_id)
+    if job is None:
+        return entry # Nothing queued or running (e.g. only the info was fetched)
+    if job['state'] == 'queued' and download_queue.cancel_queued(job['job_id'], reason):
+        print(f"Cancelled queued download {video_id}: {reason}")
+        return download_progress.update(video_id, status='cancelled', error=reason, queue_position=None)
+    entry = download_progress.update(video_id, cancel_requested=reason)
+    active = _active_downloads.get(video_id)
+    if active is not None:
+        active.cancel(reason)
+    return entry
 
 def check_ffmpeg_installed():
-    """Check if ffmpeg is installed and available in PATH"""
-    try:
-        # Use shell=True on Windows if PATH issues persist, but False is safer
-        subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True, text=True)
-        return True
-    except (subprocess.SubprocessError, FileNotFoundError):
-        return False
+    """Check if ffmpeg is installed and available in PATH (uses the cached capability probe)"""
+    return has_binary('ffmpeg')
 
 def write_cookies_to_temp_file(cookies_string: str) -> Optional[str]:
     """Writes a cookie string to a temporary file and returns the path."""
@@ -106,112 +291,138 @@ def write_cookies_to_temp_file(cookies_string: str) -> Optional[str]:
         return None
 
 def get_video_info(url, cookies_file: Optional[str] = None):
-    """Get video information using yt-dlp"""
-    ydl_opts = {
-        'quiet': True,
-        'no_warnings': True,
-        'skip_download': True, # Ensure we only fetch info
-    }
+    """Get video information using yt-dlp (served from the shared metadata cache)"""
+    try:
+        info = extract_video_info(url, cookies_file)
+
+        # Extract available formats with detailed information
+        available_formats = []
+        seen_formats = set() # Avoid duplicates
+
+        for f in info.get('formats', []):
+            # Ensure necessary keys exist and format is somewhat useful (has height or is audio-only)
+            if (f.get('height') or f.get('acodec') != 'none') and f.get('format_id'):
+                # Create a unique key for the format to avoid duplicates
+                format_key = (f.get('height'), f.get('fps'), f.get('vcodec'), f.get('acodec'), f.get('ext'))
+                if format_key in seen_formats:
+                    continue
+                seen_formats.add(format_key)
+
+                format_info = {
+                    'height': f.get('height'), # Can be None for audio
+                    'ext': f.get('ext', ''),
+                    'format_note': f.get('format_note', ''),
+                    'format_id': f.get('format_id'),
+                    'acodec': f.get('acodec', 'none'),
+                    'vcodec': f.get('vcodec', 'none'),
+                    'filesize': f.get('filesize') or f.get('filesize_approx'), # Use estimate if exact is missing
+                    'fps': f.get('fps'), # Can be None
+                }
+                available_formats.append(format_info)
+
+        # Sort formats: Best video (height, fps, filesize) first, then audio
+        available_formats.sort(key=lambda x: (
+            -x['height'] if x['height'] else 0, # Height descending (treat None as 0)
+            -x['fps'] if x['fps'] else 0,       # FPS descending (treat None as 0)
+            -x['filesize'] if x['filesize'] else 0, # Filesize descending (treat None as 0)
+            x['vcodec'] == 'none' # Put audio-only formats last
+        ))
+
+        # Create format options for the dropdown
+        format_options = []
+        seen_heights = set()
+
+        # Add 'best' option first
+        format_options.append({
+            'height': 'best', 'format_id': 'best', 'ext': 'mp4',
+            'format_note': 'Best Available', 'fps': None,
+            'has_audio': True, 'has_video': True
+        })
+
+        for fmt in available_formats:
+             # Only add video options with height, avoid duplicates
+             height = fmt['height']
+             if height and height not in seen_heights:
+                 seen_heights.add(height)
+                 format_options.append({
+                     'height': height,
+                     'format_id': fmt['format_id'], # Keep format_id for potential future use
+                     'ext': fmt['ext'],
+                     'format_note': fmt['format_note'],
+                     'fps': fmt['fps'],
+                     'has_audio': fmt['acodec'] != 'none',
+                     'has_video': fmt['vcodec'] != 'none'
+                 })
 
-    if cookies_file:
-         ydl_opts['cookiefile'] = cookies_file
-    # else: # Removed fallback to prevent errors when cookiefile is provided
-    #      ydl_opts['cookiesfrombrowser'] = ('brave',)
+        return {
+            'id': info.get('id', ''),
+            'title': info.get('title', 'Unknown Title'),
+            'thumbnail': info.get('thumbnail', ''),
+            'duration': info.get('duration', 0),
+            'available_formats': format_options,
+            'ffmpeg_installed': check_ffmpeg_installed()
+        }
+    except Exception as e:
+        print(f"Error getting video info for {url}: {e}")
+        return {'error': f'Failed to get video info: {str(e)}'}
 
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        try:
-            info = ydl.extract_info(url, download=False)
-
-            # Extract available formats with detailed information
-            available_formats = []
-            seen_formats = set() # Avoid duplicates
-
-            for f in info.get('formats', []):
-                # Ensure necessary keys exist and format is somewhat useful (has height or is audio-only)
-                if (f.get('height') or f.get('acodec') != 'none') and f.get('format_id'):
-                    # Create a unique key for the format to avoid duplicates
-                    format_key = (f.get('height'), f.get('fps'), f.get('vcodec'), f.get('acodec'), f.get('ext'))
-                    if format_key in seen_formats:
-                        continue
-                    seen_formats.add(format_key)
-
-                    format_info = {
-                        'height': f.get('height'), # Can be None for audio
-                        'ext': f.get('ext', ''),
-                        'format_note': f.get('format_note', ''),
-                        'format_id': f.get('format_id'),
-                        'acodec': f.get('acodec', 'none'),
-                        'vcodec': f.get('vcodec', 'none'),
-                        'filesize': f.get('filesize') or f.get('filesize_approx'), # Use estimate if exact is missing
-                        'fps': f.get('fps'), # Can be None
-                    }
-                    available_formats.append(format_info)
-
-            # Sort formats: Best video (height, fps, filesize) first, then audio
-            available_formats.sort(key=lambda x: (
-                -x['height'] if x['height'] else 0, # Height descending (treat None as 0)
-                -x['fps'] if x['fps'] else 0,       # FPS descending (treat None as 0)
-                -x['filesize'] if x['filesize'] else 0, # Filesize descending (treat None as 0)
-                x['vcodec'] == 'none' # Put audio-only formats last
-            ))
 
-            # Create format options for the dropdown
-            format_options = []
-            seen_heights = set()
-
-            # Add 'best' option first
-            format_options.append({
-                'height': 'best', 'format_id': 'best', 'ext': 'mp4',
-                'format_note': 'Best Available', 'fps': None,
-                'has_audio': True, 'has_video': True
-            })
-
-            for fmt in available_formats:
-                 # Only add video options with height, avoid duplicates
-                 height = fmt['height']
-                 if height and height not in seen_heights:
-                     seen_heights.add(height)
-                     format_options.append({
-                         'height': height,
-                         'format_id': fmt['format_id'], # Keep format_id for potential future use
-                         'ext': fmt['ext'],
-                         'format_note': fmt['format_note'],
-                         'fps': fmt['fps'],
-                         'has_audio': fmt['acodec'] != 'none',
-                         'has_video': fmt['vcodec'] != 'none'
-                     })
-
-            return {
-                'id': info.get('id', ''),
-                'title': info.get('title', 'Unknown Title'),
-                'thumbnail': info.get('thumbnail', ''),
-                'duration': info.get('duration', 0),
-                'available_formats': format_options,
-                'ffmpeg_installed': check_ffmpeg_installed()
-            }
-        except Exception as e:
-            print(f"Error getting video info for {url}: {e}")
-            return {'error': f'Failed to get video info: {str(e)}'}
+def build_format_opts(format_type='mp4', quality='best'):
+    """yt-dlp options that decide the output file (format selection and postprocessing)."""
+    if format_type == 'mp3':
+        return {
+            'format': 'bestaudio/best',
+            'postprocessors': [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'mp3',
+                'preferredquality': '192', # Standard MP3 quality
+            }],
+        }
+
+    # mp4 or other video
+    video_format = 'best[ext=mp4]/best' # Default best mp4 or any best
+    if quality != 'best':
+         # Specific quality, prefer mp4 container
+         video_format = f'bestvideo[height<={quality}][ext=mp4]+bestaudio[ext=m4a]/bestvideo[height<={quality}]+bestaudio/best[height<={quality}][ext=mp4]/best[height<={quality}]'
+    return {
+        'format': video_format,
+        'merge_output_format': 'mp4', # Ensure merged files are mp4 if possible
+    }
+
+
+def download_cache_key(video_id, format_type='mp4', quality='best'):
+    """Cache key of the file a download with these settings produces."""
+    format_opts = build_format_opts(format_type, quality)
+    postprocessing = {k: v for k, v in format_opts.items() if k != 'format'}
+    return make_cache_key(video_id, format_opts['format'], postprocessing)
 
 
 def download_video_thread(video_id, url, format_type='mp4', quality='best', cookies_file: Optional[str] = None):
-    """Target function for download thread"""
+    """Runs a single download; called from a download queue worker"""
     if video_id not in download_progress:
         print(f"Error: Progress entry not found for {video_id}")
         return
 
     # Update status to starting
-    download_progress[video_id]['status'] = 'starting'
+    download_progress.update(video_id, status='starting')
+
+    # Removed in finally even if files are still open (e.g. by a killed ffmpeg), so a cancelled
+    # download frees its partial files right away
+    temp_dir = tempfile.mkdtemp()
+    try:
+        active = ActiveDownload(video_id, temp_dir)
+        _active_downloads[video_id] = active
+        threading.Thread(target=watch_download, args=(active,), name=f"download-watch-{video_id}", daemon=True).start()
 
-    # Use TemporaryDirectory for robust cleanup
-    with tempfile.TemporaryDirectory() as temp_dir:
         base_ydl_opts = {
             'outtmpl': os.path.join(temp_dir, '%(id)s.%(ext)s'), # Use ID for temp name
             'progress_hooks': [my_progress_hook],
+            'postprocessor_hooks': [my_postprocessor_hook],
             'ignoreerrors': True, # Let hook handle 'error' status
             'no_warnings': True,
             'quiet': False, # Ensure hooks receive messages, but avoid excessive stdout
             'noprogress': False, # Ensure progress is reported
+            'concurrent_fragment_downloads': CONCURRENT_FRAGMENTS, # Fetch DASH/HLS fragments in parallel
             # 'cookiesfrombrowser': ('chrome',), # Remove or adjust this when using --cookies
             # 'verbose': True,
         }
@@ -223,46 +434,36 @@ def download_video_thread(video_id, url, format_type='mp4', quality='best', cook
         #     base_ydl_opts['cookiesfrombrowser'] = ('brave',)
 
 
-        if format_type == 'mp3':
-            ydl_opts = {
-                **base_ydl_opts,
-                'format': 'bestaudio/best',
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '192', # Standard MP3 quality
-                }],
-                # Ensure final extension is mp3 after postprocessing
-                'outtmpl': os.path.join(temp_dir, '%(id)s.%(ext)s'), # yt-dlp handles final naming with postproc
-            }
-        else: # mp4 or other video
-            video_format = 'best[ext=mp4]/best' # Default best mp4 or any best
-            if quality != 'best':
-                 # Specific quality, prefer mp4 container
-                 video_format = f'bestvideo[height<={quality}][ext=mp4]+bestaudio[ext=m4a]/bestvideo[height<={quality}]+bestaudio/best[height<={quality}][ext=mp4]/best[height<={quality}]'
-
-            ydl_opts = {
-                 **base_ydl_opts,
-                 'format': video_format,
-                 'merge_output_format': 'mp4', # Ensure merged files are mp4 if possible
-            }
+        # yt-dlp handles final naming (e.g. .mp3) after postprocessing
+        ydl_opts = {**base_ydl_opts, **build_format_opts(format_type, quality)}
 
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                # Re-extract info just before download to get potentially updated title/metadata
-                # Use skip_download=True to avoid downloading here
-                info = ydl.extract_info(url, download=False)
-                title = info.get('title', video_id) # Use title for final filename
+            # Reuse the info extracted for /get_info instead of extracting again
+            info = extract_video_info(url, cookies_file)
+            title = info.get('title', video_id) # Use title for final filename
+            download_progress.update(video_id, title=title) # Batch items are queued before their title is known
+            active.raise_if_cancelled()
 
-                # Start the actual download
-                retcode = ydl.download([url]) # Pass URL in a list
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                # Run format selection and the download on the cached info (like --load-info-json)
+                ydl.process_ie_result(ydl.sanitize_info(copy.deepcopy(info), remove_private_keys=True), download=True)
+                # ignoreerrors turns a killed ffmpeg into a reported error; don't mistake it for a missing file
+                active.raise_if_cancelled()
+
+                # Cached format URLs can expire; retry once with a fresh extraction if nothing was produced
+                if not (download_progress.get(video_id) or {}).get('_temp_filename') and not any(Path(temp_dir).iterdir()):
+                    print(f"Warning: Download from cached info produced no file for {video_id}. Re-extracting...")
+                    invalidate_video_info(url, cookies_file)
+                    ydl.download([url]) # Pass URL in a list
+                    active.raise_if_cancelled()
 
                 # Check status set by hook or if download method indicated failure (though ignoreerrors is True)
-                if download_progress[video_id]['status'] == 'error':
-                     raise Exception(download_progress[video_id].get('error', 'Unknown download error during processing'))
+                entry = download_progress.get(video_id) or {}
+                if entry.get('status') == 'error':
+                     raise Exception(entry.get('error', 'Unknown download error during processing'))
 
                 # Find the downloaded file (hook should provide _temp_filename)
-                temp_filename_str = download_progress[video_id].get('_temp_filename')
+                temp_filename_str = entry.get('_temp_filename')
                 downloaded_file = None
 
                 if temp_filename_str and Path(temp_filename_str).exists():
@@ -292,31 +493,321 @@ def download_video_thread(video_id, url, format_type='mp4', quality='best', cook
                      print(f"Error: Could not find downloaded file for {video_id} in {temp_dir}. Files: {list(Path(temp_dir).glob('*'))}")
                      raise FileNotFoundError(f"Downloaded file for {video_id} missing after processing.")
 
-                # Construct final filename (using sanitized title)
-                sanitized_title = "".join(c if c.isalnum() or c in (' ', '-', '_') else '_' for c in title).strip()
-                final_filename = f"{sanitized_title}{downloaded_file.suffix}"
-                final_path = DOWNLOAD_DIR / final_filename
+                # Construct the name the user downloads it as (using sanitized title)
+                download_name = f"{sanitize_title(title)}{downloaded_file.suffix}"
 
-                # Move the file from temp to final destination
-                downloaded_file.rename(final_path)
+                # Move the file from temp into the content-addressed cache
+                final_path = download_cache.store(download_cache_key(video_id, format_type, quality),
+                                                  downloaded_file, video_id, title)
 
                 # Update progress dictionary with final details
-                download_progress[video_id]['filename'] = str(final_path)
-                download_progress[video_id]['status'] = "completed"
-                download_progress[video_id]['progress'] = 100 # Ensure 100% on success
+                download_progress.update(video_id, filename=str(final_path), download_name=download_name,
+                                         status="completed", progress=100) # Ensure 100% on success
                 print(f"Download complete for {video_id}: {final_path}")
 
         except Exception as e:
-            error_msg = str(e)
-            print(f"Download thread failed for {video_id}: {error_msg}")
-            if video_id in download_progress:
-                download_progress[video_id]['status'] = 'error'
+            if active.cancelled.is_set():
+                print(f"Download cancelled for {video_id}: {active.reason}")
+                download_progress.update(video_id, status='cancelled', error=active.reason, progress=0,
+                                         speed='N/A', eta='N/A', speed_bps=0, _partial_filename=None)
+            else:
+                error_msg = str(e)
+                print(f"Download thread failed for {video_id}: {error_msg}")
                 # Try to get a more specific error from yt-dlp if possible
                 if isinstance(e, yt_dlp.utils.DownloadError):
                      error_msg = f"yt-dlp: {error_msg}"
-                download_progress[video_id]['error'] = error_msg
-                download_progress[video_id]['progress'] = 0 # Ensure progress is 0 on error
-        # TemporaryDirectory cleans itself up automatically when exiting 'with' block
+                download_progress.update(video_id, status='error', error=error_msg,
+                                         progress=0) # Ensure progress is 0 on error
+        finally:
+            active.finished.set()
+            _active_downloads.pop(video_id, None)
+            _last_hook_write.pop(video_id, None)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def run_download_job(job):
+    """Download queue runner: executes one job and returns (final_state, error)."""
+    video_id = job['video_id']
+    payload = job['payload']
+
+    # Jobs recovered after a restart have no in-memory progress entry yet
+    if video_id not in download_progress:
+        download_progress.create(video_id, new_progress_entry(video_id, payload['url'], payload.get('title', 'Unknown Title')))
+    download_progress.update(video_id, queue_position=0)
+
+    # Cancelled from another process while being claimed, or abandoned while it waited
+    reason = cancel_reason(video_id, download_progress.get(video_id))
+    if reason:
+        download_progress.update(video_id, status='cancelled', error=reason, queue_position=None)
+        print(f"Skipping download job {job['job_id']} for {video_id}: {reason}")
+        return 'cancelled', reason
+
+    cookies_file = None
+    try:
+        if payload.get('cookies'):
+            cookies_file = write_cookies_to_temp_file(payload['cookies'])
+        download_video_thread(video_id, payload['url'], payload.get('format_type', 'mp4'),
+                              payload.get('quality', 'best'), cookies_file)
+    finally:
+        if cookies_file and os.path.exists(cookies_file):
+            try:
+                os.remove(cookies_file)
+            except Exception as cleanup_e:
+                print(f"Error cleaning up cookie file {cookies_file} after download job: {cleanup_e}")
+
+    entry = download_progress.update(video_id, queue_position=None) or {}
+    return entry.get('status', 'error'), entry.get('error')
+
+
+download_queue = DownloadQueue(QUEUE_DB_PATH, run_download_job, worker_count=MAX_CONCURRENT_DOWNLOADS)
+download_cache = DownloadCache(CACHE_DIR, CACHE_DB_PATH, CACHE_MAX_BYTES)
+
+# Batch/playlist state, keyed by batch ID (same expiry and sharing rules as download progress)
+download_batches = create_progress_store('youtube_batches')
+
+
+class DownloadConflictError(Exception):
+    """Another format of the same video is already queued or downloading."""
+
+
+def queue_video_download(video_id, url, title, format_type, quality, cookies_string, priority=0, batch_id=None):
+    """
+    Serves the download from the cache, joins an identical download in flight, or
+    queues a new job. Returns the job dict (job_id is None for cache hits).
+    Raises DownloadConflictError if a different format of the video is in flight.
+    """
+    cache_key = download_cache_key(video_id, format_type, quality)
+    active = download_queue.get_active_job(video_id)
+    if active is None:
+        cached = download_cache.lookup(cache_key)
+        if cached is not None:
+            download_progress.create(video_id, dict(
+                new_progress_entry(video_id, url, cached['title'] or title, status='completed'),
+                progress=100, filename=cached['path'],
+                download_name=f"{sanitize_title(cached['title'] or title)}{Path(cached['path']).suffix}"
+            ))
+            print(f"Download cache hit for {video_id} ({format_type}/{quality})")
+            return {'job_id': None, 'state': 'completed', 'video_id': video_id}
+        download_progress.create(video_id, new_progress_entry(video_id, url, title, status='queued'))
+
+    # The job keeps the raw cookie string; the worker writes its own temp file when it runs
+    job, created = download_queue.submit(video_id, {
+        'url': url,
+        'title': title,
+        'format_type': format_type,
+        'quality': quality,
+        'cookies': cookies_string,
+        'batch_id': batch_id,
+    }, priority=priority, dedupe_key=cache_key)
+    if created:
+        print(f"Queued download job {job['job_id']} for {video_id} (priority {priority})")
+    elif job['dedupe_key'] == cache_key:
+        # Single flight: share the download that is already queued or running
+        download_cache.record_coalesced()
+        print(f"Download for {video_id} already {job['state']} as job {job['job_id']}, sharing it")
+    else:
+        raise DownloadConflictError(
+            f"Another format of video {video_id} is already {job['state']}; try again when it has finished.")
+    return job
+
+
+def run_download_job_to_completion(url, format_type='mp4', quality='best', cookies_string=None, priority=0):
+    """
+    Job body for /api/tool/youtube-downloader/execute: queues the download like /download
+    (so the download queue still governs concurrency); download_job_waiter then finishes
+    the job with the downloaded file.
+    """
+    cookies_file = None
+    try:
+        if cookies_string:
+            cookies_file = write_cookies_to_temp_file(cookies_string)
+        info = get_video_info(url, cookies_file)
+    finally:
+        if cookies_file and os.path.exists(cookies_file):
+            try:
+                os.remove(cookies_file)
+            except Exception as cleanup_e:
+                print(f"Error cleaning up cookie file {cookies_file} after download job: {cleanup_e}")
+    if 'error' in info:
+        return {'error': info['error']}
+    video_id = info.get('id')
+    if not video_id:
+        return {'error': 'Could not extract video ID.'}
+
+    try:
+        queue_video_download(video_id, url, info.get('title', 'Unknown Title'),
+                             format_type, quality, cookies_string, priority=priority)
+    except DownloadConflictError as conflict:
+        return {'error': str(conflict)}
+    # Hand the job to the waiter instead of holding this pool thread until the download ends
+    download_job_waiter.add(video_id, current_job_id())
+    return DEFERRED
+
+
+def download_job_output(video_id, entry) -> dict:
+    """The job result for a download that reached a terminal status (or whose progress expired)."""
+    if entry is None:
+        return {'error': 'Download progress expired.'}
+    if entry['status'] == 'completed':
+        return {
+            'path': entry['filename'],
+            'filename': entry.get('download_name') or os.path.basename(entry['filename']),
+            'headers': {'X-Video-Id': video_id},
+        }
+    return {'error': entry.get('error') or f"Download {entry['status']}."}
+
+
+class DownloadJobWaiter:
+    """
+    Finishes deferred /execute jobs when their download ends. One thread follows the
+    downloads' terminal events through progress_events; every JOB_WATCH_INTERVAL it also
+    re-reads the progress store (for downloads run by other processes), keeps followed
+    downloads alive and cancels downloads whose jobs were all cancelled.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {} # video ID -> set of job IDs waiting for it
+        self._subscription = None
+
+    def add(self, video_id, job_id):
+        with self._lock:
+            if self._subscription is None:
+                self._subscription = progress_events.subscribe(())
+                threading.Thread(target=self._run, name='download-job-waiter', daemon=True).start()
+            self._jobs.setdefault(video_id, set()).add(job_id)
+            self._subscription.keys.add(video_id)
+        # The download may have finished (or been a cache hit) before we subscribed
+        self._check(video_id, download_progress.get(video_id))
+
+    def _finish(self, video_id, entry):
+        with self._lock:
+            job_ids = self._jobs.pop(video_id, set())
+            self._subscription.keys.discard(video_id)
+        output = download_job_output(video_id, entry)
+        for job_id in job_ids:
+            complete_job(job_id, output)
+
+    def _check(self, video_id, entry):
+        if entry is None or entry['status'] in FINISHED_STATUSES:
+            self._finish(video_id, entry)
+
+    def _tick(self):
+        with self._lock:
+            waiting = {video_id: set(job_ids) for video_id, job_ids in self._jobs.items()}
+        for video_id, job_ids in waiting.items():
+            live = {job_id for job_id in job_ids if (job_store.get(job_id) or {}).get('status') == 'running'}
+            if not live:
+                with self._lock:
+                    self._jobs.pop(video_id, None)
+                    self._subscription.keys.discard(video_id)
+                cancel_download(video_id, 'The job was cancelled.')
+                continue
+            entry = download_progress.get(video_id)
+            self._check(video_id, entry)
+            touch_watcher(video_id, entry) # Waiting jobs keep their download alive
+
+    def _run(self):
+        last_tick = time.monotonic()
+        while True:
+            updates = self._subscription.wait(timeout=JOB_WATCH_INTERVAL)
+            for video_id, snapshot in updates.items():
+                self._check(video_id, snapshot)
+            if time.monotonic() - last_tick >= JOB_WATCH_INTERVAL:
+                last_tick = time.monotonic()
+                self._tick()
+
+
+download_job_waiter = DownloadJobWaiter()
+
+
+def expand_batch_thread(batch_id, urls, format_type, quality, cookies_string, priority):
+    """Expands the batch URLs and queues every entry; runs in a background thread."""
+    cookies_file = write_cookies_to_temp_file(cookies_string) if cookies_string else None
+    video_ids = []
+    errors = []
+    try:
+        for video_id, url, title in iter_batch_entries(urls, cookies_file):
+            if video_id in video_ids:
+                continue
+            if len(video_ids) >= BATCH_MAX_ITEMS:
+                errors.append(f"Batch truncated to {BATCH_MAX_ITEMS} items.")
+                break
+            if (download_batches.get(batch_id) or {}).get('status') == 'cancelled':
+                break # Cancelled while still expanding
+            try:
+                queue_video_download(video_id, url, title or 'Unknown Title', format_type, quality,
+                                     cookies_string, priority=priority, batch_id=batch_id)
+                video_ids.append(video_id)
+                download_batches.update(batch_id, video_ids=list(video_ids))
+            except Exception as e:
+                errors.append(f"{url}: {e}")
+    except Exception as e:
+        print(f"Batch {batch_id} expansion failed: {e}")
+        errors.append(str(e))
+    finally:
+        if cookies_file and os.path.exists(cookies_file):
+            try:
+                os.remove(cookies_file)
+            except Exception as cleanup_e:
+                print(f"Error cleaning up cookie file {cookies_file} after batch expansion: {cleanup_e}")
+
+    status = 'running' if video_ids else 'error'
+    if (download_batches.get(batch_id) or {}).get('status') == 'cancelled':
+        status = 'cancelled'
+    download_batches.update(batch_id, status=status, video_ids=video_ids, errors=errors)
+    print(f"Batch {batch_id}: queued {len(video_ids)} item(s), {len(errors)} error(s)")
+
+
+def get_batch_status(batch_id) -> Optional[dict]:
+    """Batch record plus per-item progress and aggregate throughput."""
+    batch = download_batches.get(batch_id)
+    if batch is None:
+        return None
+
+    items = []
+    counts = {}
+    total_speed = 0
+    downloaded_bytes = 0
+    for video_id in batch['video_ids']:
+        entry = download_progress.get(video_id) or {'status': 'expired', 'progress': 0}
+        status = entry.get('status')
+        if status != 'expired':
+            touch_watcher(video_id, entry)
+        if status == 'queued':
+            entry['queue_position'] = download_queue.position(video_id)
+        counts[status] = counts.get(status, 0) + 1
+        if status == 'downloading':
+            total_speed += entry.get('speed_bps') or 0
+        downloaded_bytes += entry.get('downloaded_bytes') or 0
+        items.append({
+            'video_id': video_id,
+            'title': entry.get('title'),
+            'status': status,
+            'progress': entry.get('progress', 0),
+            'speed': entry.get('speed'),
+            'eta': entry.get('eta'),
+            'queue_position': entry.get('queue_position'),
+            'error': entry.get('error'),
+        })
+
+    finished = sum(counts.get(s, 0) for s in ('completed', 'error', 'cancelled', 'expired'))
+    if batch['status'] == 'running' and items and finished == len(items):
+        batch = download_batches.update(batch_id, status='finished') or batch
+
+    return {
+        'batch_id': batch_id,
+        'status': batch['status'],
+        'errors': batch.get('errors', []),
+        'total': len(items),
+        'counts': counts,
+        'progress': round(sum(i['progress'] or 0 for i in items) / len(items), 1) if items else 0,
+        'throughput': f"{total_speed / 1024 / 1024:.2f} MB/s",
+        'throughput_bps': total_speed,
+        'downloaded_bytes': downloaded_bytes,
+        'items': items,
+    }
 
 
 # Function to get transcript (adapted from crawl_yt.py)
@@ -347,19 +838,10 @@ def get_info_route():
              if not cookies_file:
                  raise Exception("Failed to write cookies to a temporary file.")
 
-        # Attempt to pre-extract ID (optional, but can help with progress tracking init)
-        ydl_opts_id = {'quiet': True, 'no_warnings': True, 'skip_download': True, 'extract_flat': True}
-        if cookies_file:
-             ydl_opts_id['cookiefile'] = cookies_file
-
-        with yt_dlp.YoutubeDL(ydl_opts_id) as ydl_id:
-            try:
-                info_id_only = ydl_id.extract_info(url, download=False)
-                video_id_temp = info_id_only.get('id')
-                if video_id_temp and video_id_temp in download_progress:
-                     print(f"Re-fetching info for known ID: {video_id_temp}. Progress state will be updated.")
-            except Exception as id_extract_err:
-                 print(f"Warning: Could not pre-extract ID for {url}: {id_extract_err}")
+        # Resolve the ID from the URL alone (no network) so errors can be tracked
+        video_id_temp = canonical_video_id(url)
+        if video_id_temp and video_id_temp in download_progress:
+             print(f"Re-fetching info for known ID: {video_id_temp}. Progress state will be updated.")
 
         info = get_video_info(url, cookies_file) # Pass cookies_file to get_video_info
 
@@ -371,18 +853,9 @@ def get_info_route():
              raise Exception("Could not extract video ID from the provided URL.")
 
         # Store essential info in download_progress upon successful info fetch
-        download_progress[video_id] = {
-            'video_id': video_id,
-            'url': url,
-            'title': info.get('title', 'Unknown Title'),
-            'status': 'info_loaded',
-            'progress': 0,
-            'speed': 'N/A',
-            'eta': 'N/A',
-            'filename': None,
-            'error': None,
-            '_temp_filename': None
-        }
+        # Keep the entry of a queued/running download intact
+        if download_queue.get_active_job(video_id) is None:
+            download_progress.create(video_id, new_progress_entry(video_id, url, info.get('title', 'Unknown Title')))
         print(f"Stored info for {video_id} in progress tracker.")
 
         return jsonify(info)
@@ -390,9 +863,8 @@ def get_info_route():
     except Exception as e:
         error_msg = f"Failed to get video info: {str(e)}"
         print(f"Error in /get_info for {url}: {error_msg}")
-        if video_id_temp and video_id_temp in download_progress:
-             download_progress[video_id_temp]['status'] = 'error'
-             download_progress[video_id_temp]['error'] = error_msg
+        if video_id_temp:
+             download_progress.update(video_id_temp, status='error', error=error_msg)
         return jsonify({'error': error_msg}), 500
     finally:
          # Clean up the temporary cookie file if it was created
@@ -406,13 +878,119 @@ def get_info_route():
 @youtube_downloader_bp.route('/progress/<video_id>')
 def get_progress_route(video_id):
     """Get download progress for a video"""
-    if video_id in download_progress:
-        return jsonify(download_progress[video_id])
+    entry = download_progress.get(video_id) # Copy, safe to modify
+    if entry is not None:
+        touch_watcher(video_id, entry)
+        if entry['status'] == 'queued':
+            entry['queue_position'] = download_queue.position(video_id)
+        return jsonify(entry)
     return jsonify({'status': 'not_found', 'error': 'Video ID not found or download not initiated.'}), 404
 
+@youtube_downloader_bp.route('/progress/stream')
+def progress_stream_route():
+    """
+    Stream progress for one or more videos as Server-Sent Events (?ids=id1,id2).
+    Updates are coalesced per video and sent at most every SSE_MIN_INTERVAL seconds;
+    each video ends with a single 'completed', 'error' or 'cancelled' event.
+    """
+    video_ids = [v for v in request.args.get('ids', '').split(',') if v]
+    if not video_ids:
+        return jsonify({'error': 'At least one video ID is required (?ids=...)'}), 400
+
+    # Subscribe before reading the initial state so no update is missed in between
+    subscription = progress_events.subscribe(video_ids)
+
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    def generate():
+        try:
+            remaining = set()
+            updates = {}
+            for video_id in video_ids:
+                entry = download_progress.get(video_id)
+                if entry is None:
+                    yield sse('error', {'video_id': video_id, 'status': 'not_found',
+                                        'error': 'Video ID not found or download not initiated.'})
+                else:
+                    remaining.add(video_id)
+                    updates[video_id] = dict(entry)
+
+            last_positions = {}
+            last_updated = {}
+            last_sent = time.monotonic()
+            while remaining:
+                batch_started = time.monotonic()
+                for video_id, snapshot in updates.items():
+                    if video_id not in remaining:
+                        continue
+                    status = snapshot.get('status')
+                    last_updated[video_id] = snapshot.get('updated_at')
+                    if status == 'queued':
+                        snapshot['queue_position'] = download_queue.position(video_id)
+                        last_positions[video_id] = snapshot['queue_position']
+                    if status in FINISHED_STATUSES:
+                        remaining.discard(video_id)
+                        yield sse(status, snapshot)
+                    else:
+                        yield sse('progress', snapshot)
+                if updates:
+                    last_sent = time.monotonic()
+                if not remaining:
+                    break
+                for video_id in remaining:
+                    touch_watcher(video_id) # An open stream keeps its downloads alive
+
+                # Let further hook updates coalesce before the next batch
+                time.sleep(max(0.0, SSE_MIN_INTERVAL - (time.monotonic() - batch_started)))
+                updates = subscription.wait(timeout=SSE_QUEUE_CHECK_INTERVAL)
+                if not updates:
+                    # Idle tick: report queue movement and changes made by other processes
+                    for video_id in remaining:
+                        entry = download_progress.get(video_id)
+                        if entry is None:
+                            continue
+                        if entry.get('updated_at') != last_updated.get(video_id):
+                            updates[video_id] = entry
+                        elif entry['status'] == 'queued' and download_queue.position(video_id) != last_positions.get(video_id):
+                            updates[video_id] = entry
+                    if not updates and time.monotonic() - last_sent >= SSE_HEARTBEAT_INTERVAL:
+                        last_sent = time.monotonic()
+                        yield ': keep-alive\n\n'
+        finally:
+            progress_events.unsubscribe(subscription)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no', # Disable proxy buffering (nginx)
+    })
+
+@youtube_downloader_bp.route('/cancel/<video_id>', methods=['POST'])
+def cancel_download_route(video_id):
+    """Cancel a queued or running download; a running one stops within about a second"""
+    entry = cancel_download(video_id)
+    if entry is None:
+        return jsonify({'status': 'not_found', 'error': 'Video ID not found or download not initiated.'}), 404
+    return jsonify(entry)
+
+@youtube_downloader_bp.route('/queue')
+def get_queue_route():
+    """Get download queue statistics (jobs per state, worker count)"""
+    return jsonify(download_queue.stats())
+
+@youtube_downloader_bp.route('/cache')
+def get_download_cache_route():
+    """Get download cache statistics (hits, misses, coalesced requests, size)"""
+    return jsonify(download_cache.stats())
+
+@youtube_downloader_bp.route('/info_cache')
+def get_info_cache_route():
+    """Get video metadata cache statistics"""
+    return jsonify(video_info_cache.stats())
+
 @youtube_downloader_bp.route('/download', methods=['POST'])
 def start_download_route():
-    """Start the video download in a separate thread"""
+    """Queue the video download for the worker pool"""
     url = request.form.get('url')
     format_type = request.form.get('format', 'mp4')
     quality = request.form.get('quality', 'best')
@@ -420,6 +998,10 @@ def start_download_route():
 
     if not url:
         return jsonify({'error': 'URL is required'}), 400
+    try:
+        priority = int(request.form.get('priority', 0))
+    except ValueError:
+        return jsonify({'error': 'Invalid priority value, must be an integer.'}), 400
 
     cookies_file = None
     try:
@@ -438,56 +1020,30 @@ def start_download_route():
         if not video_id:
             return jsonify({'error': 'Could not extract video ID.'}), 500
 
-        # Initialize progress tracking for this video ID
-        # This might have been done by get_info_route, but ensure it exists
-        if video_id not in download_progress or download_progress[video_id]['status'] in ['completed', 'error']:
-             download_progress[video_id] = {
-                'video_id': video_id,
-                'url': url,
-                'title': info.get('title', 'Unknown Title'),
-                'status': 'info_loaded',
-                'progress': 0,
-                'speed': 'N/A',
-                'eta': 'N/A',
-                'filename': None,
-                'error': None,
-                '_temp_filename': None
-            }
-        print(f"Starting download thread for {video_id}...")
-        # Pass cookies_file to the download thread
-        thread = threading.Thread(
-            target=download_video_thread,
-            args=(video_id, url, format_type, quality, cookies_file)
-        )
-        thread.start()
-
-        return jsonify({'status': 'download_started', 'video_id': video_id})
+        try:
+            job = queue_video_download(video_id, url, info.get('title', 'Unknown Title'),
+                                       format_type, quality, cookies_string, priority=priority)
+        except DownloadConflictError as conflict:
+            return jsonify({'error': str(conflict)}), 409
+
+        return jsonify({
+            'status': job['state'],
+            'video_id': video_id,
+            'job_id': job['job_id'],
+            'queue_position': download_queue.position(video_id)
+        })
 
     except Exception as e:
         error_msg = f"Failed to start download: {str(e)}"
         print(f"Error in /download for {url}: {error_msg}")
-        # If an error occurs before the thread starts, update progress here
-        video_id_temp = None
-        try:
-             # Attempt to get video ID to update progress if possible
-             ydl_opts_id = {'quiet': True, 'no_warnings': True, 'skip_download': True, 'extract_flat': True}
-             if cookies_file:
-                  ydl_opts_id['cookiefile'] = cookies_file
-             # else: # Removed fallback to prevent errors when cookiefile is provided
-             #      ydl_opts_id['cookiesfrombrowser'] = ('chrome',)
-             with yt_dlp.YoutubeDL(ydl_opts_id) as ydl_id:
-                  info_id_only = ydl_id.extract_info(url, download=False)
-                  video_id_temp = info_id_only.get('id')
-        except Exception:
-             pass # Ignore errors during ID extraction for error reporting
-
-        if video_id_temp and video_id_temp in download_progress:
-             download_progress[video_id_temp]['status'] = 'error'
-             download_progress[video_id_temp]['error'] = error_msg
+        # If an error occurs before the job is queued, update progress here
+        video_id_temp = canonical_video_id(url)
+        if video_id_temp:
+             download_progress.update(video_id_temp, status='error', error=error_msg)
         return jsonify({'error': error_msg}), 500
     finally:
          # Clean up the temporary cookie file if it was created
-         # Note: The download_video_thread will also attempt cleanup, but this handles errors before thread start
+         # Note: Queued jobs write their own cookie file when a worker picks them up
          if cookies_file and os.path.exists(cookies_file):
              try:
                  os.remove(cookies_file)
@@ -495,25 +1051,209 @@ def start_download_route():
                  print(f"Error cleaning up cookie file {cookies_file} after start_download_route: {cleanup_e}")
 
 
+def execute_download_route():
+    """Generic execute endpoint: always answers with a job (downloads are long)"""
+    url = request.form.get('url')
+    if not url:
+        return jsonify({'error': 'URL is required'}), 400
+    try:
+        priority = int(request.form.get('priority', 0))
+    except ValueError:
+        return jsonify({'error': 'Invalid priority value, must be an integer.'}), 400
+    job = submit_job('youtube-downloader', 'io', run_download_job_to_completion, url,
+                     request.form.get('format', 'mp4'), request.form.get('quality', 'best'),
+                     request.form.get('cookies'), priority)
+    return accepted_response(job)
+
+@youtube_downloader_bp.route('/batch', methods=['POST'])
+def start_batch_route():
+    """Queue a list of URLs and/or playlist/channel URLs (one per line in 'urls', or 'url')"""
+    raw_urls = request.form.get('urls') or request.form.get('url') or ''
+    urls = [u.strip() for u in raw_urls.split() if u.strip()]
+    format_type = request.form.get('format', 'mp4')
+    quality = request.form.get('quality', 'best')
+    cookies_string = request.form.get('cookies')
+
+    if not urls:
+        return jsonify({'error': 'At least one URL is required'}), 400
+    try:
+        priority = int(request.form.get('priority', 0))
+    except ValueError:
+        return jsonify({'error': 'Invalid priority value, must be an integer.'}), 400
+
+    batch_id = uuid.uuid4().hex
+    download_batches.create(batch_id, {
+        'batch_id': batch_id,
+        'status': 'expanding',
+        'urls': urls,
+        'format_type': format_type,
+        'quality': quality,
+        'video_ids': [],
+        'errors': [],
+    })
+    # Playlist expansion can take a while, respond right away and queue entries as they are found
+    get_io_pool().submit(expand_batch_thread, batch_id, urls, format_type, quality, cookies_string, priority)
+
+    return jsonify({'status': 'expanding', 'batch_id': batch_id})
+
+@youtube_downloader_bp.route('/batch/<batch_id>')
+def get_batch_route(batch_id):
+    """Get per-item progress and aggregate throughput of a batch"""
+    status = get_batch_status(batch_id)
+    if status is None:
+        return jsonify({'status': 'not_found', 'error': 'Batch not found.'}), 404
+    return jsonify(status)
+
+@youtube_downloader_bp.route('/batch/<batch_id>/cancel', methods=['POST'])
+def cancel_batch_route(batch_id):
+    """Cancel every queued or running download of a batch"""
+    batch = download_batches.update(batch_id, status='cancelled') # Also stops an expansion in progress
+    if batch is None:
+        return jsonify({'status': 'not_found', 'error': 'Batch not found.'}), 404
+    for video_id in batch['video_ids']:
+        cancel_download(video_id)
+    return jsonify(get_batch_status(batch_id))
+
+@youtube_downloader_bp.route('/batch/<batch_id>/zip')
+def get_batch_zip_route(batch_id):
+    """Stream the batch's files as a ZIP, adding each file as soon as its download completes"""
+    if download_batches.get(batch_id) is None:
+        return jsonify({'error': 'Batch not found.'}), 404
+
+    def completed_files():
+        sent = set()
+        used_names = set()
+        while True:
+            batch = download_batches.get(batch_id)
+            if batch is None:
+                return
+            pending = False
+            for video_id in batch['video_ids']:
+                if video_id in sent:
+                    continue
+                entry = download_progress.get(video_id)
+                if entry is None or entry['status'] in ('error', 'cancelled'):
+                    sent.add(video_id) # Failed, cancelled or expired, nothing to add
+                    continue
+                if entry['status'] != 'completed':
+                    touch_watcher(video_id, entry)
+                    pending = True
+                    continue
+                sent.add(video_id)
+                if entry.get('filename') and os.path.exists(entry['filename']):
+                    name = entry.get('download_name') or os.path.basename(entry['filename'])
+                    if name in used_names:
+                        name = f"{video_id}_{name}"
+                    used_names.add(name)
+                    yield name, entry['filename']
+            if not pending and batch['status'] != 'expanding':
+                return
+            time.sleep(1)
+
+    return Response(stream_with_context(stream_zip(completed_files())), mimetype='application/zip', headers={
+        'Content-Disposition': f'attachment; filename="batch_{batch_id}.zip"',
+        'X-Accel-Buffering': 'no',
+    })
+
+def send_finished_file(file_path, download_name=None):
+    """
+    Sends a finished download with Range/If-Range and ETag/Last-Modified support,
+    so interrupted transfers can resume. Full responses go through the server's
+    wsgi.file_wrapper (sendfile under gunicorn) or X-Sendfile when USE_X_SENDFILE is set.
+    """
+    response = send_file(file_path, as_attachment=True, download_name=download_name,
+                         conditional=True, etag=True, max_age=FILE_MAX_AGE)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
 @youtube_downloader_bp.route('/get_file/<video_id>')
 def get_file_route(video_id):
-    """Serve the downloaded file"""
-    if video_id in download_progress and download_progress[video_id]['status'] == 'completed':
-        file_path = download_progress[video_id]['filename']
+    """Serve the downloaded file (resumable; the entry expires with the progress store TTL)"""
+    entry = download_progress.get(video_id)
+    if entry is not None and entry['status'] == 'completed':
+        file_path = entry['filename']
         if file_path and os.path.exists(file_path):
-            # Clean up the progress entry after serving the file
-            del download_progress[video_id]
-            return send_file(file_path, as_attachment=True)
+            return send_finished_file(file_path, entry.get('download_name'))
         else:
             return jsonify({'error': 'File not found.'}), 404
     return jsonify({'error': 'Download not complete or not found.'}), 404
 
+@youtube_downloader_bp.route('/stream/<video_id>')
+def stream_file_route(video_id):
+    """
+    Stream a download while it is still running by tailing the growing temp file.
+    Only progressive (single-file, audio+video) formats can be streamed; finished
+    downloads are sent like /get_file.
+    """
+    deadline = time.monotonic() + STREAM_START_TIMEOUT
+    while True:
+        entry = download_progress.get(video_id)
+        if entry is None:
+            return jsonify({'error': 'Video ID not found or download not initiated.'}), 404
+        if entry['status'] == 'error':
+            return jsonify({'error': entry.get('error') or 'Download failed.'}), 500
+        if entry['status'] == 'cancelled':
+            return jsonify({'error': entry.get('error') or 'Download was cancelled.'}), 409
+        touch_watcher(video_id, entry)
+        if entry['status'] == 'completed':
+            if entry.get('filename') and os.path.exists(entry['filename']):
+                return send_finished_file(entry['filename'], entry.get('download_name'))
+            return jsonify({'error': 'File not found.'}), 404
+        partial = entry.get('_partial_filename')
+        if partial and os.path.exists(partial):
+            break
+        if time.monotonic() > deadline:
+            return jsonify({'error': 'Download has not started yet, try again later.'}), 503
+        time.sleep(0.25)
+
+    if not entry.get('_streamable'):
+        return jsonify({'error': 'This format is merged or post-processed after download and cannot be '
+                                 'streamed; use get_file once it completes.'}), 409
+
+    # Open now: on POSIX the handle stays valid when yt-dlp renames the .part file
+    source = open(partial, 'rb')
+    display_name = os.path.basename(partial[:-5] if partial.endswith('.part') else partial)
+
+    def tail():
+        try:
+            finishing = False
+            while True:
+                chunk = source.read(STREAM_CHUNK_SIZE)
+                if chunk:
+                    yield chunk
+                    continue
+                if finishing:
+                    return # Everything written before the download finished has been sent
+                current = download_progress.get(video_id)
+                if current is None or current['status'] in ('error', 'cancelled'):
+                    return
+                touch_watcher(video_id, current)
+                if current['status'] == 'completed' or current.get('_temp_filename'):
+                    finishing = True # Drain what is left, then stop
+                    continue
+                time.sleep(0.25)
+        finally:
+            source.close()
+
+    return Response(stream_with_context(tail()),
+                    mimetype=mimetypes.guess_type(display_name)[0] or 'application/octet-stream',
+                    headers={
+                        'Content-Disposition': f'inline; filename="{display_name}"',
+                        'Cache-Control': 'no-store',
+                        'X-Accel-Buffering': 'no',
+                    })
+
 
 
 class YouTubeDownloaderTool:
     def register_routes(self, app):
         """Registers the blueprint with the Flask application."""
         app.register_blueprint(youtube_downloader_bp, url_prefix='/tool/youtube-downloader')
+        app.add_url_rule('/api/tool/youtube-downloader/execute', 'youtube_downloader_execute',
+                         execute_download_route, methods=['POST'])
+        # Resume any jobs persisted by a previous run
+        download_queue.start()
 
     def get_info(self):
         """Returns information about the tool."""
@@ -521,5 +1261,6 @@ class YouTubeDownloaderTool:
             'id': 'youtube-downloader',
             'name': 'YouTube Downloader',
             'description': 'Download videos and transcripts from YouTube.',
+            'endpoint': '/api/tool/youtube-downloader/execute',
             'icon': 'bi-youtube' # Bootstrap icon class
         }
\ No newline at end of file
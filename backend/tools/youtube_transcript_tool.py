@@ -1,12 +1,56 @@
-import json
-from flask import request, jsonify, Blueprint
+from flask import request, jsonify, Blueprint, Response, stream_with_context
 import yt_dlp
 import os
-import tempfile
-from typing import Optional
+import json
+import random
 import re
+import tempfile
+import threading
+import time
+import uuid
+from typing import Optional, Tuple
 import requests
 import atexit
+from common.bulk_jobs import BulkJobStore, UNFINISHED_JOB_STATES
+from common.config import STATE_DIR, env_float, env_int
+from common.executors import FETCH_THREADS, get_fetch_pool, get_io_pool
+from common.http_client import get_http_client
+from common.jobs import accepted_response, submit_job, wants_async
+from common.metadata_cache import canonical_video_id, extract_video_info, iter_batch_entries
+from common.rate_limit import HostRateLimiter
+from common.subtitles import RENDERERS, parse_subtitles, segments_to_json
+from common.transcript_store import KINDS, TranscriptStore
+
+# Parsed transcripts by video, language and kind; repeat requests need no yt-dlp or network call
+TRANSCRIPT_DB_PATH = STATE_DIR / 'transcripts.sqlite3'
+transcript_store = TranscriptStore(
+    TRANSCRIPT_DB_PATH,
+    max_bytes=env_int('TRANSCRIPT_CACHE_MAX_BYTES', 256 * 1024 ** 2),
+    ttl=env_float('TRANSCRIPT_CACHE_TTL', 7 * 24 * 3600),
+    index_max_bytes=env_int('TRANSCRIPT_INDEX_MAX_BYTES', 256 * 1024 ** 2)
+)
+# Subtitle track formats we parse with timings, in order of preference
+TRACK_FORMATS = ('json3', 'srv3', 'vtt', 'srt')
+SEARCH_MAX_LIMIT = 100
+
+# Outgoing requests per second to each host (YouTube, its subtitle endpoint) for transcript fetches
+host_limiter = HostRateLimiter(env_float('TRANSCRIPT_RATE_PER_HOST', 5), env_int('TRANSCRIPT_RATE_BURST', 5))
+
+# Bulk transcript jobs: results are kept until TRANSCRIPT_BULK_TTL after the job's last activity
+BULK_DB_PATH = STATE_DIR / 'transcript_bulk.sqlite3'
+bulk_jobs = BulkJobStore(BULK_DB_PATH, ttl=env_float('TRANSCRIPT_BULK_TTL', 7 * 24 * 3600))
+BULK_MAX_ITEMS = env_int('TRANSCRIPT_BULK_MAX_ITEMS', 5000)
+# Failed extractions that look transient (429, 5xx, timeouts) are retried with jittered exponential backoff.
+# Subtitle downloads aren't: the HTTP client has already retried them (honouring Retry-After).
+BULK_RETRIES = env_int('TRANSCRIPT_BULK_RETRIES', 3)
+BULK_BACKOFF = env_float('TRANSCRIPT_BULK_BACKOFF', 1.0)
+RETRYABLE_ERROR = re.compile(r'\b(?:429|50[0-4])\b|Too Many Requests|timed out|Read timeout|Temporary failure'
+                             r'|Connection (?:reset|refused|aborted)|RemoteDisconnected', re.IGNORECASE)
+SUBTITLE_DOWNLOAD_ERROR = "Error: Failed to download subtitle file"
+BULK_HEARTBEAT_INTERVAL = 15
+_bulk_running = set() # Bulk job IDs run by this process
+_bulk_running_lock = threading.Lock()
+_bulk_updates = threading.Condition() # Notified when an item finishes here; streams also poll for other processes
 
 def write_cookies_to_temp_file(cookies_string: str) -> Optional[str]:
     """Writes a cookie string to a temporary file and returns the path."""
@@ -25,107 +69,318 @@ def write_cookies_to_temp_file(cookies_string: str) -> Optional[str]:
         print(f"Error writing cookies to temp file: {e}")
         return None
 
-def get_transcript_from_url(video_url: str, cookies_file: Optional[str] = None) -> Optional[str]:
+def pick_language(tracks: dict, lang: str, kind: str = 'any') -> Optional[Tuple[str, str]]:
     """
-    Fetch transcript using yt-dlp's built-in functionality.
-    Returns the transcript text or None if failed.
+    Chooses (kind, track language) from {'manual': [langs], 'auto': [langs]}. Manual
+    subtitles win over automatic captions for kind 'any'; 'en' also matches 'en-US'.
     """
-    ydl_opts = {
-        'skip_download': True,
-        'writesubtitles': True,
-        'writeautomaticsub': True,
-        'subtitleslangs': ['en'],
-        'quiet': True, # Suppress yt-dlp output to stdout
-        # Attempt to use Brave cookies if no explicit cookies file is provided
-        # This might only work when running the script outside of Docker
-        # 'cookiesfrombrowser': ('brave',), # Removed to prevent errors when cookiefile is provided
-    }
+    for track_kind in (KINDS if kind == 'any' else (kind,)):
+        available = tracks.get(track_kind) or []
+        if lang in available:
+            return track_kind, lang
+        variant = next((l for l in sorted(available) if l.startswith(lang + '-')), None)
+        if variant:
+            return track_kind, variant
+    return None
+
+
+def pick_format(formats: list) -> dict:
+    """The first track format we can parse with timings, else the first one offered."""
+    for ext in TRACK_FORMATS:
+        for fmt in formats:
+            if fmt.get('ext') == ext:
+                return fmt
+    return formats[0]
+
 
-    if cookies_file:
-         ydl_opts['cookiefile'] = cookies_file # Use --cookies option if provided (overrides browser)
+def no_track_error(lang: str, kind: str) -> str:
+    label = {'manual': 'manual subtitles', 'auto': 'automatic captions'}.get(kind, 'subtitles')
+    return f"Error: No {label} found for language '{lang}'."
 
 
+def fetch_transcript(video_url: str, cookies_file: Optional[str] = None, lang: str = 'en',
+                     kind: str = 'any') -> Tuple[Optional[dict], Optional[str]]:
+    """
+    Returns (transcript, error). The transcript dict holds video_id, lang, kind, title,
+    segments and 'cached'. Stored transcripts are served without any yt-dlp or network call;
+    errors are strings starting with 'Error:'.
+    """
+    video_id = canonical_video_id(video_url)
+    if video_id:
+        cached = transcript_store.get(video_id, lang, kind)
+        if cached is not None:
+            cached['cached'] = True
+            return cached, None
+        known = transcript_store.get_tracks(video_id)
+        if known is not None and pick_language(known['tracks'], lang, kind) is None:
+            return None, no_track_error(lang, kind)
+
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(video_url, download=False)
-
-            subtitle_url = None
-            # Check for manual captions first, then automatic captions
-            if 'subtitles' in info and 'en' in info['subtitles']:
-                # Find the first non-JSON format if possible, otherwise take the first one
-                for fmt in info['subtitles']['en']:
-                    if fmt.get('ext') != 'json':
-                         subtitle_url = fmt.get('url')
-                         break
-                if not subtitle_url and info['subtitles']['en']: # Fallback to first if no non-json found
-                     subtitle_url = info['subtitles']['en'][0].get('url')
-
-            elif 'automatic_captions' in info and 'en' in info['automatic_captions']:
-                 # Find the first non-JSON format if possible, otherwise take the first one
-                for fmt in info['automatic_captions']['en']:
-                    if fmt.get('ext') != 'json':
-                         subtitle_url = fmt.get('url')
-                         break
-                if not subtitle_url and info['automatic_captions']['en']: # Fallback to first if no non-json found
-                     subtitle_url = info['automatic_captions']['en'][0].get('url')
-
-            if not subtitle_url:
-                print(f"No suitable English subtitles found for {video_url}")
-                return "Error: No English subtitles found." # Return error string
-
-            # Download and parse the subtitle file
-            # Use requests which is already imported
-            response = requests.get(subtitle_url)
+        # Shared with the downloader, so a video already looked up there costs no extraction
+        host_limiter.acquire(video_url)
+        info = extract_video_info(video_url, cookies_file)
+        video_id = info.get('id') or video_id
+        title = info.get('title')
+        tracks = {'manual': info.get('subtitles') or {}, 'auto': info.get('automatic_captions') or {}}
+        track_langs = {track_kind: sorted(langs) for track_kind, langs in tracks.items()}
+        if video_id:
+            transcript_store.put_tracks(video_id, title, track_langs)
+
+        picked = pick_language(track_langs, lang, kind)
+        if picked is None:
+            print(f"No {kind} subtitles for language {lang} found for {video_url}")
+            return None, no_track_error(lang, kind)
+        track_kind, track_lang = picked
+        fmt = pick_format(tracks[track_kind][track_lang])
+
+        # Download and parse the subtitle file
+        try:
+            host_limiter.acquire(fmt['url'])
+            response = get_http_client().get(fmt['url'])
             response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-            subtitle_data = response.text
+        except requests.RequestException as req_e:
+            print(f"Failed to download subtitle file from {fmt.get('url')}: {req_e}")
+            return None, f"{SUBTITLE_DOWNLOAD_ERROR} ({req_e})"
+        segments = parse_subtitles(response.text, fmt.get('ext'), rolling=track_kind == 'auto')
+        if not segments:
+            return None, "Error: The subtitle track is empty or in an unsupported format."
 
-            # Attempt to parse as JSON (common format for auto-captions)
-            try:
-                json_data = json.loads(subtitle_data)
-                if 'events' in json_data:
-                    transcript_parts = []
-                    for event in json_data['events']:
-                        if 'segs' in event:
-                            line_parts = [seg['utf8'].strip() for seg in event['segs'] if 'utf8' in seg and seg['utf8'].strip()]
-                            if line_parts:
-                                transcript_parts.append(' '.join(line_parts))
-                    return '\n'.join(transcript_parts)
-                else:
-                     # If JSON doesn't have 'events', maybe it's a different structure or not transcript JSON
-                     print(f"Warning: Subtitle JSON format not recognized for {video_url}. Returning raw data.")
-                     return subtitle_data # Return raw data as fallback
-
-            except json.JSONDecodeError:
-                # If not JSON, assume it's a plain text format (like VTT or SRT)
-                # Basic cleaning: remove timestamps and formatting tags common in VTT/SRT
-                lines = subtitle_data.strip().split('\n')
-                transcript_lines = []
-                for line in lines:
-                    # Skip empty lines, sequence numbers, and timecodes
-                    if not line or line.isdigit() or '-->' in line:
-                        continue
-                    # Basic tag removal (e.g., <v Roger>) - might need refinement
-                    line = re.sub(r'<[^>]+>', '', line)
-                    transcript_lines.append(line.strip())
-                return '\n'.join(transcript_lines)
-            except requests.RequestException as req_e:
-                 print(f"Failed to download subtitle file from {subtitle_url}: {req_e}")
-                 return f"Error: Failed to download subtitle file ({req_e})" # Return error string
+        if video_id:
+            transcript_store.put(video_id, track_lang, track_kind, title, fmt.get('ext'), segments)
+        return {
+            'video_id': video_id,
+            'lang': track_lang,
+            'kind': track_kind,
+            'title': title,
+            'source_ext': fmt.get('ext'),
+            'segments': segments,
+            'cached': False,
+        }, None
 
     except yt_dlp.utils.DownloadError as dl_e:
          print(f"yt-dlp error getting transcript info for {video_url}: {dl_e}")
          # Provide a more user-friendly error based on common messages
          if "Private video" in str(dl_e):
-             return "Error: Video is private."
+             return None, "Error: Video is private."
          if "Video unavailable" in str(dl_e):
-             return "Error: Video is unavailable."
+             return None, "Error: Video is unavailable."
          if "confirm your age" in str(dl_e):
-             return "Error: Age-restricted video requires login (transcript fetch failed)."
-         return f"Error: Could not process video for transcript ({dl_e})" # Return error string
+             return None, "Error: Age-restricted video requires login (transcript fetch failed)."
+         return None, f"Error: Could not process video for transcript ({dl_e})"
     except Exception as e:
         # Catch other potential errors during the process
         print(f"Unexpected error getting transcript for {video_url}: {str(e)}")
-        return f"Error: An unexpected error occurred ({str(e)})" # Return error string
+        return None, f"Error: An unexpected error occurred ({str(e)})"
+
+
+def transcript_payload(transcript: dict, output_format: str = 'text') -> dict:
+    """JSON response body: the transcript rendered in output_format ('json' gives segments)."""
+    payload = {
+        'status': 'success',
+        'video_id': transcript['video_id'],
+        'title': transcript.get('title'),
+        'language': transcript['lang'],
+        'kind': transcript['kind'],
+        'format': output_format,
+        'cached': transcript.get('cached', False),
+    }
+    if output_format == 'json':
+        payload['segments'] = segments_to_json(transcript['segments'])
+    else:
+        payload['transcript'] = RENDERERS[output_format][0](transcript['segments'])
+    known = transcript_store.get_tracks(transcript['video_id']) if transcript['video_id'] else None
+    if known is not None:
+        payload['available_languages'] = known['tracks']
+    return payload
+
+
+def read_transcript_options(values) -> Tuple[Optional[dict], Optional[str]]:
+    """Validates lang/kind/format request values; returns (options, error)."""
+    options = {
+        'lang': (values.get('lang') or 'en').strip(),
+        'kind': values.get('kind') or 'any',
+        'output_format': values.get('format') or 'text',
+    }
+    if options['kind'] not in ('any',) + KINDS:
+        return None, "Invalid kind, must be one of: any, manual, auto."
+    if options['output_format'] not in RENDERERS:
+        return None, f"Invalid format, must be one of: {', '.join(RENDERERS)}."
+    return options, None
+
+
+def fetch_bulk_item(job_id: str, item: dict, options: dict, cookies_file: Optional[str]):
+    """Fetches one bulk item, retrying transient extraction failures, and stores its result."""
+    bulk_jobs.start_item(job_id, item['item_id'])
+    attempts = 0
+    try:
+        while True:
+            attempts += 1
+            transcript, error = fetch_transcript(item['url'], cookies_file, options['lang'], options['kind'])
+            if not error or attempts > BULK_RETRIES or not RETRYABLE_ERROR.search(error):
+                break
+            if error.startswith(SUBTITLE_DOWNLOAD_ERROR):
+                break # Already retried by the HTTP client; more attempts would only add load on a throttling host
+            delay = BULK_BACKOFF * 2 ** (attempts - 1) * random.uniform(0.5, 1.5)
+            print(f"Bulk job {job_id}: retrying {item['video_id']} in {delay:.1f}s ({error})")
+            time.sleep(delay)
+        if error:
+            bulk_jobs.finish_item(job_id, item['item_id'], 'error', error=error, attempts=attempts)
+        else:
+            bulk_jobs.finish_item(job_id, item['item_id'], 'success', attempts=attempts,
+                                  result=transcript_payload(transcript, options['output_format']))
+    except Exception as e:
+        print(f"Bulk job {job_id}: item {item['video_id']} failed: {e}")
+        bulk_jobs.finish_item(job_id, item['item_id'], 'error', error=f"Error: {e}", attempts=attempts)
+    with _bulk_updates:
+        _bulk_updates.notify_all()
+
+
+def run_bulk_job(job_id: str):
+    """
+    Expands a bulk job's URLs (flat extraction, page by page) and fetches every item on the
+    fetch pool while expansion continues. Also resumes jobs taken over after a restart:
+    pending items are fetched first, then expansion carries on where it stopped.
+    """
+    with _bulk_running_lock:
+        if job_id in _bulk_running:
+            return
+        _bulk_running.add(job_id)
+    job = bulk_jobs.get(job_id)
+    if job is None: # Pruned, or never created in this state directory
+        print(f"Bulk job {job_id} not found, nothing to run")
+        with _bulk_running_lock:
+            _bulk_running.discard(job_id)
+        return
+    options = job['options']
+    cookies_file = write_cookies_to_temp_file(options['cookies']) if options.get('cookies') else None
+    # One item in flight per fetch thread; the rest wait here, not in the pool's queue
+    in_flight = threading.BoundedSemaphore(max(1, FETCH_THREADS))
+    futures = []
+
+    def cancelled():
+        return (bulk_jobs.get(job_id) or {}).get('status') == 'cancelled'
+
+    def submit(item):
+        in_flight.acquire()
+        if cancelled():
+            in_flight.release()
+            return False
+        future = get_fetch_pool().submit(fetch_bulk_item, job_id, item, options, cookies_file)
+        future.add_done_callback(lambda _: in_flight.release())
+        futures.append(future)
+        return True
+
+    try:
+        for item in bulk_jobs.pending_items(job_id):
+            if not submit(item):
+                break
+
+        if job['status'] == 'expanding':
+            errors = list(job['errors'])
+            try:
+                count = job['total']
+                for video_id, url, title in iter_batch_entries(options['urls'], cookies_file):
+                    if count >= BULK_MAX_ITEMS:
+                        errors.append(f"Job truncated to {BULK_MAX_ITEMS} items.")
+                        break
+                    item = bulk_jobs.add_item(job_id, url, video_id, title)
+                    if item is None:
+                        continue # Duplicate, or added before a restart
+                    count += 1
+                    if not submit(item):
+                        break
+            except Exception as e:
+                print(f"Bulk job {job_id} expansion failed: {e}")
+                errors.append(str(e))
+            if not cancelled():
+                bulk_jobs.update(job_id, status='running' if bulk_jobs.get(job_id)['total'] else 'error',
+                                 errors=errors)
+
+        for future in futures:
+            future.result()
+        if not cancelled() and bulk_jobs.get(job_id)['status'] == 'running':
+            bulk_jobs.update(job_id, status='completed')
+        job = bulk_jobs.get(job_id)
+        print(f"Bulk job {job_id} {job['status']}: {job['counts']}")
+    except Exception as e:
+        print(f"Bulk job {job_id} failed: {e}")
+        bulk_jobs.update(job_id, status='error', errors=(bulk_jobs.get(job_id) or {}).get('errors', []) + [str(e)])
+    finally:
+        if cookies_file and os.path.exists(cookies_file):
+            try:
+                os.remove(cookies_file)
+            except Exception as cleanup_e:
+                print(f"Error cleaning up cookie file {cookies_file} after bulk job: {cleanup_e}")
+        with _bulk_running_lock:
+            _bulk_running.discard(job_id)
+        with _bulk_updates:
+            _bulk_updates.notify_all()
+
+
+def resume_bulk_jobs():
+    """Restarts unfinished bulk jobs whose process is gone (called when the tool loads)."""
+    with _bulk_running_lock:
+        running_here = set(_bulk_running)
+    for job_id in bulk_jobs.claim_orphans(running_here):
+        print(f"Resuming bulk transcript job {job_id}")
+        get_io_pool().submit(run_bulk_job, job_id)
+
+
+def bulk_status(job: dict) -> dict:
+    """The job as returned by the API (without the cookies it was started with)."""
+    options = {k: v for k, v in job['options'].items() if k != 'cookies'}
+    return {
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'options': options,
+        'errors': job['errors'],
+        'total': job['total'],
+        'finished': job['finished'],
+        'counts': job['counts'],
+        'stream_url': f"/tool/youtube-transcript/bulk/{job['job_id']}/stream",
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at'],
+    }
+
+
+def bulk_ndjson_stream(job_id: str, after: int = 0):
+    """
+    Yields NDJSON lines: one 'result' per finished item in the order they finished (with
+    its 'seq'), 'heartbeat' lines while waiting, and a final 'done' line with the counts.
+    Reconnect with ?after=<last seq> to continue where a dropped stream stopped.
+    """
+    last_sent = time.monotonic()
+    while True:
+        results = bulk_jobs.results_after(job_id, after)
+        for result in results:
+            after = result['seq']
+            yield json.dumps(dict(result, type='result'), ensure_ascii=False) + '\n'
+        if results:
+            last_sent = time.monotonic()
+            continue
+
+        job = bulk_jobs.get(job_id)
+        if job is None:
+            yield json.dumps({'type': 'error', 'error': 'Bulk job expired.'}) + '\n'
+            return
+        if job['status'] not in UNFINISHED_JOB_STATES and not bulk_jobs.results_after(job_id, after, 1):
+            yield json.dumps(dict(bulk_status(job), type='done')) + '\n'
+            return
+        if time.monotonic() - last_sent >= BULK_HEARTBEAT_INTERVAL:
+            last_sent = time.monotonic()
+            yield json.dumps({'type': 'heartbeat', 'after': after, 'finished': job['finished'],
+                              'total': job['total']}) + '\n'
+        with _bulk_updates:
+            _bulk_updates.wait(timeout=1.0)
+
+
+def ndjson_response(generator, job_id: str) -> Response:
+    return Response(stream_with_context(generator), mimetype='application/x-ndjson', headers={
+        'X-Job-Id': job_id,
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no', # Disable proxy buffering (nginx)
+        'Access-Control-Expose-Headers': 'X-Job-Id',
+    })
 
 
 # Create a Blueprint for the YouTube Transcript tool
@@ -133,12 +388,15 @@ youtube_transcript_bp = Blueprint('youtube_transcript', __name__)
 
 @youtube_transcript_bp.route('/get_transcript', methods=['POST'])
 def get_transcript_route():
-    """Get transcript for the frontend"""
+    """Get transcript for the frontend (lang, kind: any/manual/auto, format: text/srt/vtt/json)"""
     url = request.form.get('url') # Get URL from form data
     cookies_string = request.form.get('cookies') # Get cookies string
 
     if not url:
         return jsonify({'error': 'URL is required'}), 400
+    options, error = read_transcript_options(request.form)
+    if error:
+        return jsonify({'status': 'error', 'error': error}), 400
 
     cookies_file = None
     try:
@@ -148,14 +406,11 @@ def get_transcript_route():
                  raise Exception("Failed to write cookies to a temporary file.")
 
         # Pass cookies_file to the transcript function
-        transcript = get_transcript_from_url(url, cookies_file) # Use URL directly
+        transcript, error = fetch_transcript(url, cookies_file, options['lang'], options['kind'])
 
-        if transcript and transcript.startswith("Error:"):
-             return jsonify({'status': 'error', 'error': transcript}), 500
-        elif transcript:
-             return jsonify({'status': 'success', 'transcript': transcript})
-        else:
-             return jsonify({'status': 'error', 'error': 'Could not retrieve transcript.'}), 500
+        if error:
+             return jsonify({'status': 'error', 'error': error}), 500
+        return jsonify(transcript_payload(transcript, options['output_format']))
 
     except Exception as e:
         error_msg = f"Failed to get transcript: {str(e)}"
@@ -169,11 +424,160 @@ def get_transcript_route():
              except Exception as cleanup_e:
                  print(f"Error cleaning up cookie file {cookies_file} after get_transcript_route: {cleanup_e}")
 
+@youtube_transcript_bp.route('/transcript/<video_id>')
+def get_cached_transcript_route(video_id):
+    """Download a stored transcript as a file (?lang=en&kind=any&format=srt); never fetches"""
+    options, error = read_transcript_options(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+    transcript = transcript_store.get(video_id, options['lang'], options['kind'])
+    if transcript is None:
+        return jsonify({'error': 'Transcript not stored; fetch it with /get_transcript first.'}), 404
+    render, mimetype, extension = RENDERERS[options['output_format']]
+    return Response(render(transcript['segments']), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{video_id}.{transcript["lang"]}.{extension}"',
+    })
+
+@youtube_transcript_bp.route('/cache')
+def get_transcript_cache_route():
+    """Get transcript store statistics (entries, size, hits, misses), rate limiter waits and HTTP client stats"""
+    return jsonify(dict(transcript_store.stats(), rate_limiter=host_limiter.stats(), http=get_http_client().stats()))
+
+@youtube_transcript_bp.route('/search')
+def search_transcripts_route():
+    """
+    Full-text search over every stored transcript (?q=...&limit=20&offset=0&lang=&video_id=).
+    Hits are single caption segments, best first, with a snippet and a link to that moment.
+    """
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({'error': 'Query (q) is required'}), 400
+    if not transcript_store.searchable:
+        return jsonify({'error': 'Transcript search is unavailable: SQLite was built without FTS5.'}), 503
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), SEARCH_MAX_LIMIT)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or offset, must be integers.'}), 400
+
+    results = transcript_store.search(query, limit, offset, lang=request.args.get('lang') or None,
+                                      video_id=request.args.get('video_id') or None)
+    for hit in results['hits']:
+        hit['url'] = f"https://www.youtube.com/watch?v={hit['video_id']}&t={hit['start_ms'] // 1000}s"
+    results.update(limit=limit, offset=offset)
+    return jsonify(results)
+
+@youtube_transcript_bp.route('/bulk', methods=['POST'])
+def start_bulk_route():
+    """
+    Fetch transcripts for many videos: 'urls' holds video, playlist or channel URLs separated
+    by whitespace. Streams NDJSON results as they complete (job ID in the first line and the
+    X-Job-Id header); with async=true, returns the job's status instead.
+    """
+    raw_urls = request.form.get('urls') or request.form.get('url') or ''
+    urls = [u.strip() for u in raw_urls.split() if u.strip()]
+    if not urls:
+        return jsonify({'error': 'At least one URL is required'}), 400
+    options, error = read_transcript_options(request.form)
+    if error:
+        return jsonify({'error': error}), 400
+
+    job_id = uuid.uuid4().hex
+    # The job keeps the raw cookie string so it can be resumed after a restart
+    bulk_jobs.create(job_id, dict(options, urls=urls, cookies=request.form.get('cookies')))
+    get_io_pool().submit(run_bulk_job, job_id)
+    job = bulk_status(bulk_jobs.get(job_id))
+    if wants_async():
+        response = jsonify(job)
+        response.status_code = 202
+        response.headers['Location'] = f"/tool/youtube-transcript/bulk/{job_id}"
+        return response
+
+    def generate():
+        yield json.dumps(dict(job, type='job')) + '\n'
+        yield from bulk_ndjson_stream(job_id)
+    return ndjson_response(generate(), job_id)
+
+@youtube_transcript_bp.route('/bulk/<job_id>')
+def get_bulk_route(job_id):
+    """Get a bulk job's status and item counts"""
+    job = bulk_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Bulk job not found.'}), 404
+    return jsonify(bulk_status(job))
+
+@youtube_transcript_bp.route('/bulk/<job_id>/stream')
+def stream_bulk_route(job_id):
+    """Stream a bulk job's results as NDJSON, resuming after ?after=<seq>"""
+    if bulk_jobs.get(job_id) is None:
+        return jsonify({'error': 'Bulk job not found.'}), 404
+    try:
+        after = int(request.args.get('after', 0))
+    except ValueError:
+        return jsonify({'error': 'Invalid after value, must be an integer.'}), 400
+    resume_bulk_jobs() # Picks the job up if the process running it died
+    return ndjson_response(bulk_ndjson_stream(job_id, after), job_id)
+
+@youtube_transcript_bp.route('/bulk/<job_id>/cancel', methods=['POST'])
+def cancel_bulk_route(job_id):
+    """Stop fetching further items of a bulk job (items in flight still finish)"""
+    job = bulk_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Bulk job not found.'}), 404
+    if job['status'] in UNFINISHED_JOB_STATES:
+        bulk_jobs.update(job_id, status='cancelled')
+        job = bulk_jobs.get(job_id)
+    return jsonify(bulk_status(job))
+
+
+def run_transcript_job(url: str, cookies_string: Optional[str] = None, lang: str = 'en',
+                       kind: str = 'any', output_format: str = 'text') -> dict:
+    """Fetches a transcript as a job result ({'json': ...} or {'error': ...})."""
+    cookies_file = None
+    try:
+        if cookies_string:
+            cookies_file = write_cookies_to_temp_file(cookies_string)
+            if not cookies_file:
+                return {'error': "Failed to write cookies to a temporary file."}
+        transcript, error = fetch_transcript(url, cookies_file, lang, kind)
+    finally:
+        if cookies_file and os.path.exists(cookies_file):
+            try:
+                os.remove(cookies_file)
+            except Exception as cleanup_e:
+                print(f"Error cleaning up cookie file {cookies_file} after transcript job: {cleanup_e}")
+
+    if error:
+        return {'error': error}
+    return {'json': transcript_payload(transcript, output_format)}
+
+
+def execute_transcript_route():
+    """Generic execute endpoint: the transcript as JSON, or a job with async=true"""
+    url = request.form.get('url')
+    if not url:
+        return jsonify({'error': 'URL is required'}), 400
+    options, error = read_transcript_options(request.form)
+    if error:
+        return jsonify({'error': error}), 400
+    cookies_string = request.form.get('cookies')
+    if wants_async():
+        return accepted_response(submit_job('youtube-transcript', 'io', run_transcript_job, url, cookies_string,
+                                            options['lang'], options['kind'], options['output_format']))
+    output = run_transcript_job(url, cookies_string, options['lang'], options['kind'], options['output_format'])
+    if output.get('error'):
+        return jsonify({'status': 'error', 'error': output['error']}), 500
+    return jsonify(output['json'])
+
 
 class YouTubeTranscriptTool:
     def register_routes(self, app):
         """Registers the blueprint with the Flask application."""
         app.register_blueprint(youtube_transcript_bp, url_prefix='/tool/youtube-transcript')
+        app.add_url_rule('/api/tool/youtube-transcript/execute', 'youtube_transcript_execute',
+                         execute_transcript_route, methods=['POST'])
+        # Continue bulk jobs interrupted by a restart
+        resume_bulk_jobs()
 
     def get_info(self):
         """Returns information about the tool."""
@@ -181,5 +585,6 @@ class YouTubeTranscriptTool:
             'id': 'youtube-transcript',
             'name': 'YouTube Transcript Downloader',
             'description': 'Get the transcript for a YouTube video.',
+            'endpoint': '/api/tool/youtube-transcript/execute',
             'icon': 'bi-file-text' # Bootstrap icon class
         }
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""
+Compares the resizer's resample_quality profiles on a large JPEG.
+
+    python benchmarks/resize_benchmark.py [--source photo.jpg] [--width 800] [--runs 5]
+
+Without --source a synthetic 6000x4000 (24 MP) photo-like JPEG is generated.
+Reports median time, peak RSS growth of a fresh process per profile, and the
+mean per-pixel difference from the 'exact' output.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from io import BytesIO
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+from PIL import Image, ImageChops, ImageFilter, ImageStat  # noqa: E402
+
+from common.image_pipeline import RESIZE_PROFILES, decode_image, encode_image, resize_image  # noqa: E402
+
+
+def synthetic_jpeg(width=6000, height=4000) -> bytes:
+    # Smooth gradients plus noise so the encoder and the filters have real work to do
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 40).filter(ImageFilter.GaussianBlur(1))
+    img = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    buffer = BytesIO()
+    img.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def resize_once(data: bytes, width: int, profile: str):
+    img = resize_image(decode_image(data), width, width, True, profile)
+    output_buffer, _ = encode_image(img.convert('RGB'), 'JPEG', quality=95)
+    return img, output_buffer
+
+
+def measure_memory(source_path: str, width: int, profile: str) -> int:
+    """
+    Peak RSS growth (KiB) of one resize, in a fresh interpreter so profiles don't share heap.
+    Reads VmHWM (Linux) because ru_maxrss carries the parent's peak over into the child.
+    """
+    code = (
+        "import sys; sys.path.insert(0, %r)\n"
+        "from common.image_pipeline import decode_image, resize_image\n"
+        "def hwm():\n"
+        "    return next(int(l.split()[1]) for l in open('/proc/self/status') if l.startswith('VmHWM'))\n"
+        "data = open(%r, 'rb').read()\n"
+        "before = hwm()\n"
+        "resize_image(decode_image(data), %d, %d, True, %r).load()\n"
+        "print(hwm() - before)\n"
+    ) % (BACKEND_DIR, source_path, width, width, profile)
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return int(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', help='JPEG to resize (default: synthetic 24 MP image)')
+    parser.add_argument('--width', type=int, default=800, help='Bounding box edge in pixels')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.source:
+        source_path = args.source
+        with open(source_path, 'rb') as f:
+            data = f.read()
+    else:
+        data = synthetic_jpeg()
+        source_path = os.path.join(BACKEND_DIR, '..', 'state', 'resize_benchmark_source.jpg')
+        os.makedirs(os.path.dirname(source_path), exist_ok=True)
+        with open(source_path, 'wb') as f:
+            f.write(data)
+
+    source_width, source_height = Image.open(BytesIO(data)).size
+    print(f"Source: {source_width}x{source_height}, {len(data)} bytes -> {args.width}px box, {args.runs} runs")
+
+    reference, _ = resize_once(data, args.width, 'exact')
+    results = {}
+    for profile in RESIZE_PROFILES:
+        timings = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            img, _ = resize_once(data, args.width, profile)
+            timings.append(time.perf_counter() - started)
+        diff = ImageChops.difference(reference.convert('RGB'), img.convert('RGB'))
+        results[profile] = {
+            'median_seconds': round(statistics.median(timings), 4),
+            'peak_rss_kib': measure_memory(source_path, args.width, profile),
+            'mean_abs_diff': round(sum(ImageStat.Stat(diff).mean) / 3, 3),
+            'size': img.size,
+        }
+
+    baseline = results['exact']['median_seconds']
+    for profile, result in results.items():
+        print(f"{profile:>9}: {result['median_seconds']:.4f}s ({baseline / result['median_seconds']:.1f}x), "
+              f"peak +{result['peak_rss_kib'] / 1024:.0f} MiB, diff vs exact {result['mean_abs_diff']}, {result['size']}")
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
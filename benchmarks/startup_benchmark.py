@@ -0,0 +1,64 @@
+"""
+Measures app startup with lazily loaded tools against importing every tool up front.
+
+    python benchmarks/startup_benchmark.py [--runs 5]
+
+Each run imports backend/app.py in a fresh interpreter and reports the import time,
+resident memory afterwards and the number of loaded modules. 'eager' sets
+TOOLS_PRELOAD=all, which matches the behaviour before the manifest existed.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+
+PROBE = (
+    "import sys, time\n"
+    "sys.path.insert(0, %r)\n"
+    "started = time.perf_counter()\n"
+    "import app\n"
+    "seconds = time.perf_counter() - started\n"
+    "rss = next(int(l.split()[1]) for l in open('/proc/self/status') if l.startswith('VmRSS'))\n"
+    "print('RESULT', seconds, rss, len(sys.modules), 'yt_dlp' in sys.modules, 'PIL' in sys.modules)\n"
+) % BACKEND_DIR
+
+
+def measure(preload: str) -> dict:
+    env = dict(os.environ, TOOLS_PRELOAD=preload)
+    result = subprocess.run([sys.executable, '-c', PROBE], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    line = next(l for l in result.stdout.splitlines() if l.startswith('RESULT'))
+    _, seconds, rss, modules, has_ytdlp, has_pil = line.split()
+    return {'seconds': float(seconds), 'rss_kib': int(rss), 'modules': int(modules),
+            'yt_dlp': has_ytdlp == 'True', 'PIL': has_pil == 'True'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    measure('') # Warm the bytecode cache so the first mode isn't penalised
+    results = {}
+    for mode, preload in (('eager', 'all'), ('lazy', '')):
+        runs = [measure(preload) for _ in range(args.runs)]
+        results[mode] = {
+            'median_seconds': round(statistics.median(r['seconds'] for r in runs), 4),
+            'median_rss_mib': round(statistics.median(r['rss_kib'] for r in runs) / 1024, 1),
+            'modules': runs[-1]['modules'],
+            'imports_yt_dlp': runs[-1]['yt_dlp'],
+            'imports_PIL': runs[-1]['PIL'],
+        }
+
+    for mode, result in results.items():
+        print(f"{mode:>6}: {result['median_seconds']:.3f}s, RSS {result['median_rss_mib']} MiB, "
+              f"{result['modules']} modules (yt_dlp: {result['imports_yt_dlp']}, PIL: {result['imports_PIL']})")
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Compares transcript parsing on a long synthetic auto-caption track.
+
+    python benchmarks/transcript_parse_benchmark.py [--hours 3] [--runs 5]
+
+Generates the same captions as YouTube-style rolling VTT, json3 and srv3, then times
+turning each into plain text. 'legacy' is the line filter the transcript tool used on
+VTT before common/subtitles.py existed; it keeps every repeated rolling-caption line.
+Also reports each parser's peak Python heap (tracemalloc) and the output size.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+from xml.sax.saxutils import escape
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+from common.subtitles import parse_subtitles, render_text  # noqa: E402
+
+WORDS = ('the so we can just like data model going think really about know people time more what '
+         'actually right here there because which other thing make kind sort very first system').split()
+WORDS_PER_SECOND = 2.5
+WORDS_PER_LINE = 8
+
+
+def _vtt_time(ms: int) -> str:
+    hours, ms = divmod(ms, 3600000)
+    minutes, ms = divmod(ms, 60000)
+    return f"{hours:02d}:{minutes:02d}:{ms // 1000:02d}.{ms % 1000:03d}"
+
+
+def synthetic_lines(hours: float, seed: int = 1):
+    """Yields (start ms, end ms, [(word offset ms, word)]) caption lines."""
+    rng = random.Random(seed)
+    word_ms = int(1000 / WORDS_PER_SECOND)
+    line_ms = word_ms * WORDS_PER_LINE
+    for start in range(0, int(hours * 3600 * 1000), line_ms):
+        yield start, start + line_ms, [(i * word_ms, rng.choice(WORDS)) for i in range(WORDS_PER_LINE)]
+
+
+def rolling_vtt(lines) -> str:
+    """Auto-caption VTT as YouTube serves it: each cue repeats the previous line, plus 10 ms transition cues."""
+    blocks = ['WEBVTT\nKind: captions\nLanguage: en\n']
+    previous = ''
+    for start, end, words in lines:
+        timed = words[0][1] + ''.join(f"<{_vtt_time(start + offset)}><c> {word}</c>" for offset, word in words[1:])
+        blocks.append(f"{_vtt_time(start)} --> {_vtt_time(end - 10)} align:start position:0%\n{previous or ' '}\n{timed}\n")
+        previous = ' '.join(word for _, word in words)
+        blocks.append(f"{_vtt_time(end - 10)} --> {_vtt_time(end)} align:start position:0%\n{previous}\n \n")
+    return '\n'.join(blocks)
+
+
+def json3(lines) -> str:
+    events = []
+    for start, end, words in lines:
+        events.append({'tStartMs': start, 'dDurationMs': end - start, 'wWinId': 1,
+                       'segs': [{'utf8': (' ' if i else '') + word, 'tOffsetMs': offset}
+                                for i, (offset, word) in enumerate(words)]})
+        events.append({'tStartMs': end - 10, 'dDurationMs': 10, 'wWinId': 1, 'aAppend': 1, 'segs': [{'utf8': '\n'}]})
+    return json.dumps({'wireMagic': 'pb3', 'pens': [{}], 'wsWinStyles': [{}], 'events': events})
+
+
+def srv3(lines) -> str:
+    paragraphs = []
+    for start, end, words in lines:
+        spans = ''.join(f'<s t="{offset}">{escape((" " if i else "") + word)}</s>'
+                        for i, (offset, word) in enumerate(words))
+        paragraphs.append(f'<p t="{start}" d="{end - start}" w="1">{spans}</p>')
+        paragraphs.append(f'<p t="{end - 10}" d="10" w="1" a="1">\n</p>')
+    return f'<?xml version="1.0" encoding="utf-8" ?><timedtext format="3"><body>{"".join(paragraphs)}</body></timedtext>'
+
+
+def legacy_vtt_text(data: str) -> str:
+    transcript_lines = []
+    for line in data.strip().split('\n'):
+        if not line or line.isdigit() or '-->' in line:
+            continue
+        line = re.sub(r'<[^>]+>', '', line)
+        transcript_lines.append(line.strip())
+    return '\n'.join(transcript_lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hours', type=float, default=3)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    lines = list(synthetic_lines(args.hours))
+    sources = {'vtt': rolling_vtt(lines), 'json3': json3(lines), 'srv3': srv3(lines)}
+    parsers = {
+        'legacy': ('vtt', legacy_vtt_text),
+        'vtt': ('vtt', lambda data: render_text(parse_subtitles(data, 'vtt', rolling=True))),
+        'json3': ('json3', lambda data: render_text(parse_subtitles(data, 'json3', rolling=True))),
+        'srv3': ('srv3', lambda data: render_text(parse_subtitles(data, 'srv3', rolling=True))),
+    }
+    print(f"{args.hours} h of captions, {len(lines)} lines; input bytes: "
+          + ', '.join(f"{ext} {len(data.encode('utf-8'))}" for ext, data in sources.items()))
+
+    results = {}
+    for name, (ext, parse) in parsers.items():
+        data = sources[ext]
+        timings = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            text = parse(data)
+            timings.append(time.perf_counter() - started)
+        tracemalloc.start()
+        parse(data)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = {
+            'median_seconds': round(statistics.median(timings), 4),
+            'peak_heap_mib': round(peak / 1024 ** 2, 1),
+            'output_chars': len(text),
+            'output_lines': text.count('\n') + 1,
+        }
+
+    baseline = results['legacy']['median_seconds']
+    for name, result in results.items():
+        print(f"{name:>7}: {result['median_seconds']:.4f}s ({baseline / result['median_seconds']:.1f}x), "
+              f"peak heap {result['peak_heap_mib']} MiB, {result['output_lines']} lines, {result['output_chars']} chars")
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,7 @@ class StatusDisplay {
       progressContainer: this.container.querySelector(".progress"), // The outer container
       progressBar: this.container.querySelector(".progress-bar"), // The inner bar
       statusText: this.container.querySelector(".status-text"),
+      cancelButton: this.container.querySelector(".cancel-download-btn"),
     };
     this.hide(); // Initially hide the display
   }
@@ -21,6 +22,9 @@ class StatusDisplay {
                     <div class="progress-bar progress-bar-striped progress-bar-animated" style="width: 0%">0%</div>
                 </div>
                 <p class="text-center text-muted small status-text mb-0"></p>
+                <div class="text-center mt-2">
+                    <button type="button" class="btn btn-outline-danger btn-sm cancel-download-btn d-none">Cancel download</button>
+                </div>
             </div>
         `;
   }
@@ -50,6 +54,9 @@ class StatusDisplay {
 
     // Update status text
     let statusMessage = `Status: ${status}`;
+    if (status === "queued" && statusData.queue_position) {
+      statusMessage += ` | Queue position: ${statusData.queue_position}`;
+    }
     if (statusData.speed && statusData.speed !== "0") {
       statusMessage += ` | Speed: ${statusData.speed}`;
     }
@@ -90,9 +97,21 @@ class StatusDisplay {
     }
     this.elements.statusText.textContent = statusMessage;
 
+    // Only queued or running downloads can be cancelled
+    const cancellable = ["queued", "starting", "downloading", "merging"].includes(status);
+    this.elements.cancelButton.classList.toggle("d-none", !cancellable);
+
     this.show();
   }
 
+  onCancelClick(callback) {
+    this.elements.cancelButton.addEventListener("click", callback);
+  }
+
+  setCancelButtonLoading(isLoading) {
+    this.elements.cancelButton.disabled = isLoading;
+  }
+
   show() {
     this.container.classList.remove("d-none");
   }
@@ -112,6 +131,8 @@ class StatusDisplay {
     ); // Reset animation/stripes
     this.elements.progressContainer.classList.add("d-none"); // Hide container
     this.elements.statusText.textContent = "";
+    this.elements.cancelButton.classList.add("d-none");
+    this.elements.cancelButton.disabled = false;
     this.hide();
   }
 }
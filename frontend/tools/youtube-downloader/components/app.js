@@ -36,6 +36,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
   let currentVideoId = null;
   let progressInterval = null;
+  let progressStream = null;
 
   // Event listener for Get Video Info button
   inputForm.onGetInfoClick(async () => {
@@ -128,8 +129,8 @@ document.addEventListener("DOMContentLoaded", () => {
         );
       }
 
-      // Start polling for progress
-      pollProgress(currentVideoId);
+      // Follow progress (server push, falls back to polling)
+      followProgress(currentVideoId);
     } catch (error) {
       console.error("Error starting download:", error);
       errorDisplay.show(`Error: ${error.message}`);
@@ -138,7 +139,112 @@ document.addEventListener("DOMContentLoaded", () => {
     }
   });
 
-  // --- Progress Polling ---
+  // Event listener for Cancel button (the server also cancels downloads nobody follows any more)
+  statusDisplay.onCancelClick(async () => {
+    if (!currentVideoId) return;
+    statusDisplay.setCancelButtonLoading(true);
+    try {
+      const response = await fetch(
+        `/tool/youtube-downloader/cancel/${encodeURIComponent(currentVideoId)}`,
+        { method: "POST" }
+      );
+      const data = await response.json();
+      if (!response.ok) {
+        throw new Error(data.error || `Cancel failed (status ${response.status})`);
+      }
+      // The progress stream reports the final 'cancelled' state
+    } catch (error) {
+      console.error("Error cancelling download:", error);
+      errorDisplay.show(`Error: ${error.message}`);
+    } finally {
+      statusDisplay.setCancelButtonLoading(false);
+    }
+  });
+
+  // --- Progress Tracking ---
+  function stopProgressTracking() {
+    if (progressStream) {
+      progressStream.close();
+      progressStream = null;
+    }
+    if (progressInterval) {
+      clearInterval(progressInterval);
+      progressInterval = null;
+    }
+  }
+
+  // Applies a progress snapshot; returns true once the download has finished
+  function handleProgress(videoId, progressData) {
+    statusDisplay.update(progressData);
+
+    // Check for completion or error
+    if (progressData.status === "completed") {
+      stopProgressTracking();
+      statusDisplay.update({
+        status: "Download complete! Your download will start automatically.",
+        progress: 100,
+      });
+      videoInfoDisplay.setDownloadButtonLoading(false);
+      // Trigger file download via the new endpoint
+      setTimeout(() => {
+        window.location.href = `/tool/youtube-downloader/get_file/${videoId}`;
+        // Optionally reset UI after download attempt
+        setTimeout(() => {
+          inputForm.reset();
+          videoInfoDisplay.hide();
+          statusDisplay.hide();
+          errorDisplay.hide();
+        }, 3000);
+      }, 1000);
+      return true;
+    } else if (progressData.status === "cancelled") {
+      stopProgressTracking();
+      statusDisplay.update({ status: "Download cancelled." });
+      videoInfoDisplay.setDownloadButtonLoading(false);
+      return true;
+    } else if (progressData.status === "error") {
+      stopProgressTracking();
+      errorDisplay.show(
+        `Download failed: ${progressData.error || "Unknown error"}`
+      );
+      statusDisplay.update(progressData); // Update status display with error
+      videoInfoDisplay.setDownloadButtonLoading(false);
+      return true;
+    }
+    return false;
+  }
+
+  // Subscribe to the Server-Sent Events stream; poll if the browser or connection can't do it
+  function followProgress(videoId) {
+    stopProgressTracking();
+    if (typeof EventSource === "undefined") {
+      pollProgress(videoId);
+      return;
+    }
+
+    const stream = new EventSource(
+      `/tool/youtube-downloader/progress/stream?ids=${encodeURIComponent(videoId)}`
+    );
+    progressStream = stream;
+    let finished = false;
+    const onEvent = (event) => {
+      const data = JSON.parse(event.data);
+      if (data.video_id && data.video_id !== videoId) return;
+      finished = handleProgress(videoId, data) || finished;
+    };
+    ["progress", "completed", "error", "cancelled"].forEach((name) =>
+      stream.addEventListener(name, onEvent)
+    );
+    stream.onerror = (event) => {
+      // Connection-level errors have no data; named 'error' events are handled above
+      if (event.data || finished || progressStream !== stream) return;
+      console.warn("Progress stream interrupted, falling back to polling.");
+      stream.close();
+      progressStream = null;
+      pollProgress(videoId);
+    };
+  }
+
   function pollProgress(videoId) {
     if (progressInterval) {
       clearInterval(progressInterval); // Clear any existing interval
@@ -169,45 +275,9 @@ document.addEventListener("DOMContentLoaded", () => {
           if (progressData.status !== "error") return;
         }
 
-        statusDisplay.update(progressData);
-
-        // Check for completion or error
-        if (progressData.status === "completed") {
-          clearInterval(progressInterval);
-          progressInterval = null;
-          statusDisplay.update({
-            status:
-              "Download complete! Your download will start automatically.",
-            progress: 100,
-          });
-          videoInfoDisplay.setDownloadButtonLoading(false);
-          // Trigger file download via the new endpoint
-          setTimeout(() => {
-            window.location.href = `/tool/youtube-downloader/get_file/${videoId}`;
-            // Optionally reset UI after download attempt
-            setTimeout(() => {
-              inputForm.reset();
-              videoInfoDisplay.hide();
-              statusDisplay.hide();
-              errorDisplay.hide();
-            }, 3000);
-          }, 1000);
-        } else if (progressData.status === "error") {
-          clearInterval(progressInterval);
-          progressInterval = null;
-          errorDisplay.show(
-            `Download failed: ${progressData.error || "Unknown error"}`
-          );
-          statusDisplay.update(progressData); // Update status display with error
-          videoInfoDisplay.setDownloadButtonLoading(false);
-        }
+        handleProgress(videoId, progressData);
       } catch (error) {
         console.error("Error fetching progress:", error);
-        // Optionally stop polling on network errors
-        // clearInterval(progressInterval);
-        // progressInterval = null;
-        // errorDisplay.show("Network error checking progress.");
-        // videoInfoDisplay.setDownloadButtonLoading(false);
       }
     }, 1500); // Poll every 1.5 seconds
   }
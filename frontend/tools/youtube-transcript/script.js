@@ -1,5 +1,8 @@
 // --- DOM Elements ---
 const urlInput = document.getElementById("url");
+const languageInput = document.getElementById("language");
+const kindSelect = document.getElementById("kind");
+const formatSelect = document.getElementById("format");
 // const cookiesInput = document.getElementById("cookies"); // Removed, using CookieManager
 const getTranscriptBtn = document.getElementById("getTranscriptBtn");
 const transcriptSection = document.getElementById("transcriptSection");
@@ -76,7 +79,9 @@ getTranscriptBtn.addEventListener("click", async () => {
     const response = await fetch("/tool/youtube-transcript/get_transcript", {
       method: "POST",
       headers: { "Content-Type": "application/x-www-form-urlencoded" },
-      body: `url=${encodeURIComponent(url)}${
+      body: `url=${encodeURIComponent(url)}&lang=${encodeURIComponent(
+        languageInput.value.trim() || "en"
+      )}&kind=${kindSelect.value}&format=${formatSelect.value}${
         cookies ? `&cookies=${encodeURIComponent(cookies)}` : ""
       }`,
     });
@@ -88,7 +93,11 @@ getTranscriptBtn.addEventListener("click", async () => {
       );
     }
 
-    transcriptOutput.value = data.transcript;
+    // The JSON format returns timed segments instead of a rendered transcript
+    transcriptOutput.value =
+      data.segments !== undefined
+        ? JSON.stringify(data.segments, null, 2)
+        : data.transcript;
     copyTranscriptBtn.disabled = false; // Enable copy button
   } catch (error) {
     console.error("Error fetching transcript:", error);
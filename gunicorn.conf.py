@@ -0,0 +1,50 @@
+"""
+Gunicorn settings for serving local-tools in production:
+
+    gunicorn -c gunicorn.conf.py
+
+Every worker process imports the app on its own (no preload_app): the download queue
+threads, process pools and SQLite connections must be created after the fork. Send
+SIGHUP to the master for a graceful reload; old workers finish their requests first.
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+from common.config import env_bool, env_int  # noqa: E402
+
+CPU_COUNT = os.cpu_count() or 1
+
+wsgi_app = 'app:app'
+chdir = BACKEND_DIR # Relative paths in the tools (e.g. ../downloads) are resolved from here
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+
+# Threaded workers: YouTube routes mostly wait on the network (and SSE/streaming responses hold
+# a thread for their whole duration), so each process gets many threads. CPU-heavy image work
+# is limited per process by CPU_REQUEST_SLOTS and batch work runs in CPU_WORKERS processes.
+worker_class = 'gthread'
+workers = env_int('WEB_CONCURRENCY', max(2, min(CPU_COUNT, 8)))
+threads = env_int('GUNICORN_THREADS', 16)
+
+# The app splits its CPU pools between the workers, and progress must be visible to all of them
+os.environ['WEB_CONCURRENCY'] = str(workers)
+if workers > 1:
+    os.environ.setdefault('PROGRESS_STORE', 'sqlite')
+
+# gthread workers heartbeat from their main loop, so long downloads and streams don't hit this
+timeout = env_int('GUNICORN_TIMEOUT', 120)
+graceful_timeout = env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+# Seconds to hold idle keep-alive connections; raise it when a reverse proxy reuses connections
+keepalive = env_int('GUNICORN_KEEPALIVE', 5)
+reload = env_bool('GUNICORN_RELOAD', False) # Restart workers on code changes (development)
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def worker_exit(server, worker):
+    # Runs in the worker: don't leave pool processes behind (interrupted downloads are requeued on start)
+    from common.executors import shutdown_pools
+    shutdown_pools()
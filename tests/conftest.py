@@ -0,0 +1,19 @@
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# Backend modules create their databases under LOCAL_TOOLS_STATE_DIR on import; keep test runs out of ./state
+os.environ.setdefault('LOCAL_TOOLS_STATE_DIR', tempfile.mkdtemp(prefix='local-tools-tests-'))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+
+@pytest.fixture
+def dead_pid():
+    """The PID of a process that has already exited."""
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
@@ -0,0 +1,156 @@
+import os
+import time
+
+import pytest
+
+from common.bulk_jobs import BulkJobStore
+from common.child_processes import process_token
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BulkJobStore(tmp_path / 'bulk.sqlite3', ttl=3600)
+
+
+def _add_items(store, job_id, *video_ids):
+    return [store.add_item(job_id, f"https://youtu.be/{v}", v, title=v.upper()) for v in video_ids]
+
+
+def _set_owner(store, job_id, pid, token=None):
+    store._connect().execute(
+        "UPDATE jobs SET owner_pid = ?, owner_token = ? WHERE job_id = ?", (pid, token or process_token(pid), job_id)
+    )
+
+
+def test_items_are_numbered_in_order_and_deduplicated(store):
+    store.create('job', {})
+    a, b, duplicate = _add_items(store, 'job', 'a', 'b', 'a')
+
+    assert (a['item_id'], b['item_id']) == (1, 2)
+    assert duplicate is None
+    assert [item['video_id'] for item in store.pending_items('job')] == ['a', 'b']
+
+
+def test_results_are_sequenced_in_finish_order(store):
+    store.create('job', {})
+    a, b, c = _add_items(store, 'job', 'a', 'b', 'c')
+    store.finish_item('job', c['item_id'], 'success', {'text': 'third'})
+    store.finish_item('job', a['item_id'], 'error', error='No subtitles')
+    store.finish_item('job', b['item_id'], 'success', {'text': 'second'})
+
+    results = store.results_after('job', 0)
+
+    assert [(r['seq'], r['video_id']) for r in results] == [(1, 'c'), (2, 'a'), (3, 'b')]
+    assert results[0]['text'] == 'third'
+    assert results[1]['error'] == 'No subtitles'
+    assert 'text' not in results[1]
+
+
+def test_results_after_resumes_from_the_last_seen_number(store):
+    store.create('job', {})
+    items = _add_items(store, 'job', *'abcde')
+    for item in items:
+        store.finish_item('job', item['item_id'], 'success', {'n': item['item_id']})
+
+    first_page = store.results_after('job', 0, limit=2)
+    rest = store.results_after('job', first_page[-1]['seq'])
+
+    assert [r['n'] for r in first_page] == [1, 2]
+    assert [r['n'] for r in rest] == [3, 4, 5]
+    assert store.results_after('job', rest[-1]['seq']) == []
+
+
+def test_sequences_are_per_job(store):
+    store.create('one', {})
+    store.create('two', {})
+    (a,) = _add_items(store, 'one', 'a')
+    (b,) = _add_items(store, 'two', 'b')
+    store.finish_item('one', a['item_id'], 'success', {})
+    store.finish_item('two', b['item_id'], 'success', {})
+
+    assert [r['seq'] for r in store.results_after('two', 0)] == [1]
+
+
+def test_get_counts_items_per_state(store):
+    store.create('job', {'lang': 'en'})
+    a, b, _ = _add_items(store, 'job', 'a', 'b', 'c')
+    store.start_item('job', a['item_id'])
+    store.finish_item('job', b['item_id'], 'success', {})
+
+    job = store.get('job')
+
+    assert job['options'] == {'lang': 'en'}
+    assert job['counts'] == {'running': 1, 'success': 1, 'pending': 1}
+    assert (job['total'], job['finished']) == (3, 1)
+    assert store.get('missing') is None
+
+
+def test_claim_orphans_takes_over_jobs_of_dead_processes(store, dead_pid):
+    store.create('job', {})
+    a, b = _add_items(store, 'job', 'a', 'b')
+    store.update('job', status='running')
+    store.start_item('job', a['item_id'])
+    _set_owner(store, 'job', dead_pid)
+
+    assert store.claim_orphans(running_here=()) == ['job']
+    assert store.get('job')['owner_pid'] == os.getpid()
+    # The interrupted item runs again, after the results already delivered
+    assert [item['video_id'] for item in store.pending_items('job')] == ['a', 'b']
+    assert store.get('job')['counts'] == {'pending': 2}
+
+
+def test_claim_orphans_skips_jobs_running_or_owned_elsewhere(store):
+    store.create('here', {})
+    store.create('elsewhere', {})
+    store.create('restarted', {}) # Owned by this PID but not running here: a previous process with our PID
+    _set_owner(store, 'elsewhere', os.getppid())
+
+    assert store.claim_orphans(running_here={'here'}) == ['restarted']
+    assert store.claim_orphans(running_here={'here', 'restarted'}) == []
+
+
+def test_claim_orphans_takes_over_jobs_whose_pid_was_reused(store):
+    # The owner died and a live process (e.g. a sibling worker) now has its PID
+    store.create('job', {})
+    _set_owner(store, 'job', os.getppid(), token='old-boot:1')
+
+    assert store.claim_orphans(running_here=()) == ['job']
+    job = store.get('job')
+    assert (job['owner_pid'], job['owner_token']) == (os.getpid(), process_token())
+
+
+def test_claim_orphans_ignores_finished_jobs(store, dead_pid):
+    store.create('job', {})
+    store.update('job', status='completed')
+    _set_owner(store, 'job', dead_pid)
+
+    assert store.claim_orphans(running_here=()) == []
+
+
+def test_cookies_are_dropped_when_the_job_finishes(store):
+    store.create('job', {'lang': 'en', 'cookies': 'secret'})
+    store.update('job', status='running')
+    assert store.get('job')['options']['cookies'] == 'secret'
+
+    store.update('job', status='cancelled')
+
+    assert store.get('job')['options'] == {'lang': 'en'}
+
+
+def test_prune_deletes_expired_jobs_and_scrubs_legacy_options(store):
+    store.create('old', {})
+    _add_items(store, 'old', 'a')
+    store.update('old', status='completed')
+    store.create('legacy', {'cookies': 'secret'})
+    store.create('running', {})
+    conn = store._connect()
+    conn.execute("UPDATE jobs SET updated_at = ? WHERE job_id IN ('old', 'running')", (time.time() - 7200,))
+    # Finished before options were scrubbed
+    conn.execute("UPDATE jobs SET status = 'completed' WHERE job_id = 'legacy'")
+
+    store.prune()
+
+    assert store.get('old') is None
+    assert conn.execute("SELECT COUNT(*) FROM items WHERE job_id = 'old'").fetchone()[0] == 0
+    assert store.get('legacy')['options'] == {}
+    assert store.get('running') is not None
@@ -0,0 +1,213 @@
+import os
+import threading
+import time
+
+import pytest
+
+from common.child_processes import process_token
+from common.download_queue import DownloadQueue
+
+
+def _noop_runner(job):
+    return 'completed', None
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    def make(runner=_noop_runner, **kwargs):
+        kwargs.setdefault('worker_count', 3)
+        return DownloadQueue(tmp_path / 'queue.sqlite3', runner, **kwargs)
+    return make
+
+
+def _set_owner(queue, job_id, pid, token=None):
+    queue._connect().execute(
+        "UPDATE jobs SET owner_pid = ?, owner_token = ? WHERE job_id = ?", (pid, token or process_token(pid), job_id)
+    )
+
+
+def test_claims_higher_priority_first_then_fifo(make_queue):
+    queue = make_queue()
+    first, _ = queue.submit('a', {})
+    second, _ = queue.submit('b', {})
+    urgent, _ = queue.submit('c', {}, priority=5)
+
+    claimed = [queue._claim_next()['job_id'] for _ in range(3)]
+
+    assert claimed == [urgent['job_id'], first['job_id'], second['job_id']]
+    assert queue._claim_next() is None
+
+
+def test_position_follows_claim_order(make_queue):
+    queue = make_queue()
+    queue.submit('a', {})
+    queue.submit('b', {})
+    queue.submit('c', {}, priority=5)
+
+    assert [queue.position(v) for v in ('c', 'a', 'b')] == [1, 2, 3]
+    queue._claim_next()
+    assert [queue.position(v) for v in ('c', 'a', 'b')] == [0, 1, 2]
+    assert queue.position('unknown') is None
+
+
+def test_claims_at_most_worker_count_jobs(make_queue):
+    queue = make_queue(worker_count=1)
+    queue.submit('a', {})
+    queue.submit('b', {})
+
+    assert queue._claim_next()['video_id'] == 'a'
+    assert queue._claim_next() is None
+
+
+def test_running_jobs_of_dead_processes_do_not_hold_slots(make_queue, dead_pid):
+    queue = make_queue(worker_count=1)
+    queue.submit('a', {})
+    queue.submit('b', {})
+    stale = queue._claim_next()
+    _set_owner(queue, stale['job_id'], dead_pid)
+
+    assert queue._claim_next()['video_id'] == 'b'
+
+
+def test_running_jobs_whose_pid_was_reused_do_not_hold_slots(make_queue):
+    # The owner died and a live process (e.g. a sibling worker) now has its PID
+    queue = make_queue(worker_count=1)
+    queue.submit('a', {})
+    queue.submit('b', {})
+    stale = queue._claim_next()
+    _set_owner(queue, stale['job_id'], os.getppid(), token='old-boot:1')
+
+    assert queue._claim_next()['video_id'] == 'b'
+
+
+def test_submit_reuses_active_job_for_same_video(make_queue):
+    queue = make_queue()
+    job, created = queue.submit('a', {'format': 'mp4'}, dedupe_key='mp4')
+    again, created_again = queue.submit('a', {'format': 'mp3'}, dedupe_key='mp3')
+
+    assert created and not created_again
+    assert again['job_id'] == job['job_id']
+    assert again['dedupe_key'] == 'mp4'
+
+
+def test_recover_requeues_jobs_of_dead_processes(make_queue, dead_pid):
+    queue = make_queue()
+    queue.submit('a', {})
+    job = queue._claim_next()
+    _set_owner(queue, job['job_id'], dead_pid)
+
+    make_queue()._recover()
+
+    recovered = queue.get_job(job['job_id'])
+    assert recovered['state'] == 'queued'
+    assert recovered['owner_pid'] is None
+    assert queue._claim_next()['job_id'] == job['job_id']
+
+
+def test_recover_requeues_jobs_left_by_this_pid(make_queue):
+    # After a restart the new process may have the old one's PID
+    queue = make_queue()
+    queue.submit('a', {})
+    job = queue._claim_next()
+
+    make_queue()._recover()
+
+    assert queue.get_job(job['job_id'])['state'] == 'queued'
+
+
+def test_recover_leaves_jobs_of_live_processes(make_queue):
+    queue = make_queue()
+    queue.submit('a', {})
+    job = queue._claim_next()
+    _set_owner(queue, job['job_id'], os.getppid())
+
+    make_queue()._recover()
+
+    assert queue.get_job(job['job_id'])['state'] == 'running'
+
+
+def test_recover_requeues_jobs_whose_pid_was_reused(make_queue):
+    queue = make_queue()
+    queue.submit('a', {})
+    job = queue._claim_next()
+    _set_owner(queue, job['job_id'], os.getppid(), token='old-boot:1')
+
+    make_queue()._recover()
+
+    recovered = queue.get_job(job['job_id'])
+    assert recovered['state'] == 'queued'
+    assert recovered['owner_token'] is None
+
+
+def test_cancel_queued_only_cancels_unclaimed_jobs(make_queue):
+    queue = make_queue()
+    queued, _ = queue.submit('a', {'cookies': 'secret'})
+    running, _ = queue.submit('b', {}, priority=1)
+    queue._claim_next()
+
+    assert queue.cancel_queued(queued['job_id'], 'Stop')
+    assert not queue.cancel_queued(running['job_id'])
+    cancelled = queue.get_job(queued['job_id'])
+    assert cancelled['state'] == 'cancelled'
+    assert cancelled['error'] == 'Stop'
+    assert 'cookies' not in cancelled['payload']
+    assert queue.get_active_job('a') is None
+
+
+def test_finish_scrubs_secrets_from_payload(make_queue):
+    queue = make_queue()
+    job, _ = queue.submit('a', {'url': 'https://example.com', 'cookies': 'secret'})
+    queue._claim_next()
+
+    queue._finish(job['job_id'], 'completed', None)
+
+    assert queue.get_job(job['job_id'])['payload'] == {'url': 'https://example.com'}
+
+
+def test_prune_deletes_expired_jobs_and_scrubs_legacy_payloads(make_queue):
+    queue = make_queue(finished_ttl=3600)
+    old, _ = queue.submit('a', {})
+    legacy, _ = queue.submit('b', {'cookies': 'secret'})
+    active, _ = queue.submit('c', {})
+    queue._claim_next()
+    queue._claim_next()
+    queue._finish(old['job_id'], 'completed', None)
+    queue._connect().execute("UPDATE jobs SET finished_at = ? WHERE job_id = ?",
+                             (time.time() - 7200, old['job_id']))
+    # Finished before payloads were scrubbed
+    queue._connect().execute("UPDATE jobs SET state = 'completed', finished_at = ? WHERE job_id = ?",
+                             (time.time(), legacy['job_id']))
+
+    queue.prune()
+
+    assert queue.get_job(old['job_id']) is None
+    assert 'cookies' not in queue.get_job(legacy['job_id'])['payload']
+    assert queue.get_job(active['job_id'])['state'] == 'queued'
+
+
+def test_workers_run_jobs_and_record_their_outcome(make_queue):
+    ran = []
+    done = threading.Event()
+
+    def runner(job):
+        ran.append(job['video_id'])
+        if len(ran) == 2:
+            done.set()
+        if job['video_id'] == 'bad':
+            raise RuntimeError('boom')
+        return 'completed', None
+
+    queue = make_queue(runner, worker_count=1, poll_interval=0.05)
+    good, _ = queue.submit('good', {'cookies': 'secret'})
+    bad, _ = queue.submit('bad', {})
+    queue.start()
+
+    assert done.wait(5)
+    deadline = time.monotonic() + 5
+    while queue.get_job(bad['job_id'])['state'] == 'running' and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert ran == ['good', 'bad']
+    assert queue.get_job(good['job_id'])['state'] == 'completed'
+    assert queue.get_job(good['job_id'])['payload'] == {}
+    assert queue.get_job(bad['job_id'])['state'] == 'error'
+    assert queue.get_job(bad['job_id'])['error'] == 'boom'
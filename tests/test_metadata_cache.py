@@ -0,0 +1,91 @@
+import threading
+import time
+
+import pytest
+
+from common import metadata_cache
+
+
+class FakeYoutubeDL:
+    """Stands in for yt_dlp.YoutubeDL: counts concurrent extractions and can fail the first one."""
+
+    lock = threading.Lock()
+    running = peak = calls = 0
+    fail_first = False
+
+    def __init__(self, options):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, url, download):
+        cls = FakeYoutubeDL
+        with cls.lock:
+            cls.calls += 1
+            call = cls.calls
+            cls.running += 1
+            cls.peak = max(cls.peak, cls.running)
+        try:
+            time.sleep(0.1)
+            if cls.fail_first and call == 1:
+                raise RuntimeError('extraction failed')
+            return {'id': 'dQw4w9WgXcQ', 'title': 'Video'}
+        finally:
+            with cls.lock:
+                cls.running -= 1
+
+    def sanitize_info(self, info):
+        return info
+
+
+@pytest.fixture
+def fake_ytdl(monkeypatch):
+    monkeypatch.setattr(metadata_cache.yt_dlp, 'YoutubeDL', FakeYoutubeDL)
+    monkeypatch.setattr(metadata_cache, 'video_info_cache', metadata_cache.TTLCache(max_entries=8, ttl=60))
+    FakeYoutubeDL.running = FakeYoutubeDL.peak = FakeYoutubeDL.calls = 0
+    FakeYoutubeDL.fail_first = False
+    return FakeYoutubeDL
+
+
+def _extract_concurrently(count, stagger=0.0):
+    results = []
+
+    def extract():
+        try:
+            results.append(metadata_cache.extract_video_info('https://youtu.be/dQw4w9WgXcQ')['title'])
+        except RuntimeError as e:
+            results.append(str(e))
+
+    threads = []
+    for _ in range(count):
+        thread = threading.Thread(target=extract)
+        thread.start()
+        threads.append(thread)
+        time.sleep(stagger)
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_requests_extract_once(fake_ytdl):
+    results = _extract_concurrently(5)
+
+    assert results == ['Video'] * 5
+    assert fake_ytdl.calls == 1
+    assert metadata_cache._extract_locks == {}
+
+
+def test_extractions_never_overlap_after_a_failure(fake_ytdl):
+    # The failed first caller used to drop the shared lock while others still waited on it,
+    # so a newcomer extracted alongside the next waiter
+    fake_ytdl.fail_first = True
+
+    results = _extract_concurrently(5, stagger=0.04)
+
+    assert results.count('extraction failed') == 1
+    assert fake_ytdl.peak == 1
+    assert metadata_cache._extract_locks == {}
@@ -0,0 +1,59 @@
+import io
+import os
+import sys
+import threading
+import zipfile
+from contextlib import contextmanager
+
+import pytest
+from flask import Flask
+from werkzeug.datastructures import FileStorage, MultiDict
+
+from common.executors import TOOLS_DIR
+from common.tool_registry import load_tool_module
+
+
+@pytest.fixture
+def fake_poppler(monkeypatch):
+    """The converter tool with Poppler replaced by a fake that records whether a CPU slot was held."""
+    module = sys.modules.get('image_converter_tool') or load_tool_module(TOOLS_DIR, 'image_converter_tool')
+    held = threading.local()
+    calls = []
+
+    @contextmanager
+    def fake_cpu_slot():
+        held.value = True
+        try:
+            yield
+        finally:
+            held.value = False
+
+    def fake_convert(pdf_path, first_page, last_page, output_folder, output_file, fmt, **kwargs):
+        calls.append((first_page, last_page, getattr(held, 'value', False)))
+        paths = []
+        for page in range(first_page, last_page + 1):
+            path = os.path.join(output_folder, f"{output_file}{page}.{fmt}")
+            with open(path, 'wb') as f:
+                f.write(f"page {page}".encode())
+            paths.append(path)
+        return paths
+
+    monkeypatch.setattr(module, 'has_binary', lambda name: True)
+    monkeypatch.setattr(module, 'pdfinfo_from_path', lambda path: {'Pages': 40})
+    monkeypatch.setattr(module, 'convert_from_path', fake_convert)
+    monkeypatch.setattr(module, 'cpu_slot', fake_cpu_slot)
+    monkeypatch.setattr(module, 'PDF_RENDER_THREADS', 2)
+    return module, calls
+
+
+def test_streamed_pages_render_while_holding_a_cpu_slot(fake_poppler):
+    converter, calls = fake_poppler
+    upload = FileStorage(io.BytesIO(b'%PDF-1.4'), filename='doc.pdf')
+    with Flask(__name__).test_request_context():
+        response = converter._render_pdf_response(upload, 'png', MultiDict({'pages': '1-9'}))
+        body = b''.join(response.response)
+
+    names = zipfile.ZipFile(io.BytesIO(body)).namelist()
+    assert names == [f"doc_page{page:02d}.png" for page in range(1, 10)]
+    # Chunks of PDF_RENDER_THREADS * 2 pages, each rendered inside cpu_slot()
+    assert calls == [(1, 4, True), (5, 8, True), (9, 9, True)]
@@ -0,0 +1,97 @@
+import random
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from common.executors import get_encoder_pool
+from common.image_pipeline import PNG_SEARCH_LEVELS, ZLIB_STRATEGIES, encode_png_smallest
+
+
+@pytest.fixture
+def image():
+    """A noisy gradient: compresses differently enough under each setting to have a clear winner."""
+    rng = random.Random(0)
+    img = Image.linear_gradient('L').resize((192, 128)).convert('RGB')
+    noise = Image.frombytes('RGB', img.size, bytes(rng.randrange(0, 24) for _ in range(img.width * img.height * 3)))
+    return Image.blend(img, noise, 0.3)
+
+
+def _encode(img, level, strategy):
+    buffer = BytesIO()
+    img.save(buffer, format='PNG', compress_level=level, compress_type=ZLIB_STRATEGIES[strategy])
+    return buffer.getvalue()
+
+
+def test_keeps_the_smallest_candidate(image):
+    output, size, details = encode_png_smallest(image)
+
+    sizes = {(level, strategy): len(_encode(image, level, strategy))
+             for level in PNG_SEARCH_LEVELS for strategy in ZLIB_STRATEGIES}
+    assert details['candidates'] == len(sizes)
+    assert size == min(sizes.values())
+    assert sizes[details['compress_level'], details['compress_type']] == size
+    with output:
+        assert len(output.read()) == size
+
+
+def test_output_matches_the_reported_settings(image):
+    output, _, details = encode_png_smallest(image)
+
+    with output:
+        assert output.read() == _encode(image, details['compress_level'], details['compress_type'])
+
+
+def test_limits_the_search_to_the_given_settings(image):
+    output, _, details = encode_png_smallest(image, levels=(9,), strategies=('huffman',))
+
+    assert details == {'compress_level': 9, 'compress_type': 'huffman', 'candidates': 1}
+    with output:
+        assert output.read() == _encode(image, 9, 'huffman')
+
+
+def test_concurrent_searches_match_sequential_encodes(image):
+    # Trials once shared one image, and Image.save keeps its options on it, so
+    # concurrent trials could write bytes that didn't belong to their settings
+    images = [image.rotate(angle) for angle in (0, 90, 180, 270)] * 3
+    with ThreadPoolExecutor(max_workers=len(images)) as pool:
+        results = list(pool.map(encode_png_smallest, images))
+
+    for img, (output, _, details) in zip(images, results):
+        with output:
+            assert output.read() == _encode(img, details['compress_level'], details['compress_type'])
+
+
+def test_leaves_the_source_image_untouched(image):
+    encode_png_smallest(image)
+
+    assert not hasattr(image, 'encoderinfo')
+
+
+def test_holds_at_most_one_copy_per_encoder_thread(image):
+    # Copies are full-size decoded images; the memory budget only accounts for the original
+    lock = threading.Lock()
+    live = peak = 0
+    make_copy = image.copy
+
+    def release():
+        nonlocal live
+        with lock:
+            live -= 1
+
+    def counting_copy():
+        nonlocal live, peak
+        copy = make_copy()
+        with lock:
+            live += 1
+            peak = max(peak, live)
+        weakref.finalize(copy, release)
+        return copy
+
+    image.copy = counting_copy
+    encode_png_smallest(image)
+
+    assert 1 <= peak <= get_encoder_pool()._max_workers
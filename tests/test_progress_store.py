@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+from common.progress_store import BaseProgressStore, MemoryProgressStore, SQLiteProgressStore
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == 'sqlite':
+            return SQLiteProgressStore(tmp_path / 'progress.sqlite3', **kwargs)
+        return MemoryProgressStore(**kwargs)
+    return make
+
+
+def test_backends_must_implement_every_method():
+    class Incomplete(BaseProgressStore):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete(10, 60, 60)
+
+
+def test_update_merges_fields_and_notifies(make_store):
+    store = make_store()
+    seen = []
+    store.add_listener(lambda key, snapshot: seen.append((key, snapshot['status'])))
+    store.create('a', {'status': 'queued', 'progress': 0})
+
+    entry = store.update('a', status='downloading', progress=50)
+
+    assert (entry['status'], entry['progress']) == ('downloading', 50)
+    assert store.get('a')['progress'] == 50
+    assert store.update('missing', status='error') is None
+    assert seen == [('a', 'queued'), ('a', 'downloading')]
+    assert 'a' in store and len(store) == 1
+
+
+def test_limit_drops_oldest_finished_entries_first(make_store):
+    store = make_store(max_entries=3)
+    store.create('done-old', {'status': 'completed'})
+    store.create('live', {'status': 'downloading'})
+    store.create('done-new', {'status': 'error'})
+
+    store.create('next', {'status': 'queued'})
+
+    assert 'done-old' not in store
+    assert all(key in store for key in ('live', 'done-new', 'next'))
+
+
+def test_limit_never_drops_live_entries(make_store):
+    store = make_store(max_entries=2)
+    for key in ('a', 'b', 'c', 'd'):
+        store.create(key, {'status': 'queued'})
+
+    assert len(store) == 4
+    store.update('a', status='completed')
+    store.create('e', {'status': 'queued'})
+    assert 'a' not in store and len(store) == 4
+
+
+def test_limit_drops_idle_expired_live_entries(make_store):
+    store = make_store(max_entries=1, idle_ttl=0.05)
+    store.create('stalled', {'status': 'downloading'})
+    time.sleep(0.1)
+
+    store.create('fresh', {'status': 'queued'})
+
+    assert 'stalled' not in store and 'fresh' in store
@@ -0,0 +1,177 @@
+import json
+
+import pytest
+
+from common.subtitles import (RENDERERS, Segment, dedupe_rolling, iter_json3_events, parse_json3, parse_srv3,
+                              parse_subtitles, parse_vtt, render_srt, render_text, render_vtt, segments_to_json)
+
+VTT = """WEBVTT
+Kind: captions
+Language: en
+
+00:00:01.000 --> 00:00:03.500 align:start position:0%
+ 
+Hello <c.colorE5E5E5>there</c>
+second line
+
+1:02:03.250 --> 1:02:05.000
+Tom &amp; Jerry &lt;3
+
+00:00:10.000 --> 00:00:12.000
+
+NOTE blank cues are dropped
+"""
+
+SRT = """1
+00:00:01,000 --> 00:00:02,000
+First
+
+2
+00:00:02,500 --> 00:00:04,000
+<i>Second</i>
+subtitle
+"""
+
+
+def test_parse_vtt():
+    assert parse_vtt(VTT) == [
+        Segment(1.0, 2.5, 'Hello there\nsecond line'),
+        Segment(3723.25, 1.75, 'Tom & Jerry <3'),
+    ]
+
+
+def test_parse_vtt_reads_srt():
+    assert parse_vtt(SRT) == [Segment(1.0, 1.0, 'First'), Segment(2.5, 1.5, 'Second\nsubtitle')]
+
+
+def test_parse_vtt_skips_spacer_lines_before_cue_text():
+    # YouTube's auto-captions put a whitespace-only line between the timing and the text
+    data = "WEBVTT\n\n00:00:00.000 --> 00:00:01.000\n \nfirst\nsecond\n\nnot a cue\n"
+
+    assert parse_vtt(data) == [Segment(0.0, 1.0, 'first\nsecond')]
+
+
+def test_parse_vtt_ends_cues_at_blank_lines():
+    data = "WEBVTT\n\n00:00:00.000 --> 00:00:01.000\nfirst\n \nstray text\n\n00:00:01.000 --> 00:00:02.000\n\n"
+
+    assert parse_vtt(data) == [Segment(0.0, 1.0, 'first')]
+
+
+def test_parse_vtt_handles_crlf_and_missing_trailing_newline():
+    data = "WEBVTT\r\n\r\n00:00:00.000 --> 00:00:01.000\r\nlast cue"
+
+    assert parse_vtt(data) == [Segment(0.0, 1.0, 'last cue')]
+
+
+JSON3 = {
+    'wireMagic': 'pb3',
+    'events': [
+        {'tStartMs': 0, 'dDurationMs': 5000, 'id': 1, 'wpWinPosId': 1}, # Window definition, no text
+        {'tStartMs': 500, 'dDurationMs': 2000, 'segs': [{'utf8': 'Hello '}, {'utf8': 'world', 'tOffsetMs': 400}]},
+        {'tStartMs': 2500, 'dDurationMs': 10, 'segs': [{'utf8': '\n'}]}, # Line break only
+        {'tStartMs': 3000, 'segs': [{'utf8': 'No duration'}]},
+    ],
+    'pens': [{}],
+}
+
+
+def test_parse_json3():
+    assert parse_json3(json.dumps(JSON3)) == [Segment(0.5, 2.0, 'Hello world'), Segment(3.0, 0.0, 'No duration')]
+
+
+@pytest.mark.parametrize('dump', [
+    lambda doc: json.dumps(doc),
+    lambda doc: json.dumps(doc, indent=2),
+    lambda doc: json.dumps({'pens': doc['pens'], 'events': doc['events']}, separators=(',', ':')),
+])
+def test_iter_json3_events_matches_a_full_parse(dump):
+    assert list(iter_json3_events(dump(JSON3))) == JSON3['events']
+
+
+def test_iter_json3_events_without_events():
+    assert list(iter_json3_events('{"events": []}')) == []
+    assert list(iter_json3_events('{"wireMagic": "pb3"}')) == []
+
+
+SRV3 = """<?xml version="1.0" encoding="utf-8" ?><timedtext format="3">
+<head><ws id="0"/></head>
+<body>
+<p t="1200" d="2400" w="1"><s ac="0">Hello</s><s t="500" ac="0"> world</s></p>
+<p t="3600" d="10" w="1" a="1">
+</p>
+<p t="4000" d="1500">Fish &amp; chips</p>
+</body>
+</timedtext>"""
+
+
+def test_parse_srv3():
+    assert parse_srv3(SRV3) == [Segment(1.2, 2.4, 'Hello world'), Segment(4.0, 1.5, 'Fish & chips')]
+
+
+def test_parse_subtitles_dispatches_on_extension():
+    assert parse_subtitles(json.dumps(JSON3), 'json3')[0].text == 'Hello world'
+    assert parse_subtitles(SRV3, 'srv3')[0].text == 'Hello world'
+    assert parse_subtitles(SRT, 'srt')[0].text == 'First'
+    assert parse_subtitles(VTT, 'vtt')[0].text == 'Hello there\nsecond line'
+
+
+def test_parse_subtitles_returns_nothing_for_broken_srv3():
+    assert parse_subtitles('<timedtext><body><p t="0">unclosed', 'srv3') == []
+
+
+# YouTube's rolling auto-captions: each cue repeats the previous line before adding one,
+# with a short transition cue in between that repeats a line on its own
+ROLLING = [
+    Segment(0.0, 2.0, 'we are'),
+    Segment(2.0, 0.01, 'we are'),
+    Segment(2.01, 2.0, 'we are\ngoing to'),
+    Segment(4.01, 0.01, 'going to'),
+    Segment(4.02, 2.0, 'going to\nbake bread'),
+]
+
+
+def test_dedupe_rolling():
+    assert dedupe_rolling(ROLLING) == [
+        Segment(0.0, pytest.approx(2.01), 'we are'),
+        Segment(2.01, pytest.approx(2.01), 'going to'),
+        Segment(4.02, 2.0, 'bake bread'),
+    ]
+
+
+def test_dedupe_rolling_keeps_distinct_cues():
+    cues = [Segment(0.0, 1.0, 'one'), Segment(1.0, 1.0, 'two\nthree'), Segment(2.0, 1.0, 'four')]
+
+    assert dedupe_rolling(cues) == cues
+
+
+def test_parse_subtitles_only_dedupes_rolling_tracks():
+    vtt = render_vtt(ROLLING)
+
+    assert len(parse_subtitles(vtt, 'vtt')) == len(ROLLING)
+    assert render_text(parse_subtitles(vtt, 'vtt', rolling=True)) == 'we are\ngoing to\nbake bread'
+
+
+SEGMENTS = [Segment(0.0, 1.5, 'First'), Segment(3661.25, 2.0, 'Second\nline')]
+
+
+def test_render_srt():
+    assert render_srt(SEGMENTS) == ("1\n00:00:00,000 --> 00:00:01,500\nFirst\n\n"
+                                    "2\n01:01:01,250 --> 01:01:03,250\nSecond\nline\n")
+
+
+def test_render_vtt_round_trips():
+    rendered = render_vtt(SEGMENTS)
+
+    assert rendered.startswith('WEBVTT\n\n00:00:00.000 --> 00:00:01.500\nFirst\n')
+    assert parse_vtt(rendered) == SEGMENTS
+    assert parse_vtt(render_srt(SEGMENTS)) == SEGMENTS
+
+
+def test_json_renderer():
+    render, mimetype, extension = RENDERERS['json']
+
+    assert json.loads(render(SEGMENTS)) == segments_to_json(SEGMENTS) == [
+        {'start': 0.0, 'duration': 1.5, 'text': 'First'},
+        {'start': 3661.25, 'duration': 2.0, 'text': 'Second\nline'},
+    ]
+    assert (mimetype, extension) == ('application/json', 'json')
@@ -0,0 +1,195 @@
+import sqlite3
+
+import pytest
+
+from common.subtitles import Segment
+from common.transcript_store import TranscriptStore, fts5_available, to_match_query
+
+requires_fts5 = pytest.mark.skipif(not fts5_available(sqlite3.connect(':memory:')),
+                                   reason='SQLite built without FTS5')
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('hello world', '"hello" "world"'),
+    ('  spaced   out  ', '"spaced" "out"'),
+    ('transcri*', '"transcri"*'),
+    ('"exact phrase" word', '"exact phrase" "word"'),
+    ('"prefix phr"*', '"prefix phr"*'),
+    ('cats OR dogs', '"cats" "OR" "dogs"'),
+    ('NEAR(a b) -x col:y', '"NEAR(a" "b)" "-x" "col:y"'),
+    ('say"hi', '"say""hi"'),
+    ('', ''),
+    ('   ', ''),
+])
+def test_to_match_query(query, expected):
+    assert to_match_query(query) == expected
+
+
+def _open(path, index_max_bytes=64 * 1024 * 1024):
+    return TranscriptStore(path, max_bytes=64 * 1024 * 1024, ttl=3600, index_max_bytes=index_max_bytes)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return _open(tmp_path / 'transcripts.sqlite3')
+
+
+def _segments(*texts, step=5.0):
+    return [Segment(i * step, step, text) for i, text in enumerate(texts)]
+
+
+@requires_fts5
+def test_search_finds_segments_with_their_timing(store):
+    store.put('vid1', 'en', 'manual', 'Cooking', 'json3',
+              _segments('Welcome to the kitchen', 'Today we bake sourdough bread', 'Bread needs time'))
+    store.put('vid2', 'en', 'auto', 'Gardening', 'json3', _segments('Plant the seeds in spring'))
+
+    result = store.search('bread')
+
+    assert (result['total'], result['videos']) == (2, 1)
+    first = result['hits'][0]
+    assert first['video_id'] == 'vid1'
+    assert first['title'] == 'Cooking'
+    assert (first['lang'], first['kind']) == ('en', 'manual')
+    assert {(h['start_ms'], h['end_ms']) for h in result['hits']} == {(5000, 10000), (10000, 15000)}
+    assert all('<mark>' in h['snippet'] for h in result['hits'])
+    assert all(h['score'] > 0 for h in result['hits'])
+
+
+@requires_fts5
+def test_search_requires_every_term_and_supports_phrases_and_prefixes(store):
+    store.put('vid', 'en', 'manual', None, 'vtt',
+              _segments('sourdough bread recipe', 'bread and butter', 'a recipe for butter bread'))
+
+    assert store.search('bread recipe')['total'] == 2
+    assert store.search('"bread recipe"')['total'] == 1
+    assert store.search('sour*')['total'] == 1
+    assert store.search('sour')['total'] == 0
+
+
+@requires_fts5
+def test_search_takes_operators_literally(store):
+    store.put('vid', 'en', 'manual', None, 'vtt', _segments('this OR that', 'neither'))
+
+    assert store.search('OR')['total'] == 1
+    assert store.search('(this')['total'] == 1
+    assert store.search('NEAR(this that)')['total'] == 0 # A phrase search here, not FTS5's NEAR()
+    assert store.search('"unbalanced')['total'] == 0
+
+
+@requires_fts5
+def test_search_ignores_case_and_diacritics(store):
+    store.put('vid', 'fr', 'manual', None, 'vtt', _segments('Un café à Paris'))
+
+    assert store.search('CAFE')['total'] == 1
+    assert store.search('paris')['total'] == 1
+
+
+@requires_fts5
+def test_search_filters_by_language_and_video(store):
+    store.put('vid1', 'en-US', 'manual', None, 'vtt', _segments('hello there'))
+    store.put('vid1', 'de', 'auto', None, 'vtt', _segments('hello zusammen'))
+    store.put('vid2', 'en', 'auto', None, 'vtt', _segments('hello again'))
+
+    assert store.search('hello')['total'] == 3
+    assert {h['lang'] for h in store.search('hello', lang='en')['hits']} == {'en-US', 'en'}
+    assert store.search('hello', lang='de')['total'] == 1
+    assert {h['video_id'] for h in store.search('hello', video_id='vid1')['hits']} == {'vid1'}
+
+
+@requires_fts5
+def test_search_pages_through_hits(store):
+    store.put('vid', 'en', 'auto', None, 'vtt', _segments(*(f'word number {i}' for i in range(7))))
+
+    pages = [store.search('word', limit=3, offset=offset)['hits'] for offset in (0, 3, 6)]
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert len({h['start_ms'] for page in pages for h in page}) == 7
+    assert store.search('word', limit=3)['total'] == 7
+
+
+@requires_fts5
+def test_storing_a_transcript_again_replaces_its_index_entries(store):
+    store.put('vid', 'en', 'manual', 'Old title', 'vtt', _segments('original wording', 'more original'))
+    store.put('other', 'en', 'manual', None, 'vtt', _segments('original elsewhere'))
+    store.put('vid', 'en', 'manual', 'New title', 'vtt', _segments('revised wording'))
+
+    assert {h['video_id'] for h in store.search('original')['hits']} == {'other'}
+    revised = store.search('revised')['hits']
+    assert [(h['video_id'], h['title']) for h in revised] == [('vid', 'New title')]
+    assert store.search('wording')['total'] == 1
+
+
+@requires_fts5
+def test_transcripts_stored_before_indexing_are_indexed_on_startup(store, tmp_path):
+    store.put('vid', 'en', 'manual', 'Backfilled', 'vtt', _segments('indexed later'))
+    conn = store._connect()
+    conn.execute("DELETE FROM segments_fts")
+    conn.execute("DELETE FROM indexed")
+    conn.execute("DELETE FROM counters WHERE name = 'index_backfilled'") # As in a database from before the index
+    assert store.search('indexed')['total'] == 0
+
+    reopened = _open(tmp_path / 'transcripts.sqlite3')
+
+    hits = reopened.search('indexed')['hits']
+    assert [(h['video_id'], h['title']) for h in hits] == [('vid', 'Backfilled')]
+    assert reopened.stats()['indexed_transcripts'] == 1
+
+
+@requires_fts5
+def test_index_keeps_within_its_limit_by_dropping_least_recently_used(tmp_path):
+    store = _open(tmp_path / 'transcripts.sqlite3', index_max_bytes=60)
+    store.put('old', 'en', 'manual', None, 'vtt', _segments('alpha ' * 4)) # 24 bytes each
+    store.put('used', 'en', 'manual', None, 'vtt', _segments('bravo ' * 4))
+    store.get('used', 'en')
+    store.put('new', 'en', 'manual', None, 'vtt', _segments('charlie ' * 3))
+
+    assert store.search('alpha')['total'] == 0
+    assert store.search('bravo')['total'] == 1
+    assert store.search('charlie')['total'] == 1
+    assert store.stats()['index_bytes'] <= 60
+    # Still cached, just no longer searchable
+    assert store.get('old', 'en') is not None
+
+
+@requires_fts5
+def test_search_hits_count_as_use(tmp_path):
+    store = _open(tmp_path / 'transcripts.sqlite3', index_max_bytes=60)
+    store.put('found', 'en', 'manual', None, 'vtt', _segments('alpha ' * 4))
+    store.put('ignored', 'en', 'manual', None, 'vtt', _segments('bravo ' * 4))
+    store.search('alpha')
+    store.put('new', 'en', 'manual', None, 'vtt', _segments('charlie ' * 3))
+
+    assert store.search('alpha')['total'] == 1
+    assert store.search('bravo')['total'] == 0
+
+
+@requires_fts5
+def test_transcripts_evicted_from_the_index_stay_out_after_restart(tmp_path):
+    store = _open(tmp_path / 'transcripts.sqlite3', index_max_bytes=30)
+    store.put('old', 'en', 'manual', None, 'vtt', _segments('alpha ' * 4))
+    store.put('new', 'en', 'manual', None, 'vtt', _segments('bravo ' * 4))
+
+    reopened = _open(tmp_path / 'transcripts.sqlite3', index_max_bytes=30)
+
+    assert reopened.search('alpha')['total'] == 0
+    assert reopened.stats()['indexed_transcripts'] == 1
+
+
+@requires_fts5
+def test_indexes_without_sizes_are_migrated(tmp_path):
+    path = tmp_path / 'transcripts.sqlite3'
+    store = _open(path)
+    store.put('vid', 'en', 'manual', None, 'vtt', _segments('héllo wörld'))
+    conn = store._connect()
+    conn.execute("ALTER TABLE indexed DROP COLUMN size")
+    conn.execute("ALTER TABLE indexed DROP COLUMN last_access")
+
+    reopened = _open(path)
+
+    assert reopened.stats()['index_bytes'] == len('héllo wörld'.encode('utf-8'))
+    assert reopened.search('hello')['total'] == 1
+
+
+def test_empty_query_matches_nothing(store):
+    assert store.search('   ') == {'query': '   ', 'total': 0, 'videos': 0, 'hits': []}